@@ -1,4 +1,3 @@
-import csv
 import datetime
 import ast
 import json
@@ -6,6 +5,9 @@ import pandas as pd
 from typing import List, Dict
 import io
 
+from app.recipe_assets import get_recipe_assets
+from app.recipe_catalog import get_recipe_catalog
+
 
 def post_process_results(recipe_df, optimized_results, min_date, days):
     """
@@ -25,6 +27,10 @@ def post_process_results(recipe_df, optimized_results, min_date, days):
     
     response = {}
     response['constraints_loosened'] = optimized_results["constraints_loosened"]
+    # Cached results from before solver_path was added were all found by the solver
+    response['solver_path'] = optimized_results.get("solver_path", "solver")
+    # Nutrients the greedy heuristic did not consider, their targets may be missed
+    response['unchecked_nutrients'] = optimized_results.get("unchecked_nutrients", [])
     response['tableData'] = create_table_data(optimized_results)
     
     #print("\n\n RECIPES:\n\n", optimized_results['recipes'])
@@ -32,12 +38,16 @@ def post_process_results(recipe_df, optimized_results, min_date, days):
     #print("\n\nEXTRACTED RECIPES:\n\n", recipes)
     processed_recipe = process_recipes(recipe_df, recipes)
     #print("\n\nprocessed Recipe:\n\n", processed_recipe)
-    recipes_balanced_by_day = sort_by_tags(processed_recipe, days)
+    recipes_balanced_by_day, unfilled_meals = sort_by_tags(processed_recipe, days)
     #print("\n\nSORTED BY TAGS:\n\n", recipes_balanced_by_day)
     days = create_days_array(recipes_balanced_by_day, min_date, days)
     #print("\n\nDAYS ARRAY:\n\n", days)
     
     response["days"] = days
+    # Meals of a day that are left without a recipe
+    response["unfilled_meals"] = [{"date": days[day]["date"], "meal_name": meal_name}
+                                  for day, meal_name in unfilled_meals]
+    response["swap_alternates"] = optimized_results.get("swap_alternates", {})
     
     return response
 
@@ -94,6 +104,9 @@ def sort_by_tags(processed_recipe, days):
     - 3 breakfasts if 9 recipes per day
     - 2 breakfasts if 8 recipes per day
     - 1 breakfasts if 7 recipes per day
+
+    Returns the list of the recipes of every day, and a list of (day index,
+    meal name) of the recipes no recipe of the meal plan could fill.
     """
     num_days = days
     recipes_per_day = int(len(processed_recipe)/num_days)
@@ -121,8 +134,7 @@ def sort_by_tags(processed_recipe, days):
     
     for meal_dict in processed_recipe:
         # Clean up each item by removing brackets, outer quotes, spaces
-        meal_slots_str = meal_dict['meal_slot'].strip('"[]').split(',')
-        meal_slots = [slot.strip().strip("'") for slot in meal_slots_str]
+        meal_slots = parse_meal_slots(meal_dict)
     
         if len(meal_slots) == 1:
             single_slot_items.append((meal_dict, meal_slots))
@@ -197,30 +209,56 @@ def sort_by_tags(processed_recipe, days):
             meal_dict["meal_name"] = "Snack"
             snack_recipes.append(meal_dict)
 
+    breakfasts_per_day = {9: 3, 8: 2, 7: 1}.get(recipes_per_day, 0)
+
     result_groups = []
+    # (day, position in the day, meal name, meal slot) of every missing recipe
+    shortages = []
     for i in range(int(num_days)):
         current_group = []
-        if recipes_per_day == 9:
-        # Add 3 breakfasts
-            current_group.extend(breakfast_recipes[i*3:i*3+3])
-        elif recipes_per_day == 8:
-            current_group.extend(breakfast_recipes[i*2:i*2+2])
-        elif recipes_per_day == 7:
-            current_group.extend(breakfast_recipes[i*1:i*1+1])
-        # Add first snack
-        current_group.append(snack_recipes[i*2])
-        # Add lunch
-        current_group.append(lunch_recipes[i])
-        # Add second snack
-        current_group.append(snack_recipes[i*2+1])
-        # Add main (dinner)
-        current_group.append(main_recipes[i])
-        # Add 2 sides
-        current_group.extend(side_recipes[i*2:i*2+2])
+        # Breakfasts, first snack, lunch, second snack, main (dinner) and 2 sides
+        day_layout = [
+            ("Breakfast", "breakfast", breakfast_recipes[i*breakfasts_per_day:(i+1)*breakfasts_per_day], breakfasts_per_day),
+            ("Snack", "snack", snack_recipes[i*2:i*2+1], 1),
+            ("Lunch", "lunch", lunch_recipes[i:i+1], 1),
+            ("Snack", "snack", snack_recipes[i*2+1:i*2+2], 1),
+            ("Main", "main", main_recipes[i:i+1], 1),
+            ("Side", "side", side_recipes[i*2:i*2+2], 2),
+        ]
+        for meal_name, meal_slot, recipes, count in day_layout:
+            current_group.extend(recipes)
+            # None holds the place of a missing recipe until it is filled below
+            for _ in range(count - len(recipes)):
+                shortages.append((i, len(current_group), meal_name, meal_slot))
+                current_group.append(None)
         # Adds current_group (a singular day) to the list of days ("days" don't exist yet - added in create_days_aray)
         result_groups.append(current_group)
 
-    return result_groups
+    # The optimizer counts a recipe of several meal slots towards each of them, so a slot can run short
+    # of recipes here. It is filled with a recipe of that slot that no day got, or reported as unfilled.
+    placed = {id(recipe) for group in result_groups for recipe in group if recipe is not None}
+    spare_recipes = [recipe for recipe in processed_recipe if id(recipe) not in placed]
+    unfilled_meals = []
+    for day, position, meal_name, meal_slot in shortages:
+        recipe = next((recipe for recipe in spare_recipes if meal_slot in parse_meal_slots(recipe)), None)
+        if recipe is None:
+            print(f"No recipe of the meal plan fills the {meal_name} of day {day + 1}")
+            unfilled_meals.append((day, meal_name))
+            continue
+        spare_recipes.remove(recipe)
+        recipe["meal_name"] = meal_name
+        result_groups[day][position] = recipe
+
+    result_groups = [[recipe for recipe in group if recipe is not None] for group in result_groups]
+    return result_groups, unfilled_meals
+
+
+def parse_meal_slots(meal_dict):
+    """
+    Returns the list of meal slots of a processed recipe.
+    """
+    meal_slots_str = meal_dict['meal_slot'].strip('"[]').split(',')
+    return [slot.strip().strip("'") for slot in meal_slots_str]
 
 
 def create_days_array(recipes_balanced_by_day, min_date, days):
@@ -265,55 +303,10 @@ def process_recipe(recipe_df, recipe_name):
     @author: BCIT May 2025
     """
     recipe_row = recipe_df.loc[recipe_df['title'] == recipe_name]
-    res = {}
-    recipe_dict = {}
-    recipe_dict['carbohydrates'] = recipe_row['carbohydrates_g'].values[0]
-    recipe_dict['country'] = recipe_row['country'].values[0]
-    recipe_dict['fat'] = recipe_row['fats_total_g'].values[0]
-    recipe_dict['price'] = "N/A"
-    recipe_dict['protein'] = recipe_row['protein_g'].values[0]
-    recipe_dict['region'] = recipe_row['region'].values[0]
-    recipe_dict['title'] = recipe_row['title'].values[0]
-    recipe_dict['ingredients'] = recipe_row['ingredients'].values[0]
-    recipe_dict['calories'] = recipe_row['energy_kcal'].values[0]
-    recipe_dict['meal_slot'] = recipe_row['meal_slot'].values[0]
-    recipe_dict['id'] = recipe_row['number'].values[0]
-    recipe_dict['cook_time'] = recipe_row['cooktime'].values[0]
-    recipe_dict['prep_time'] = recipe_row['preptime'].values[0]
-    recipe_dict['sub_region'] = recipe_row['subregion'].values[0]
-
-    # retrive instructions
-
-    instruction_file_path = f'''./meal_db/instructions/instructions_{
-        recipe_dict['id']}.csv'''
-    ingredient_file_path = f"./meal_db/ingredients/{recipe_dict['id']}.csv"
-
-    # instruction_content = pd.read_csv(instruction_file_path)
-    # recipe_dict['instructions'] = instruction_content.values.tolist()
-
-    with open(instruction_file_path, newline='', encoding='utf-8', errors='replace') as csvfile:
-        content = csv.reader(csvfile)
-        recipe_dict['instructions'] = []
-        for row in content:
-            recipe_dict['instructions'].append(row)
-
-    # retrive ingredients_with_quantities
-
-    # cannot use pandas here, will raise an error
-
-    with open(ingredient_file_path, newline='') as csvfile:
-        content = csv.reader(csvfile)
-        recipe_dict['ingredients_with_quantities'] = []
-        for row in content:
-            recipe_dict['ingredients_with_quantities'].append(row)
-
-    for key, value in recipe_dict.items():
-        res[key] = f"{value}"
-
-    # Convert ingredients from a string to a list
-    res['ingredients'] = ast.literal_eval(res['ingredients'])
-    res['instructions'] = ast.literal_eval(res['instructions'])
-    res['ingredients_with_quantities'] = ast.literal_eval(
-        res['ingredients_with_quantities'])
-
-    return res
\ No newline at end of file
+    view = get_recipe_catalog().recipe_view(recipe_row['number'].values[0])
+
+    # retrive instructions and ingredients_with_quantities
+
+    instructions, ingredients_with_quantities = get_recipe_assets(view.id)
+
+    return view.to_dict(instructions, ingredients_with_quantities)
\ No newline at end of file
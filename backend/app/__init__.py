@@ -1,21 +1,31 @@
+import multiprocessing
+
 from flask import Flask, jsonify
-from flask_apscheduler import APScheduler
 from flask_cors import CORS
-from user_db.user_db import DatabaseManager
-from user_db.initiate_db import DatabaseSchemaManager
 
 
 
 app = Flask(__name__)
 
-scheduler = APScheduler()
-scheduler.init_app(app)
-scheduler.start()
+# The workers of the solver pool import this package to generate meal plans
+# only, they start no scheduler, database connection or routes of their own
+if multiprocessing.parent_process() is None:
+    from flask_apscheduler import APScheduler
+    from user_db.user_db import DatabaseManager
+    from user_db.initiate_db import DatabaseSchemaManager
+
+    scheduler = APScheduler()
+    scheduler.init_app(app)
+    scheduler.start()
+
+    db = DatabaseManager.connect_to_database()
+    schema_manager = DatabaseSchemaManager(db)
+    schema_manager.create_all_tables()
+    schema_manager.populate_dictionary_tables()
 
-db = DatabaseManager.connect_to_database()
-schema_manager = DatabaseSchemaManager(db)
-schema_manager.create_all_tables()
-schema_manager.populate_dictionary_tables()
+    CORS(app)
+    from app import routes
 
-CORS(app)
-from app import routes
+    # Read the instructions and ingredients of every recipe before the first request
+    from app.recipe_assets import preload_recipe_assets
+    preload_recipe_assets()
@@ -1,7 +1,9 @@
 import pandas as pd
+from app.preference_scoring import PreferenceScorer
 
 
-def apply_user_prefs(fav_cuisines, diet_contraint, religious_constraint, liked_foods, disliked_foods, allergies, recipes):
+def apply_user_prefs(fav_cuisines, diet_contraint, religious_constraint, liked_foods, disliked_foods, allergies, recipes,
+                     scorer=None):
     """
     Called in ./backend/app/generate_meal_plan.py.
     Applies the user preferences to the meal database and calculates a score for each recipe.
@@ -11,6 +13,9 @@ def apply_user_prefs(fav_cuisines, diet_contraint, religious_constraint, liked_f
     :param liked_foods: string list of liked foods
     :param disliked_foods: string list of disliked foods
     :param allergies: string list of allergies
+    :param recipes: dataframe of recipes, a score and a restricted column are added to it
+    :param scorer: PreferenceScorer built for the rows of recipes, e.g. the one
+    cached on the recipe catalog. One is built on the fly if it is not given.
     :return: dataframe of recipes with scores
     """
     # recipes = pd.read_csv('./meal_db/meal_database.csv')
@@ -22,17 +27,37 @@ def apply_user_prefs(fav_cuisines, diet_contraint, religious_constraint, liked_f
     liked_foods = [food.lower() for food in liked_foods]
     disliked_foods = [food.lower() for food in disliked_foods]
 
-    # Skip the first row as it is the column names
-    recipes['score'] = recipes.apply(
-        lambda row: calculate_scores(row, fav_cuisines, diet_restrictions, religious_restrictions, liked_foods, disliked_foods,
-                                     restrictions_for_allergies),
-        axis=1)
+    if scorer is None or not scorer.matches(recipes):
+        scorer = PreferenceScorer(recipes)
+
+    # Same result as applying calculate_scores to every row
+    recipes['score'] = scorer.score(fav_cuisines, diet_restrictions, religious_restrictions, liked_foods,
+                                    disliked_foods, restrictions_for_allergies)
+    # Recipes scored 0 because of a restriction, these are removed before the meal plan is optimized
+    recipes['restricted'] = scorer.restricted(diet_restrictions, religious_restrictions,
+                                              restrictions_for_allergies)
     # print("-----------returned recipes before removing 0 fit-to-preference score\n", recipes)
     # recipes = recipes[recipes['score'] > 0]
 
     return recipes
 
 
+def get_restricted_recipes(diet_contraint, religious_constraint, allergies, scorer):
+    """
+    Returns which recipes a user cannot eat, the recipes that apply_user_prefs
+    scores 0 because of a restriction.
+    :param diet_constraint: string of dietary constraint
+    :param religious_constraint: string of religious constraint
+    :param allergies: string list of allergies
+    :param scorer: PreferenceScorer of the recipes, e.g. the one cached on the
+    recipe catalog
+    :return: numpy boolean array aligned with the rows of the scorer's recipes
+    """
+    return scorer.restricted(get_diet_restrictions(diet_contraint),
+                             get_religious_restrictions(religious_constraint),
+                             get_restrictions_for_allergies(allergies))
+
+
 def calculate_scores(row, fav_cuisines, diet_restrictions, religious_restrictions, liked_foods, disliked_foods,
                      restrictions_for_allergies):
     """
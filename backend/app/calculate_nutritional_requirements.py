@@ -1,3 +1,6 @@
+import threading
+
+import numpy as np
 import pandas as pd
 
 from app.calculate_energy import energy_calculator_function
@@ -55,40 +58,7 @@ def calculate_micros(people):
     :param people: list of people objects
     :return: dict of summed up micronutrient requirements
     """
-    micros_info = read_micro_nutrients_file()
-    micros_people = []
-    micros = {}
-
-    for person in people:
-        age_days = person['age'] * 365
-        micros_person = {}
-
-        # Get row index in the DietUSDA.xlsx file
-        # Skip the first two rows as they are for infants
-        for i in range(2, 15):
-            if micros_info['age_days_lower'][i] <= age_days <= micros_info['age_days_upper'][i] and person['gender'].lower() == micros_info['gender'][i]:
-                row_index = i
-                break
-
-        # Exclude the non micro-nutrient keys
-        micros_keys = list(micros_info.keys())[3:]
-
-        for i, key in enumerate(micros_keys):
-            micros_person[key] = micros_info[key][row_index]
-
-        micros_people.append(micros_person)
-
-    max_int = (2 ** 31) - 1 # Max int value in Java
-
-    # Sum up the micronutrients for each person
-    for key in micros_keys:
-        # If a key value is ND, make it the max int value in Java
-        if micros_people[0][key] == 'ND':
-            micros[key] = max_int
-        else:
-            micros[key] = sum(float(micros_person[key]) for micros_person in micros_people)
-
-    return micros
+    return get_micro_nutrient_table().household_micros(people)
 
 def read_micro_nutrients_file():
     """
@@ -113,6 +83,94 @@ def read_micro_nutrients_file():
     return pd.read_csv('./nutri_requirements/DietUSDA.csv', usecols = columns, nrows = 16).to_dict()
 
 
+class MicroNutrientTable:
+    """
+    The DietUSDA.xlsx micronutrient requirements as a numpy array with a row per
+    gender and age band, read once per worker by get_micro_nutrient_table.
+    Requirements that are not determined (ND) are kept in a separate mask.
+    """
+
+    # Max int value in Java, the requirement of a nutrient that is not determined
+    MAX_INT = (2 ** 31) - 1
+    # The first two rows are for infants
+    FIRST_ROW = 2
+    LAST_ROW = 14
+
+    def __init__(self, micros_info):
+        """
+        :param micros_info: dict returned by read_micro_nutrients_file
+        """
+        rows = range(self.FIRST_ROW, self.LAST_ROW + 1)
+        self.genders = np.array([micros_info['gender'][i] for i in rows], dtype=object)
+        self.age_days_lower = np.array([micros_info['age_days_lower'][i] for i in rows], dtype=np.float64)
+        self.age_days_upper = np.array([micros_info['age_days_upper'][i] for i in rows], dtype=np.float64)
+
+        # Exclude the non micro-nutrient keys
+        self.keys = list(micros_info.keys())[3:]
+        self.not_determined = np.array(
+            [[micros_info[key][i] == 'ND' for key in self.keys] for i in rows], dtype=bool)
+        self.values = np.array(
+            [[np.nan if micros_info[key][i] == 'ND' else float(micros_info[key][i]) for key in self.keys]
+             for i in rows], dtype=np.float64)
+
+    def row(self, person):
+        """
+        Returns the row of the age band and gender of a person.
+        :param person: person object
+        :return: int row of values, None if no row matches
+        """
+        age_days = person['age'] * 365
+        matches = np.flatnonzero((self.age_days_lower <= age_days) & (age_days <= self.age_days_upper)
+                                 & (self.genders == person['gender'].lower()))
+        return int(matches[0]) if len(matches) else None
+
+    def household_micros(self, people):
+        """
+        Sums up the micronutrient requirements of a group of people. A nutrient that
+        is not determined for the first person is set to MAX_INT.
+        :param people: list of people objects
+        :return: dict of summed up micronutrient requirements
+        """
+        rows = []
+        for person in people:
+            row = self.row(person)
+            if row is None:
+                # As before, a person without a matching row counts with the row of the person before
+                if not rows:
+                    raise ValueError(
+                        f"No micronutrient requirements for a {person['gender']} of age {person['age']}")
+                row = rows[-1]
+            rows.append(row)
+
+        not_determined = self.not_determined[rows]
+        if (not_determined[1:] & ~not_determined[0]).any():
+            raise ValueError("Micronutrient requirement is not determined for every person")
+
+        # Summed person by person like the sum over the people before
+        totals = self.values[rows].sum(axis=0).tolist()
+        return {key: self.MAX_INT if not_determined[0, column] else totals[column]
+                for column, key in enumerate(self.keys)}
+
+
+_micro_nutrient_table = None
+_micro_nutrient_table_lock = threading.Lock()
+
+
+def get_micro_nutrient_table():
+    """
+    Returns the micronutrient requirements table of this worker, reading
+    DietUSDA.csv on first use.
+
+    :return: MicroNutrientTable
+    """
+    global _micro_nutrient_table
+    if _micro_nutrient_table is None:
+        with _micro_nutrient_table_lock:
+            if _micro_nutrient_table is None:
+                _micro_nutrient_table = MicroNutrientTable(read_micro_nutrients_file())
+    return _micro_nutrient_table
+
+
 #2024 NEW FUNCTION
 def distribute_nutrients(macros, micros):
     """
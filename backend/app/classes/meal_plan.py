@@ -10,6 +10,7 @@ from app.retrieve_diet import get_diet_plan
 import datetime
 import pandas as pd
 from app.apply_user_prefs_to_meal_database import apply_user_prefs
+from app.recipe_catalog import get_recipe_catalog
 
 
 class MealPlan:
@@ -107,7 +108,7 @@ class MealPlan:
             self.data["likedFoods"],
             self.data["dislikedFoods"],
             self.data["allergies"],
-            pd.read_csv("./meal_db/meal_database.csv"),
+            get_recipe_catalog().copy_recipes(),
         )
 
         df = pd.read_csv("./meal_db/new_meal_database.csv")
@@ -1,34 +1,45 @@
+import numpy as np
 import pandas as pd
-import ast
-import time
-from app.generate_meal_plan import gen_shopping_list, insert_status_nutrient_info
+from app.apply_user_prefs_to_meal_database import get_restricted_recipes
+from app.generate_meal_plan import insert_nutrient_status, is_within_target, update_shopping_list
 from app.post_process import process_recipe
+from app.recipe_catalog import OPTIMIZER_MEAL_SLOTS, get_recipe_catalog
+from app.replacement_index import MEAL_NAME_SLOTS, get_replacement_index
 
 
-def find_matched_recipe_and_update(response, recipe_id):
+def find_matched_recipe_and_update(response, recipe_id, preferences=None):
     """
     Called in ./backend/app/routes.py.
     Find the recipe in the response and update the recipe's status to 'matched'.
     :param response: JSON object containing the meal plan
     :param recipe_id: string of the recipe ID
+    :param preferences: optional dict with the dietaryConstraint,
+    religiousConstraint and allergies of the user, recipes they cannot eat are
+    not used as replacement
     :return: updated JSON object containing the meal plan
     """
     clicked_recipe = {}
     date_counter = 0
     recipe_counter = 0
 
-    # Load the recipes pool from the CSV file
-    recipe_df = pd.read_csv("./meal_db/meal_database.csv")
-    all_recipes_df = pd.read_csv("./meal_db/meal_database.csv")
-    snack_recipes_df = all_recipes_df[all_recipes_df["meal_slot"]
-                                      == "['snack']"]
+    # Load the recipes pool from the shared catalog
+    catalog = get_recipe_catalog()
+    snack_recipes_df = catalog.snack_recipes
     #print("snack recipes:",snack_recipes_df[['subregion', 'title']])
-   
+
+    allowed = None
+    if preferences:
+        allowed = ~get_restricted_recipes(preferences.get("dietaryConstraint", "none"),
+                                          preferences.get("religiousConstraint", "none"),
+                                          preferences.get("allergies", []),
+                                          catalog.preference_scorer)
 
     # Traverse the response to find and remove the clicked recipe
     for day in response["days"]:
         for i, recipe in enumerate(day["recipes"]):
-            if recipe["id"] == recipe_id:
+            # Ids are strings in meal plans created before recipes were
+            # serialized with native types
+            if str(recipe["id"]) == str(recipe_id):
                 clicked_recipe = day["recipes"].pop(i)
                 recipe_counter = i
                 break
@@ -43,20 +54,18 @@ def find_matched_recipe_and_update(response, recipe_id):
     # Ensure 'id' is an integer
     clicked_recipe["id"] = int(clicked_recipe["id"])
 
-    # Call find_matched_recipe with the clicked_recipe
-    recipe_to_replace = find_matched_recipe(
-        clicked_recipe, recipe_df, snack_recipes_df)
+    # Alternates computed with the meal plan keep it within its constraints,
+    # other recipes are only matched if none of them fits any more
+    recipe_to_replace = find_swap_alternate(response, clicked_recipe, allowed)
+    if recipe_to_replace is None:
+        recipe_to_replace = find_matched_recipe(
+            clicked_recipe, snack_recipes_df, allowed)
 
     # Ensure that a matched recipe is found before proceeding
     if recipe_to_replace:
         recipe_to_replace["meal_name"] = clicked_recipe["meal_name"]
         
         print("\n\nRECIPE TO REPLACE\n\n: ",recipe_to_replace)
-        #if recipe_to_replace["meal_name"] == 'Snack':
-        # changed list within string to just list (so frontend can read instructions and ingredients)
-        recipe_to_replace['instructions'] = ast.literal_eval(recipe_to_replace['instructions'])
-        recipe_to_replace['ingredients_with_quantities'] = ast.literal_eval(recipe_to_replace['ingredients_with_quantities'])
-        recipe_to_replace['ingredients'] = ast.literal_eval(recipe_to_replace['ingredients'])
 
         # Update the recipe at the same position
         response["days"][date_counter]["recipes"].insert(
@@ -66,15 +75,11 @@ def find_matched_recipe_and_update(response, recipe_id):
         # Update nutrition values and other related data
 
         response = update_nutrition_values(
-            response, clicked_recipe, "subtract", recipe_df, snack_recipes_df
+            response, removed=[clicked_recipe], added=[recipe_to_replace]
         )
-        response = update_nutrition_values(
-            response, recipe_to_replace, "add", recipe_df, snack_recipes_df
+        response = update_shopping_list(
+            response, removed=[clicked_recipe], added=[recipe_to_replace]
         )
-        time.sleep(0.1)
-        response = gen_shopping_list(response)
-        response = insert_status_nutrient_info(response)
-        time.sleep(0.1)
 
         output_data = {"meal_plan": response,
                        "id_to_replace": recipe_to_replace["id"]}
@@ -84,16 +89,10 @@ def find_matched_recipe_and_update(response, recipe_id):
 
 def find_matched_recipe_and_delete(response, recipe_id):
     print("Received recipe_id:", recipe_id)
-    print("Current response['days'] structure:", response["days"])
     clicked_recipe = {}
     date_counter = 0
     recipe_counter = 0
 
-    recipe_df = pd.read_csv("./meal_db/meal_database.csv")
-    all_recipes_df = pd.read_csv("./meal_db/meal_database.csv")
-    snack_recipes_df = all_recipes_df[all_recipes_df["meal_slot"]
-                                      == "['snack']"]
-
     recipe_id = str(recipe_id)
     for day in response["days"]:
         for i, recipe in enumerate(day["recipes"]):
@@ -111,29 +110,105 @@ def find_matched_recipe_and_delete(response, recipe_id):
 
     clicked_recipe["id"] = int(clicked_recipe["id"])
 
-    response = update_nutrition_values(
-        response, clicked_recipe, "subtract", recipe_df, snack_recipes_df
-    )
+    response = update_nutrition_values(response, removed=[clicked_recipe])
 
-    print("Response after update_nutrition_values:", response)
+    output_data = {"meal_plan": response}
 
-    time.sleep(0.1)
-    response = insert_status_nutrient_info(response)
-    print("Response after insert_status_nutrient_info:", response)
-    time.sleep(0.1)
+    return output_data
 
-    output_data = {"meal_plan": response}
+def meal_name_slot(recipe):
+    """
+    Returns the meal slot of the meal_name post processing gave a recipe, None
+    if it is not one of the meal slots.
+    """
+    # Post processing names some lunches "Lunch " with a trailing space
+    return MEAL_NAME_SLOTS.get(str(recipe.get("meal_name", "")).strip())
 
-    print("Final output_data before returning:", output_data)
 
-    return output_data
+def find_swap_alternate(response, recipe, allowed=None):
+    """
+    Returns the first of the swap alternates stored with the meal plan for a
+    recipe that fills the same meal slot and keeps every nutrient of
+    response['tableData'] that is within its target within it, in the format
+    expected by the frontend. The meal slot is the one of the recipe's
+    meal_name, or any slot of the recipe if the meal_name is not a slot. The
+    alternates were computed for the plan as it was generated, so they are
+    checked again against the current totals. The replaced recipe becomes an
+    alternate of its replacement.
+
+    :param response: JSON object containing the meal plan, without the recipe
+    :param recipe: dict containing the information of the replaced recipe
+    :param allowed: numpy boolean array aligned with the catalog rows, only recipes that
+    are True can be the replacement, None to allow every recipe
+    :return: dict of the replacement, None if no alternate fits
+    """
+    swap_alternates = response.get("swap_alternates")
+    if not swap_alternates:
+        return None
+
+    catalog = get_recipe_catalog()
+    slot = meal_name_slot(recipe)
+    if slot is not None:
+        slots = [slot]
+    else:
+        recipe_position = catalog.position(recipe["id"])
+        slots = [] if recipe_position is None else [
+            slot for slot in OPTIMIZER_MEAL_SLOTS if catalog.slot_masks[slot][recipe_position]]
+
+    stored = swap_alternates.get(str(recipe["id"]), {})
+    if isinstance(stored, dict):
+        alternates = [alternate for slot in slots for alternate in stored.get(slot, [])]
+    else:
+        # Meal plans generated before the alternates were kept per meal slot
+        alternates = stored
+
+    # Nutrients out of their target were loosened when the plan was solved, the
+    # alternates only keep them within the loosened bounds
+    columns = []
+    targets = []
+    actual = []
+    for item in response["tableData"]:
+        column = catalog.table_nutrient_index.get(item["nutrientName"].lower())
+        if column is not None and is_within_target(item["actual"], item["target"]):
+            columns.append(column)
+            targets.append(item["target"])
+            actual.append(item["actual"])
+    actual = np.array(actual, dtype=np.float64)
+    # Rounded like update_nutrition_values does
+    actual = np.maximum(np.round(actual - recipe_table_nutrients(catalog, recipe)[columns]), 0)
+
+    for alternate in alternates:
+        position = catalog.position(alternate)
+        if position is None or (allowed is not None and not allowed[position]):
+            continue
+        if not any(catalog.slot_masks[slot][position] for slot in slots):
+            continue
+        swapped = np.round(actual + catalog.table_nutrient_matrix[position][columns])
+        if all(is_within_target(int(value), target) for value, target in zip(swapped.tolist(), targets)):
+            break
+    else:
+        return None
+
+    matched_recipe_df = catalog.recipes.iloc[position:position + 1]
+    matched_recipe = process_recipe(matched_recipe_df, matched_recipe_df['title'].values[0])
+    replacement_alternates = swap_alternates.setdefault(str(alternate), {})
+    if slot is not None and isinstance(replacement_alternates, dict):
+        replacement_alternates.setdefault(slot, [recipe["id"]] + [
+            other for other in alternates if other != alternate])
+    print("Swap alternate found is", matched_recipe["id"])
+    return matched_recipe
+
 
-def find_matched_recipe(recipe, recipe_df, snack_df):
+def find_matched_recipe(recipe, snack_df, allowed=None):
     """
-    Finds a recipe in the recipes_pool with calories number closest to the original one,
-    and returns it in the format expected by the frontend.
+    Finds a replacement for a recipe and returns it in the format expected by the frontend.
+    Snacks are replaced by a random snack. Other recipes are replaced by the recipe of the
+    same meal slot that is closest in calories and macros.
 
     :param recipe: Dictionary with recipe details including the 'id' key
+    :param snack_df: dataframe of the snack recipes of the catalog
+    :param allowed: numpy boolean array aligned with the catalog rows, only recipes that
+    are True can be the replacement, None to allow every recipe
     :return: Dictionary with matched recipe details in the expected format
     """
     print("find_matched_recipe called with recipe:", recipe)
@@ -160,6 +235,12 @@ def find_matched_recipe(recipe, recipe_df, snack_df):
 
         # Filter out the rows where the number equals the original recipe's number
         filtered_recipe_df = snack_df[snack_df["number"] != recipe_id]
+        if allowed is not None:
+            # The index of snack_df holds the catalog row positions
+            filtered_recipe_df = filtered_recipe_df[allowed[filtered_recipe_df.index]]
+        if filtered_recipe_df.empty:
+            print("No replacement found for recipe:", recipe["id"])
+            return None
 
         # Find the row with the minimum calories difference from the remaining rows
         matched_recipe_row = filtered_recipe_df.sample(n=1).iloc[0]
@@ -173,41 +254,28 @@ def find_matched_recipe(recipe, recipe_df, snack_df):
         # Now call process_recipe with single row DataFrame and recipe name
         matched_recipe = process_recipe(matched_recipe_df, recipe_name)
         
-        # Had issue where lists would be turned into strings (f'') in process_recipe
-        # fixed in find_matched_recipe_and_update method
-
-        for key, value in matched_recipe.items():
-            matched_recipe[key] = f"{value}"
-        
         #print('MATCHED RECIEPE',matched_recipe)
     else:
-        # Find the calories of the original recipe
-        original_recipe_row = recipe_df.loc[recipe_df["number"] == recipe_id]
-        print("Original Recipe Row:\n", original_recipe_row)
+        catalog = get_recipe_catalog()
+        position = catalog.position(recipe_id)
 
-        if original_recipe_row.empty:
+        if position is None:
             print("No recipe found with the given id:", recipe["id"])
             return None  # Handle the case where the recipe is not found
 
-        original_calories = original_recipe_row["energy_kcal"].values[0]
-        print("Original calories:", original_calories)
+        print("Original calories:", catalog.recipes["energy_kcal"].iat[position])
 
-        # Calculate the absolute difference between the original recipe's calories and each recipe's calories
-        recipe_df["calories_diff"] = (
-            recipe_df["energy_kcal"] - original_calories
-        ).abs()
+        # Closest recipe in calories and macros that fills the same meal slot
+        matched_position = get_replacement_index().replacement(
+            position, slot=meal_name_slot(recipe), allowed=allowed)
 
-        # Filter out the rows where the number equals the original recipe's number
-        filtered_recipe_df = recipe_df[recipe_df["number"] != recipe_id]
+        if matched_position is None:
+            print("No replacement found for recipe:", recipe["id"])
+            return None
 
-        # Find the row with the minimum calories difference from the remaining rows
-        matched_recipe_row = filtered_recipe_df.loc[
-            filtered_recipe_df["calories_diff"].idxmin()
-        ]
-        
-        matched_recipe_df = pd.DataFrame([matched_recipe_row])
+        matched_recipe_df = catalog.recipes.iloc[matched_position:matched_position + 1]
         # Extract the recipe name from the row for process_recipe call
-        recipe_name = matched_recipe_row['title']
+        recipe_name = matched_recipe_df['title'].values[0]
         # Now call process_recipe with single row DataFrame and recipe name
         matched_recipe = process_recipe(matched_recipe_df, recipe_name)
         
@@ -228,9 +296,6 @@ def find_matched_recipe(recipe, recipe_df, snack_df):
         #     "sub_region": matched_recipe_row["subregion"],
         # }
 
-        for key, value in matched_recipe.items():
-            matched_recipe[key] = f"{value}"
-
         # matched_recipe["ingredients_with_quantities"] = ast.literal_eval(
         #     matched_recipe_row["ingredients_with_quantities"]
         # )
@@ -244,102 +309,57 @@ def find_matched_recipe(recipe, recipe_df, snack_df):
     return matched_recipe
 
 
-def update_nutrition_values(response, recipe, operation, recipe_df, snack_df):
+def recipe_table_nutrients(catalog, recipe):
     """
-    Updates the nutrition values in response['tableData'] based on the matched recipe from the CSV file.
-    :param response: JSON object containing the meal plan
+    Returns the nutrients a recipe adds to the tableData of a meal plan.
+    :param catalog: RecipeCatalog
     :param recipe: dict containing the recipe information
-    :param operation: string of the operation to perform (add or subtract)
-    :return: updated JSON object containing the meal plan
+    :return: numpy array ordered like TABLE_NUTRIENT_COLUMNS
     """
-
     # Convert recipe ID to integer
     recipe["id"] = int(recipe["id"])
 
-    if recipe["meal_slot"] == "['snack']":
-        # Find the original recipe row in the DataFrame
-        original_recipe_row = snack_df.loc[snack_df["number"] == recipe["id"]]
-    else:
-         original_recipe_row = recipe_df.loc[recipe_df["number"]
-                                            == recipe["id"]]
-
-    if original_recipe_row.empty:
+    position = catalog.position(recipe["id"])
+    if position is None:
         raise ValueError(
             f"Recipe with ID {recipe['id']} not found in the database")
+    return catalog.table_nutrient_matrix[position]
 
-    # Define the nutrients to update based on the provided CSV columns
-    nutrients = {
-        "energy (calories)": "energy_kcal",
-        "fiber (g)": "fibre_g",
-        "carbohydrates (g)": "carbohydrates_g",
-        "protein (g)": "protein_g",
-        "fats (g)": "fats_total_g",
-        "calcium (mg)": "calcium_mg",
-        "sodium (mg)": "sodium_mg",
-        "copper (mg)": "copper_mg",
-        "fluoride (mg)": "fluoride_mg",
-        "iron (mg)": "iron_mg",
-        "magnesium (mg)": "magnesium_mg",
-        "manganese (mg)": "manganese_mg",
-        "potassium (mg)": "potassium_mg",
-        "selenium (ug)": "selenium_ug",
-        "zinc (mg)": "zinc_mg",
-        "vitamin_a (iu)": "vitamin_A_iu",
-        "thiamin (mg)": "thiamin_mg",
-        "riboflavin (mg)": "riboflavin_mg",
-        "niacin (mg)": "niacin_mg",
-        "vitamin_b5 (mg)": "vitamin_B5_pantothenic_acid_mg",
-        "vitamin_b6 (mg)": "vitamin_B6_mg",
-        "vitamin_b12 (ug)": "vitamin_B12_ug",
-        "folate (ug)": "folate_DFE_ug",
-        "vitamin_c (mg)": "vitamin_C_total_ascorbic_acid_mg",
-        "vitamin_d (iu)": "vitiamin_D_IU",
-        "vitamin_e (mg)": "vitamin_E_alphatocopherol_mg",
-        "choline (mg)": "choline_mg",
-        "vitamin_k (ug)": "vitamin_K_phylloquinone_ug",
-    }
-
-    # Update the tableData values
-    for item in response["tableData"]:
-        nutrient_name = item["nutrientName"].lower()
-        if nutrient_name in nutrients:
-            csv_key = nutrients[nutrient_name]
-            if csv_key in original_recipe_row.columns:
-                value = float(original_recipe_row[csv_key].values[0])
-                if operation == "add":
-                    item["actual"] += value
-                    item["actual"] = int(round(item["actual"]))
-                elif operation == "subtract":
-                    item["actual"] -= value
-                    item["actual"] = int(round(item["actual"]))
-                    if item["actual"] < 0:
-                        item["actual"] = 0
 
-    return response
+def update_nutrition_values(response, removed=(), added=()):
+    """
+    Updates the nutrition values in response['tableData'] for recipes removed from and added to the
+    meal plan, and the status of the rows whose value changed.
+    Every removed recipe is subtracted and every added recipe added as one vector. As before, the
+    values are rounded to integers after each recipe and cannot drop below 0.
+    :param response: JSON object containing the meal plan
+    :param removed: list of dicts containing the information of the removed recipes
+    :param added: list of dicts containing the information of the added recipes
+    :return: updated JSON object containing the meal plan
+    """
+    catalog = get_recipe_catalog()
+    table_data = response["tableData"]
+
+    # tableData rows of the nutrients that recipes contribute to
+    rows = []
+    columns = []
+    for row, item in enumerate(table_data):
+        column = catalog.table_nutrient_index.get(item["nutrientName"].lower())
+        if column is not None:
+            rows.append(row)
+            columns.append(column)
+
+    actual = np.array([table_data[row]["actual"] for row in rows], dtype=np.float64)
+    for recipe in removed:
+        actual = np.maximum(np.round(actual - recipe_table_nutrients(catalog, recipe)[columns]), 0)
+    for recipe in added:
+        actual = np.round(actual + recipe_table_nutrients(catalog, recipe)[columns])
+
+    for row, value in zip(rows, actual.tolist()):
+        item = table_data[row]
+        value = int(value)
+        if value != item["actual"] or "status" not in item:
+            item["actual"] = value
+            insert_nutrient_status(item)
 
-def main():
-    recipe = {
-        "calories": "108.3",
-        "carbohydrates": "9.8139",
-        "cook_time": "20 minutes",
-        "country": "US",
-        "fat": "7.2",
-        "id": "15912",
-        "ingredients": ["potato", "butter", "salt", "brown sugar", "cinnamon"],
-        "meal_name": "Breakfast",
-        "meal_slot": "['lunch', 'dinner']",
-        "prep_time": "15 minutes",
-        "price": "N/A",
-        "protein": "2.6787",
-        "region": "North American ",
-        "sub_region": "US ",
-        "title": "Cinnamon Sweet Potato Chips",
-        "type": "normal",
-    }
-
-    response = update_nutrition_values(recipe)
-    print(f"Matched Recipe:\n{recipe}")
-
-
-if __name__ == "__main__":
-    main()
+    return response
@@ -1,4 +1,5 @@
 import datetime
+from collections import Counter
 from app.check_privileges import check_registered
 from app.calculate_bmi import bmi_calculator_function
 from app.calculate_energy import energy_calculator_function
@@ -8,12 +9,106 @@ from app.retrieve_diet import get_diet_plan
 from app.adjust_nutritional_requirements import adjust_nutrients
 from app.find_optimal_meals import optimize_meals_integration
 from app.V2_post_process import post_process_results
+from app.recipe_catalog import get_recipe_catalog
+from app.solver_pool import SOLVER_POOL_SIZE, submit_meal_plan_group
 # from app.post_process_with_real_snack import process_the_recipes_with_snacks
+from concurrent.futures import as_completed
+import hashlib
 import json
+import math
 import os
 import pandas as pd
 
 
+class MealPlanBatchInputs:
+    """
+    Inputs of gen_meal_plan that are the same for many users, shared by the meal plans of a batch:
+    the diet plan of every health goal and the recipes scored for every set of user preferences.
+    Meal plans only read these inputs.
+    """
+
+    def __init__(self):
+        self.diet_plans = {}
+        self.scored_recipes = {}
+
+    def diet_plan(self, health_goal):
+        """
+        Returns the diet plan of a health goal, see get_diet_plan.
+        """
+        if health_goal not in self.diet_plans:
+            self.diet_plans[health_goal] = get_diet_plan(health_goal)
+        return self.diet_plans[health_goal]
+
+    def recipes_with_scores(self, data):
+        """
+        Returns the recipes scored for the preferences of a user, see score_recipes.
+        """
+        key = preference_key(data)
+        if key not in self.scored_recipes:
+            self.scored_recipes[key] = score_recipes(data)
+        return self.scored_recipes[key]
+
+
+def preference_key(data):
+    """
+    Returns a key that is equal for users whose preferences give every recipe the same score.
+    Liked and disliked foods are counted once per time they are listed, so duplicates are kept.
+    :param data: dict of user data
+    :return: string key
+    """
+    return json.dumps([
+        sorted(cuisine.lower() for cuisine in data["favouriteCuisines"]),
+        data["dietaryConstraint"],
+        data["religiousConstraint"],
+        sorted(food.lower() for food in data["likedFoods"]),
+        sorted(food.lower() for food in data["dislikedFoods"]),
+        sorted(allergy.lower() for allergy in data["allergies"]),
+    ])
+
+
+def meal_plan_request_key(data):
+    """
+    Returns a hash that is equal for requests that gen_meal_plan answers with the same meal plan. Only the
+    fields gen_meal_plan reads are hashed, lists that act as sets are sorted and the date range is reduced to
+    its first day and number of days.
+    :param data: dict of user data
+    :return: string hex digest
+    """
+    min_date = datetime.datetime.fromtimestamp(data["minDate"] / 1000.0, datetime.timezone.utc)
+    max_date = datetime.datetime.fromtimestamp(data["maxDate"] / 1000.0, datetime.timezone.utc)
+    request = {
+        "people": [{field: person[field] for field in ["age", "gender", "weight", "height", "activityLevel"]}
+                   for person in data["people"]],
+        "selectedUnit": data["selectedUnit"],
+        "healthGoal": data["healthGoal"],
+        "preferences": preference_key(data),
+        "start_date": min_date.strftime("%Y-%m-%d"),
+        "days": (max_date - min_date).days + 1,
+        "excludedRecipes": sorted(str(recipe) for recipe in data["excludedRecipes"]),
+        "includedRecipes": sorted(str(recipe) for recipe in data["includedRecipes"]),
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def score_recipes(data):
+    """
+    Returns a copy of the recipes of the catalog with the score of every recipe for the preferences of a user.
+    :param data: dict of user data
+    :return: dataframe of recipes with scores
+    """
+    catalog = get_recipe_catalog()
+    return apply_user_prefs(
+        data["favouriteCuisines"],
+        data["dietaryConstraint"],
+        data["religiousConstraint"],
+        data["likedFoods"],
+        data["dislikedFoods"],
+        data["allergies"],
+        catalog.copy_recipes(),
+        scorer=catalog.preference_scorer,
+    )
+
+
 def process_type_normal(response):
     """
     This method is a test phase to give all recipes a hard coded type of "normal".
@@ -30,40 +125,87 @@ def process_type_normal(response):
     return response
 
 
+def shopping_list_ingredients(recipe):
+    """
+    Returns the ingredients that a recipe adds to the shopping list.
+    """
+    if not isinstance(recipe["ingredients"], list):
+        recipe["ingredients"] = ["N/A"]
+        return []  # Skip this recipe if ingredients is not a list
+    return [ingredient for ingredient in recipe["ingredients"] if ingredient != "N/A"]
+
+
 def gen_shopping_list(response):
     """
     This method returns the meal plan with the shopping list data generated based on each recipe ingredient names.
     Ensures the shopping list contains only unique elements.
+    The number of recipes using every ingredient is kept in shopping_list_counts, so that
+    update_shopping_list can change the list when recipes are replaced.
     """
-    shopping_list = set()
+    counts = Counter()
     for day in response["days"]:
         for recipe in day["recipes"]:
-            if not isinstance(recipe["ingredients"], list):
-                recipe["ingredients"] = ["N/A"]
-                continue  # Skip this recipe if ingredients is not a list
-            for ingredient in recipe["ingredients"]:
-                if ingredient != "N/A":
-                    shopping_list.add(ingredient)
+            counts.update(shopping_list_ingredients(recipe))
 
-    response["shopping_list"] = list(shopping_list)
+    response["shopping_list"] = list(counts)
+    response["shopping_list_counts"] = dict(counts)
+
+    return response
+
+
+def update_shopping_list(response, removed=(), added=()):
+    """
+    Updates the shopping list of a meal plan for recipes removed from and added to it, without
+    going through the other recipes of the plan. Meal plans without shopping_list_counts get their
+    shopping list generated from scratch.
+    :param response: meal plan that already contains the added and no longer the removed recipes
+    :param removed: list of the removed recipe dicts
+    :param added: list of the added recipe dicts
+    :return: meal plan with the updated shopping list
+    """
+    if "shopping_list_counts" not in response:
+        return gen_shopping_list(response)
+
+    counts = Counter(response["shopping_list_counts"])
+    for recipe in removed:
+        counts.subtract(shopping_list_ingredients(recipe))
+    for recipe in added:
+        counts.update(shopping_list_ingredients(recipe))
+
+    # Keep the order of the list, new ingredients go to the end
+    shopping_list = [ingredient for ingredient in response["shopping_list"] if counts[ingredient] > 0]
+    listed = set(shopping_list)
+    for ingredient, count in counts.items():
+        if count > 0 and ingredient not in listed:
+            shopping_list.append(ingredient)
+
+    response["shopping_list"] = shopping_list
+    response["shopping_list_counts"] = {ingredient: count for ingredient, count in counts.items() if count > 0}
 
     return response
 
 
 def insert_status_nutrient_info(response):
     for nutrient in response["tableData"]:
-        nutrient["display_target"] = nutrient["target"]
-        if is_within_target(nutrient["actual"], nutrient["target"]):
-            nutrient["status"] = "success"
-        else:
-            nutrient["status"] = "warning"
-
-        if nutrient["display_target"].endswith("- "):
-            nutrient["display_target"] = nutrient["display_target"][:-2]
+        insert_nutrient_status(nutrient)
 
     return response
 
 
+def insert_nutrient_status(nutrient):
+    """
+    Sets the status and display target of a single tableData row.
+    """
+    nutrient["display_target"] = nutrient["target"]
+    if is_within_target(nutrient["actual"], nutrient["target"]):
+        nutrient["status"] = "success"
+    else:
+        nutrient["status"] = "warning"
+
+    if nutrient["display_target"].endswith("- "):
+        nutrient["display_target"] = nutrient["display_target"][:-2]
+
+
 def is_within_target(actual, target):
     parts = target.split("-")
     lower_bound = int(parts[0].strip())
@@ -75,11 +217,13 @@ def is_within_target(actual, target):
     return lower_bound <= actual <= upper_bound
 
 
-def gen_meal_plan(data):
+def gen_meal_plan(data, inputs=None, budget=None):
     """
     Called in ./backend/app/routes.py.
     Generates a meal plan with 9 steps based on the user data passed in from the frontend.
     :param data: dict of user data
+    :param inputs: MealPlanBatchInputs shared with other meal plans, None to read every input for this plan
+    :param budget: SolveBudget of the optimization, None for the configured one (see solver_backends.py)
     :return: dict of meal plan details
     """
     # 1. Check privileges
@@ -113,24 +257,18 @@ def gen_meal_plan(data):
     # 4. Calculate nutritional requirements
     macros = calculate_macros(energy, data["people"])
     micros = calculate_micros(data["people"])
-    all_recipes_df = pd.read_csv("./meal_db/meal_database.csv")
-
-    snack_recipes_df = all_recipes_df[all_recipes_df["meal_slot"]
-                                      == "['snack']"]
 
     # 5. Apply user prefs to meal database
-    recipes_with_scores = apply_user_prefs(
-        data["favouriteCuisines"],
-        data["dietaryConstraint"],
-        data["religiousConstraint"],
-        data["likedFoods"],
-        data["dislikedFoods"],
-        data["allergies"],
-        all_recipes_df,
-    )
+    if inputs is None:
+        recipes_with_scores = score_recipes(data)
+    else:
+        recipes_with_scores = inputs.recipes_with_scores(data)
 
     # 6. Retrieve diet
-    diet_info = get_diet_plan(data["healthGoal"])
+    if inputs is None:
+        diet_info = get_diet_plan(data["healthGoal"])
+    else:
+        diet_info = inputs.diet_plan(data["healthGoal"])
 
     # 7. Adjust nutritional requirements
     adjust_nutrients(macros, micros, diet_info["plan"], data["people"])
@@ -163,7 +301,7 @@ def gen_meal_plan(data):
         recipe_df=recipes_with_scores,
         macros=macros,
         micros=micros,
-        user_diet=diet_info["diet_score"],
+        user_diet=diet_info["diet_scores"],
         days=days,
         excluded_nutrients=[
             str(nutrient).lower() for nutrient in list_of_excluded_nutrients
@@ -171,6 +309,7 @@ def gen_meal_plan(data):
         constraint_relaxation=constraint_relaxation,
         exclude=data["excludedRecipes"],
         include=data["includedRecipes"],
+        budget=budget,
     )
 
     # optimized_snacks = []
@@ -195,3 +334,55 @@ def gen_meal_plan(data):
     print("\n\nresponse8:\n\n", response)
 
     return response
+
+
+def iter_meal_plans_batch(requests, timeout=None):
+    """
+    Generates the meal plans of many users in the solver process pool, yielding every meal plan as soon
+    as it is done. Users with the same preferences are generated together so that they share their scored
+    recipes, and every group is split into chunks so that the batch keeps every worker busy. A user whose
+    meal plan fails gets an error response and does not affect the other users.
+    :param requests: list of dicts of user data, the input of gen_meal_plan
+    :param timeout: int, seconds the meal plan of one user may take, None for no limit
+    :return: iterator of (index in requests, response) tuples, the response is the meal plan or a dict
+    with the error
+    """
+    groups = {}
+    for index, data in enumerate(requests):
+        try:
+            key = preference_key(data)
+        except Exception as e:
+            yield index, {"error": str(e)}
+            continue
+        groups.setdefault(key, []).append(index)
+
+    chunk_size = max(1, math.ceil(len(requests) / SOLVER_POOL_SIZE))
+    futures = {}
+    for indices in groups.values():
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start:start + chunk_size]
+            futures[submit_meal_plan_group([requests[index] for index in chunk], timeout)] = chunk
+    print("meal plans of", len(requests), "users in", len(groups), "preference groups are being generated")
+
+    for future in as_completed(futures):
+        chunk = futures[future]
+        try:
+            responses = future.result()
+        except Exception as e:
+            # The worker of the chunk failed, e.g. it was killed
+            responses = [{"error": str(e)} for _ in chunk]
+        for index, response in zip(chunk, responses):
+            yield index, response
+
+
+def gen_meal_plans_batch(requests, timeout=None):
+    """
+    Generates the meal plans of many users, see iter_meal_plans_batch.
+    :param requests: list of dicts of user data, the input of gen_meal_plan
+    :param timeout: int, seconds the meal plan of one user may take, None for no limit
+    :return: list with the meal plan, or a dict with the error, of every user in the order of requests
+    """
+    responses = [None] * len(requests)
+    for index, response in iter_meal_plans_batch(requests, timeout):
+        responses[index] = response
+    return responses
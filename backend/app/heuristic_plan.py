@@ -0,0 +1,131 @@
+"""
+This file contains the greedy heuristic that fills a meal plan when no solve
+found one, e.g. within the solve budget. The plan it builds meets the meal
+slot counts of PLAN_CONSTRAINTS and brings its calories and macros,
+REPAIRED_CONSTRAINTS, as close to their bounds as single recipe changes can.
+Other nutrients are not considered, see unchecked_nutrients.
+
+Like in the model, a recipe of several meal slots counts towards each of them.
+"""
+import numpy as np
+
+from app.meal_plan_model import NUTRIENT_CONSTRAINTS
+
+# Nutrient constraints the plan is repaired for after the meal slots are filled
+REPAIRED_CONSTRAINTS = ["energy (calories)", "protein (g)", "fats (g)", "carbohydrates (g)"]
+# Plan constraints filled first, recipes of these slots are the hardest to fit
+# once other slots are full
+FILL_ORDER = ["lunches", "mains", "snacks", "breakfasts"]
+# Plan constraints of a single meal slot
+SLOT_CONSTRAINTS = ["snacks", "mains", "sides", "lunches", "breakfasts"]
+
+
+def bound_distance(totals, lower, upper, scale):
+    """
+    Returns how far the totals of rows are outside their bounds, as a fraction
+    of the scale of each row, summed over the rows. totals has a row per bound
+    and a column per plan.
+    """
+    distance = (np.maximum(lower[:, None] - totals, 0)
+                + np.maximum(totals - upper[:, None], 0))
+    return (distance / scale[:, None]).sum(axis=0)
+
+
+def unchecked_nutrients():
+    """
+    Returns the names of the nutrient constraints greedy_meal_plan does not
+    consider.
+    """
+    return [constraint.name for constraint in NUTRIENT_CONSTRAINTS
+            if constraint.name not in REPAIRED_CONSTRAINTS]
+
+
+def greedy_meal_plan(model):
+    """
+    Builds a meal plan for a model without solving it. Every plan constraint
+    below its lower bound is filled with the recipes of the best objective that
+    keep every plan constraint within its upper bound, each recipe once before
+    any recipe is repeated and recipes of fewer meal slots first, which post
+    processing places in their meal slot more reliably. Recipes are then added,
+    removed or swapped, one at a time, while that brings the calories and
+    macros closer to their bounds without breaking a plan constraint. Each
+    nutrient counts by how far it is outside its bounds relative to them.
+
+    :param model: MealPlanModel
+    :return: numpy array with the value of every model column, like a backend
+    returns
+    """
+    recipe_count = len(model)
+    upper = model.upper[:recipe_count]
+    objective = model.objective[:recipe_count]
+    names = [constraint.name for constraint in NUTRIENT_CONSTRAINTS]
+    nutrient_rows = [row for name in REPAIRED_CONSTRAINTS
+                     for row in model.nutrient_rows[names.index(name)]]
+    nutrients = model.A[nutrient_rows, :recipe_count]
+    lower_nutrients = model.row_lower[nutrient_rows]
+    upper_nutrients = model.row_upper[nutrient_rows]
+    # Every row has either a lower or an upper bound
+    scale = np.where(np.isfinite(lower_nutrients), lower_nutrients, upper_nutrients)
+    scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1)
+
+    names = FILL_ORDER + [name for name in model.plan_rows if name not in FILL_ORDER]
+    rows = [model.plan_rows[name] for name in names]
+    counts_matrix = model.A[rows, :recipe_count]
+    lower_counts = model.row_lower[rows]
+    upper_counts = model.row_upper[rows]
+    slot_counts = (model.A[[model.plan_rows[name] for name in SLOT_CONSTRAINTS], :recipe_count] > 0).sum(axis=0)
+
+    def shortfall(counts):
+        return np.maximum(lower_counts[:, None] - counts, 0).sum(axis=0)
+
+    def fits(counts):
+        return np.all(counts <= upper_counts[:, None], axis=0)
+
+    values = np.zeros(recipe_count)
+    counts = np.zeros(len(rows))
+    for index, name in enumerate(names):
+        while counts[index] < lower_counts[index]:
+            candidates = np.flatnonzero((counts_matrix[index] > 0) & (values < upper))
+            candidates = candidates[fits(counts[:, None] + counts_matrix[:, candidates])]
+            if len(candidates) == 0:
+                print(f"Greedy meal plan is short of {lower_counts[index] - counts[index]:g} {name}")
+                break
+            # Unused recipes first, then the fewest meal slots, then the best objective
+            best = candidates[np.lexsort((-objective[candidates], slot_counts[candidates],
+                                          values[candidates] > 0))[0]]
+            values[best] += 1
+            counts += counts_matrix[:, best]
+
+    totals = nutrients @ values
+    distance = bound_distance(totals[:, None], lower_nutrients, upper_nutrients, scale)[0]
+    while distance > 0:
+        can_add = np.flatnonzero(values < upper)
+        selected = np.flatnonzero(values > 0)
+        # Every move adds a recipe, removes one, or swaps one for another. -1
+        # stands for no recipe
+        removed = np.concatenate([np.full(len(can_add), -1), selected,
+                                  np.repeat(selected, len(can_add))])
+        added = np.concatenate([can_add, np.full(len(selected), -1),
+                                np.tile(can_add, len(selected))])
+        removed_counts = np.where(removed >= 0, counts_matrix[:, removed], 0)
+        added_counts = np.where(added >= 0, counts_matrix[:, added], 0)
+        new_counts = counts[:, None] - removed_counts + added_counts
+        new_totals = (totals[:, None] - np.where(removed >= 0, nutrients[:, removed], 0)
+                      + np.where(added >= 0, nutrients[:, added], 0))
+
+        valid = (fits(new_counts) & (shortfall(new_counts) <= shortfall(counts[:, None])[0])
+                 & (removed != added))
+        distances = np.where(valid, bound_distance(new_totals, lower_nutrients, upper_nutrients, scale),
+                             np.inf)
+        best = int(np.argmin(distances))
+        if distances[best] >= distance:
+            break
+        distance = distances[best]
+        totals = new_totals[:, best]
+        counts = new_counts[:, best]
+        if removed[best] >= 0:
+            values[removed[best]] -= 1
+        if added[best] >= 0:
+            values[added[best]] += 1
+
+    return np.concatenate([values, np.zeros(model.num_columns - recipe_count)])
@@ -0,0 +1,427 @@
+"""
+This file contains the matrix form of the meal plan optimization problem. The
+nutrient and meal slot constraints are declared as data in the tables below and
+turned into a constraint matrix over the recipe variables, which any of the
+backends in solver_backends.py can solve.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from app.recipe_catalog import OPTIMIZER_MEAL_SLOTS
+
+# These constants are for finding ranges for hard set values such as Calories.
+# eating 2088 calories exact is hard so we take +- 5%
+LOWER_RANGE = 0.95
+UPPER_RANGE = 1.05
+
+# Indexes for minimum/maximum values for macros
+MIN_INDEX = 0
+MAX_INDEX = 1
+
+# Upper bounds at or above this value are shown as an empty target
+MAX_INT = (2 ** 31) - 1
+
+# Nutrients whose bounds are never loosened when the problem is infeasible
+GENERAL_EXCLUDED_NUTRIENTS = ["energy", "sodium", "fats"]
+
+# Objective value lost by an elastic model for missing a nutrient bound by the
+# full amount of the bound. Nutrients that are never loosened get a much higher
+# penalty so that they are only missed if there is no other way.
+ELASTIC_PENALTY = 1000
+EXCLUDED_ELASTIC_PENALTY = 1000000
+
+# Slack values below this fraction of their bound are solver noise
+SLACK_TOLERANCE = 1e-6
+
+# Number of alternates kept for every recipe of a solution, see swap_alternates
+SWAP_ALTERNATES = 5
+
+# A bound taken from the user requirements: requirements[key], or
+# requirements[key][index] for macros given as [min, max], times factor.
+Requirement = namedtuple("Requirement", ["key", "index", "factor"],
+                         defaults=[None, 1])
+
+# name: name of the constraint in the constraint targets, e.g. "fiber (g)"
+# lower_nutrients / upper_nutrients: catalog nutrients summed for the bound
+# lower / upper: Requirement of the bound
+# scales_with_days: True if the requirement is per day
+NutrientConstraint = namedtuple(
+    "NutrientConstraint",
+    ["name", "lower_nutrients", "upper_nutrients", "lower", "upper",
+     "scales_with_days"])
+
+
+def nutrient_constraint(name, nutrient, lower, upper):
+    """
+    Returns the per day NutrientConstraint of a single nutrient.
+    """
+    return NutrientConstraint(name, (nutrient,), (nutrient,), lower, upper, True)
+
+
+# The order of this table is the order of the constraint targets in the result
+NUTRIENT_CONSTRAINTS = [
+    nutrient_constraint("energy (calories)", "Calories",
+                        Requirement("large_calories", factor=LOWER_RANGE),
+                        Requirement("large_calories", factor=UPPER_RANGE)),
+    nutrient_constraint("fiber (g)", "fibre",
+                        Requirement("fiber_g", MIN_INDEX), Requirement("fiber_g", MAX_INDEX)),
+    nutrient_constraint("carbohydrates (g)", "carbohydrates",
+                        Requirement("carbohydrates_g", MIN_INDEX), Requirement("carbohydrates_g", MAX_INDEX)),
+    nutrient_constraint("protein (g)", "protein",
+                        Requirement("protein_g", MIN_INDEX), Requirement("protein_g", MAX_INDEX)),
+    nutrient_constraint("fats (g)", "fats_total",
+                        Requirement("fat_g", MIN_INDEX), Requirement("fat_g", MAX_INDEX)),
+    nutrient_constraint("calcium (mg)", "calcium",
+                        Requirement("min_calcium_mg_ai"), Requirement("min_calcium_mg_ul")),
+    nutrient_constraint("sodium (mg)", "sodium",
+                        Requirement("min_sodium_mg_ai"), Requirement("min_sodium_mg_ul")),
+    nutrient_constraint("copper (mg)", "copper",
+                        Requirement("min_copper_mg_rda"), Requirement("min_copper_mg_ul")),
+    nutrient_constraint("fluoride (mg)", "fluoride",
+                        Requirement("min_fluoride_mg_ai"), Requirement("min_fluoride_mg_ul")),
+    nutrient_constraint("iron (mg)", "iron",
+                        Requirement("min_iron_mg_rda"), Requirement("min_iron_mg_ul")),
+    nutrient_constraint("magnesium (mg)", "magnesium",
+                        Requirement("min_magnesium_mg_rda"), Requirement("min_magnesium_mg_ul")),
+    nutrient_constraint("manganese (mg)", "manganese",
+                        Requirement("min_manganese_mg_rda"), Requirement("min_manganese_mg_ul")),
+    nutrient_constraint("potassium (mg)", "potassium",
+                        Requirement("min_potassium_mg_ai"), Requirement("min_potassium_ul")),
+    nutrient_constraint("selenium (ug)", "selenium",
+                        Requirement("min_selenium_ug_rda"), Requirement("min_selenium_ug_ul")),
+    nutrient_constraint("zinc (mg)", "zinc",
+                        Requirement("min_zinc_mg_rda"), Requirement("min_zinc_mg_ul")),
+    nutrient_constraint("vitamin_a (iu)", "vitamin_A",
+                        Requirement("vit_a_iu_rda"), Requirement("vit_a_iu_ul")),
+    nutrient_constraint("thiamin (mg)", "thiamin",
+                        Requirement("vit_b1_thiamin_mg_rda"), Requirement("vit_b1_thiamin_mg_ul")),
+    nutrient_constraint("riboflavin (mg)", "riboflavin",
+                        Requirement("vit_b2_riboflavin_mg_rda"), Requirement("vit_b2_riboflavin_mg_ul")),
+    nutrient_constraint("niacin (mg)", "niacin",
+                        Requirement("vit_b3_niacin_mg_rda"), Requirement("vit_b3_niacin_mg_ul")),
+    nutrient_constraint("vitamin_b5 (mg)", "vitamin_B5",
+                        Requirement("vit_b5_pantothenicacid_mg_ai"), Requirement("vit_b5_pantothenic_acid_mg_ul")),
+    nutrient_constraint("vitamin_b6 (mg)", "vitamin_B6",
+                        Requirement("vit_b6_mg_rda"), Requirement("vit_b6_mg_ul")),
+    # Added vitamin B12 counts towards the minimum but not towards the maximum
+    NutrientConstraint("vitamin_b12 (ug)", ("vitamin_B12", "vitamin_B12_added"), ("vitamin_B12",),
+                       Requirement("vit_b12_ug_rda"), Requirement("vit_b12_ug_ul"), True),
+    nutrient_constraint("folate (ug)", "folate_total",
+                        Requirement("vit_b9_folate_ug_rda"), Requirement("vit_b9_folate_ug_ul")),
+    nutrient_constraint("vitamin_c (mg)", "vitamin_C",
+                        Requirement("vit_c_mg_rda"), Requirement("vit_c_mg_ul")),
+    nutrient_constraint("vitamin_d (iu)", "vitamin_D",
+                        Requirement("vit_d_iu_ai"), Requirement("vit_d_iu_ul")),
+    nutrient_constraint("vitamin_e (mg)", "vitamin_E",
+                        Requirement("vit_e_mg_rda"), Requirement("vit_e_mg_ul")),
+    nutrient_constraint("choline (mg)", "choline",
+                        Requirement("vit_choline_mg_ai"), Requirement("vit_choline_mg_ul")),
+    nutrient_constraint("vitamin_k (ug)", "vitamin_K",
+                        Requirement("vit_k_ug_ai"), Requirement("vit_k_ug_ul")),
+]
+
+# name: description of the constraint
+# slots: meal slots whose recipe counts are added up, None for every recipe. A
+# recipe in several of the slots is counted once per slot.
+# lower / upper: bounds on the count, None if unbounded
+# scales_with_days: True if the bounds are per day
+PlanConstraint = namedtuple("PlanConstraint",
+                            ["name", "slots", "lower", "upper", "scales_with_days"])
+
+PLAN_CONSTRAINTS = [
+    PlanConstraint("recipes", None, None, 9, True),
+    PlanConstraint("snacks", ["snack"], 2, 2, True),
+    PlanConstraint("mains", ["main"], 1, 1, True),
+    PlanConstraint("sides", ["side"], None, 2, True),
+    PlanConstraint("lunches", ["lunch"], 1, 1, True),
+    PlanConstraint("breakfasts", ["breakfast"], 1, 3, True),
+    PlanConstraint("lunches and mains", ["lunch", "main"], 2, None, False),
+    PlanConstraint("breakfasts and lunches", ["breakfast", "lunch"], 2, None, False),
+    PlanConstraint("mains and breakfasts", ["main", "breakfast"], 2, None, False),
+    PlanConstraint("sides and breakfasts", ["side", "breakfast"], 2, None, False),
+    PlanConstraint("meals", ["main", "breakfast", "lunch", "snack"], 4, None, False),
+]
+
+
+def nutrient_key(constraint_name):
+    """
+    Returns the name used to exclude a nutrient from loosening, e.g.
+    "vitamin d" for the constraint "vitamin_d (iu)".
+    """
+    return constraint_name.replace("_", " ").rsplit(" ", 1)[0]
+
+
+def requirement_value(requirements, requirement, days):
+    """
+    Returns the bound described by requirement for a meal plan of days days.
+
+    :param requirements: dict of the user's macros and micros
+    :param requirement: Requirement
+    :param days: int, number of days of the meal plan, 1 for a fixed bound
+    :return: float bound
+    """
+    value = requirements[requirement.key]
+    if requirement.index is not None:
+        value = value[requirement.index]
+    return value * days * requirement.factor
+
+
+class MealPlanModel:
+    """
+    Integer program choosing how many times each recipe goes into a meal plan:
+
+        maximize    objective @ x
+        subject to  row_lower <= A @ x <= row_upper
+                    0 <= x <= upper, x integer
+
+    The first rows of A are the nutrient constraints, followed by the
+    PLAN_CONSTRAINTS rows. A is dense because nearly every recipe has a nonzero
+    amount of every nutrient, the backends convert it to the format they need.
+
+    The columns of A are the recipes, an elastic model (see make_elastic) adds
+    continuous slack columns after them.
+    """
+
+    def __init__(self, catalog, rows, objective, macros, micros, days=1,
+                 exclude=[], excluded_nutrients=[]):
+        """
+        :param catalog: RecipeCatalog the recipes are taken from
+        :param rows: numpy int array, catalog rows of the candidate recipes
+        :param objective: numpy array, objective value of each candidate recipe
+        :param macros: dict of macronutrients per day
+        :param micros: dict of micronutrients per day
+        :param days: int, number of days to generate meal plan for
+        :param exclude: list of recipe numbers that must not be selected
+        :param excluded_nutrients: list of strings, names of nutrients whose
+        bounds are not loosened when the problem is infeasible
+        """
+        self.recipes = catalog.recipes["number"].to_numpy()[rows].tolist()
+        self.meal_slots = catalog.recipes["meal_slot"].to_numpy()[rows]
+        self.titles = catalog.recipes["title"].to_numpy()[rows]
+        self.objective = np.asarray(objective, dtype=np.float64)
+
+        requirements = {**macros, **micros}
+        nutrients = catalog.nutrient_matrix[rows].astype(np.float64)
+
+        def nutrient_row(names):
+            return nutrients[:, [catalog.nutrient_index[name] for name in names]].sum(axis=1)
+
+        matrix = []
+        row_lower = []
+        row_upper = []
+        relaxable = []
+        # (lower row, upper row) of every nutrient constraint
+        self.nutrient_rows = []
+        for constraint in NUTRIENT_CONSTRAINTS:
+            scale = days if constraint.scales_with_days else 1
+            lower = requirement_value(requirements, constraint.lower, scale)
+            upper = requirement_value(requirements, constraint.upper, scale)
+            relax = nutrient_key(constraint.name) not in (
+                list(excluded_nutrients) + GENERAL_EXCLUDED_NUTRIENTS)
+
+            # The bounds are separate rows so that a lower bound above the
+            # upper bound is left for loosening or slack to resolve
+            self.nutrient_rows.append((len(matrix), len(matrix) + 1))
+            matrix.append(nutrient_row(constraint.lower_nutrients))
+            row_lower.append(lower)
+            row_upper.append(np.inf)
+            matrix.append(nutrient_row(constraint.upper_nutrients))
+            row_lower.append(-np.inf)
+            row_upper.append(upper)
+            relaxable += [relax, relax]
+
+        # Row of every plan constraint by name
+        self.plan_rows = {}
+        for constraint in PLAN_CONSTRAINTS:
+            scale = days if constraint.scales_with_days else 1
+            self.plan_rows[constraint.name] = len(matrix)
+            if constraint.slots is None:
+                matrix.append(np.ones(len(rows)))
+            else:
+                matrix.append(sum(catalog.slot_masks[slot][rows].astype(np.float64)
+                                  for slot in constraint.slots))
+            row_lower.append(-np.inf if constraint.lower is None else constraint.lower * scale)
+            row_upper.append(np.inf if constraint.upper is None else constraint.upper * scale)
+            relaxable.append(False)
+
+        self.A = np.array(matrix).reshape(len(matrix), len(rows))
+        self.row_lower = np.array(row_lower, dtype=np.float64)
+        self.row_upper = np.array(row_upper, dtype=np.float64)
+        self.relaxable = np.array(relaxable, dtype=bool)
+
+        # Repetition limits, excluded recipes cannot be selected at all
+        self.upper = catalog.repetition_limits[rows].astype(np.float64)
+        index_by_recipe = {recipe: index for index, recipe in enumerate(self.recipes)}
+        for recipe in exclude:
+            index = index_by_recipe.get(int(recipe))
+            if index is not None:
+                self.upper[index] = 0
+
+        # True for the recipes of every meal slot
+        self.slot_masks = {slot: catalog.slot_masks[slot][rows] for slot in OPTIMIZER_MEAL_SLOTS}
+
+        self.column_names = [f"Recipes_{recipe}" for recipe in self.recipes]
+        self.integer_columns = np.ones(len(self.recipes), dtype=bool)
+
+        # Nutrient constraint and bound of every slack column of an elastic model
+        self.slack_constraints = []
+        self.slack_bounds = np.zeros(0)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    @property
+    def num_columns(self):
+        return len(self.column_names)
+
+    @property
+    def is_elastic(self):
+        return len(self.slack_constraints) > 0
+
+    def make_elastic(self):
+        """
+        Adds a penalized slack column to every nutrient bound, so that a bound
+        can be missed at a cost instead of making the model infeasible. Missing
+        a bound by its full amount costs ELASTIC_PENALTY, or
+        EXCLUDED_ELASTIC_PENALTY for nutrients that are not relaxable.
+        """
+        slack_columns = []
+        penalties = []
+        upper = []
+        bounds = []
+        for index, (lower_row, upper_row) in enumerate(self.nutrient_rows):
+            penalty = (ELASTIC_PENALTY if self.relaxable[lower_row]
+                       else EXCLUDED_ELASTIC_PENALTY)
+            lower = self.row_lower[lower_row]
+            if lower > -np.inf:
+                # A @ x + slack >= lower, the slack never has to exceed lower
+                bound = max(abs(lower), 1)
+                slack_columns.append((lower_row, 1))
+                upper.append(bound)
+                bounds.append(bound)
+                penalties.append(penalty / bound)
+                self.slack_constraints.append(index)
+            row_upper = self.row_upper[upper_row]
+            if row_upper < np.inf:
+                # A @ x - slack <= upper
+                bound = max(abs(row_upper), 1)
+                slack_columns.append((upper_row, -1))
+                upper.append(np.inf)
+                bounds.append(bound)
+                penalties.append(penalty / bound)
+                self.slack_constraints.append(index)
+
+        slacks = np.zeros((len(self.row_lower), len(slack_columns)))
+        for column, (row, sign) in enumerate(slack_columns):
+            slacks[row, column] = sign
+
+        self.A = np.hstack([self.A, slacks])
+        self.objective = np.concatenate([self.objective, -np.array(penalties)])
+        self.upper = np.concatenate([self.upper, upper])
+        self.slack_bounds = np.array(bounds)
+        self.column_names += [f"Slack_{column}" for column in range(len(slack_columns))]
+        self.integer_columns = np.concatenate(
+            [self.integer_columns, np.zeros(len(slack_columns), dtype=bool)])
+
+    def relaxed_nutrients(self, values):
+        """
+        Returns the names of the nutrient constraints whose bounds an elastic
+        model's solution misses, in the order of NUTRIENT_CONSTRAINTS.
+
+        :param values: numpy array of column values from a backend
+        :return: string list of constraint names, e.g. ["iron (mg)"]
+        """
+        slacks = values[len(self.recipes):]
+        relaxed = {self.slack_constraints[column]
+                   for column in np.flatnonzero(slacks > SLACK_TOLERANCE * self.slack_bounds)}
+        return [NUTRIENT_CONSTRAINTS[index].name for index in sorted(relaxed)]
+
+    def loosen(self, scale):
+        """
+        Loosens the bounds of the relaxable nutrient constraints, lower bounds
+        are scaled by 1 - scale and upper bounds by 1 + scale.
+        """
+        self.row_lower[self.relaxable] *= (1 - scale)
+        self.row_upper[self.relaxable] *= (1 + scale)
+
+    def selected_recipes(self, values):
+        """
+        Returns the recipes selected by a solution, ordered by the string form
+        of their number like the variables of a PuLP problem.
+
+        :param values: numpy array of column values from a backend
+        :return: list of dicts with name, id, meal_slot and multiples
+        """
+        selected = []
+        for index in np.flatnonzero(values[:len(self.recipes)] > 0):
+            selected.append({'name': f"{self.titles[index]}",
+                             # add a field "id" to help the following track of the snack recipe
+                             'id': str(self.recipes[index]),
+                             'meal_slot': self.meal_slots[index],
+                             'multiples': float(values[index])})
+        selected.sort(key=lambda recipe: "Recipes_" + recipe['id'])
+        return selected
+
+    def swap_alternates(self, values, count=SWAP_ALTERNATES):
+        """
+        Returns the recipes that can replace one serving of each recipe of a
+        solution without breaking a constraint, best objective first, for every
+        meal slot of the recipe. Post processing places a recipe in one of its
+        meal slots, and its replacement has to fill the same one. A bound the
+        solution already misses, e.g. in an elastic model, may not be missed by
+        more than before.
+
+        Every alternate is a single swap away from the solution. Solving the
+        model again for a pool of whole solutions would cost a solve per
+        alternate.
+
+        :param values: numpy array of column values from a backend
+        :param count: int, maximum number of alternates per recipe and meal slot
+        :return: dict of the recipe number (string) of every selected recipe to
+        a dict of each of its meal slots to the list of recipe numbers of that
+        slot that can replace it
+        """
+        recipe_values = values[:len(self.recipes)]
+        recipe_matrix = self.A[:, :len(self.recipes)]
+        totals = recipe_matrix @ recipe_values
+
+        def violation(row_totals):
+            return (np.maximum(self.row_lower[:, None] - row_totals, 0)
+                    + np.maximum(row_totals - self.row_upper[:, None], 0))
+
+        current = violation(totals[:, None])[:, 0]
+        # Recipes that can take one more serving, best objective first
+        open_columns = np.flatnonzero(recipe_values + 1 <= self.upper[:len(self.recipes)])
+        open_columns = open_columns[np.argsort(-self.objective[open_columns], kind="stable")]
+        open_matrix = recipe_matrix[:, open_columns]
+
+        alternates = {}
+        for index in np.flatnonzero(recipe_values > 0):
+            swapped = totals[:, None] - recipe_matrix[:, index, None] + open_matrix
+            feasible = np.all(violation(swapped) <= current[:, None] + SLACK_TOLERANCE, axis=0)
+            feasible &= open_columns != index
+            alternates[str(self.recipes[index])] = {
+                slot: [int(self.recipes[column])
+                       for column in open_columns[feasible & mask[open_columns]][:count]]
+                for slot, mask in self.slot_masks.items() if mask[index]}
+        return alternates
+
+    def constraint_targets(self, values):
+        """
+        Returns the amount of every constrained nutrient in a solution together
+        with the current bounds of the nutrient.
+
+        :param values: numpy array of column values from a backend
+        :return: list of dicts with actual, name and target (string range)
+        """
+        totals = self.A[:, :len(self.recipes)] @ values[:len(self.recipes)]
+        constraint_result = []
+        for constraint, (lower_row, upper_row) in zip(NUTRIENT_CONSTRAINTS, self.nutrient_rows):
+            upper = int(self.row_upper[upper_row])
+            constraint_result.append({
+                "actual": int(totals[lower_row]),
+                "name": constraint.name,
+                "target": f"{int(self.row_lower[lower_row])} - "
+                          f"{'' if upper >= MAX_INT else upper}"})
+        return constraint_result
@@ -1,8 +1,15 @@
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
 import json
 import os
 import csv
 import codecs
+import io
+
+from app.recipe_assets import get_recipe_asset_cache
+
+# Seconds a GCS request may take, the storage client's default
+GCS_TIMEOUT = 60
 
 def set_lifecycle_with_prefix(bucket, prefix, days):
     bucket.add_lifecycle_delete_rule(age=days, matches_prefix=[prefix])
@@ -24,21 +31,26 @@ def _get_storage_client():
             _gcs_client = storage.Client()
     return _gcs_client
 
-def set_lifecycle_with_prefix(bucket, prefix, days):
+def set_lifecycle_with_prefix(bucket, prefix, days, timeout=GCS_TIMEOUT):
     bucket.add_lifecycle_delete_rule(age=days, matches_prefix=[prefix])
-    bucket.patch()
+    bucket.patch(timeout=timeout)
 
-def upload_mealplan_json_to_gcs(response_data, path):
+def upload_mealplan_json_to_gcs(response_data, path, timeout=GCS_TIMEOUT):
+    """
+    Uploads a meal plan to GCS. timeout is the number of seconds each GCS
+    request may take.
+    """
     client = storage.Client.from_service_account_info(json.loads(os.getenv("SERVICE_JSON")))
     bucket_name = 'meal-plan-data'
     bucket = client.bucket(bucket_name)
     
-    set_lifecycle_with_prefix(bucket, "meal-plans-for-user/", 7)
+    set_lifecycle_with_prefix(bucket, "meal-plans-for-user/", 7, timeout=timeout)
     blob = bucket.blob(path)
     
     blob.upload_from_string(
         data=json.dumps(response_data),
-        content_type='application/json'
+        content_type='application/json',
+        timeout=timeout
     )
     print(f"Meal plan file is successfully uploaded to {path}")
 
@@ -67,24 +79,27 @@ def read_csv_rows_from_gcs(bucket_name: str, blob_path: str, *, encoding: str =
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(blob_path)
 
-    if not blob.exists():
+    # Download without checking blob.exists() first, which is a round trip of its own
+    try:
+        data = blob.download_as_bytes()
+    except NotFound:
         raise FileNotFoundError(f"GCS object not found: gs://{bucket_name}/{blob_path}")
 
-    rows = []
-    with blob.open("rt", encoding=encoding, errors="underscorereplace", newline="") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            rows.append(row)
-    return rows
+    text = data.decode(encoding, errors="underscorereplace")
+    return [row for row in csv.reader(io.StringIO(text, newline=""))]
 
 def read_recipe_assets_from_gcs(recipe_id: str, *,
                                 bucket_name: str = "meal-plan-data",
                                 base_prefix: str = "meal_db"):
 
-    instructions_blob = f"{base_prefix}/instructions/instructions_{recipe_id}.csv"
-    ingredients_blob  = f"{base_prefix}/ingredients/{recipe_id}.csv"
+    def load():
+        instructions_blob = f"{base_prefix}/instructions/instructions_{recipe_id}.csv"
+        ingredients_blob  = f"{base_prefix}/ingredients/{recipe_id}.csv"
 
-    instructions = read_csv_rows_from_gcs(bucket_name, instructions_blob, encoding="utf-8")
-    ingredients  = read_csv_rows_from_gcs(bucket_name, ingredients_blob,  encoding="utf-8")
+        instructions = read_csv_rows_from_gcs(bucket_name, instructions_blob, encoding="utf-8")
+        ingredients  = read_csv_rows_from_gcs(bucket_name, ingredients_blob,  encoding="utf-8")
+        return instructions, ingredients
 
-    return instructions, ingredients
\ No newline at end of file
+    # Shares the recipe asset cache with the assets read from disk
+    return get_recipe_asset_cache().get(
+        (f"gs://{bucket_name}/{base_prefix}", str(recipe_id)), load)
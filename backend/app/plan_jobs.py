@@ -0,0 +1,322 @@
+"""
+This file contains the meal plan jobs. A job generates a meal plan in the
+process pool of solver_pool.py, so the request that submits it returns at once
+with a job id and the plan is polled for with the job id. At most
+SOLVER_POOL_SIZE meal plans are solved at the same time, the other jobs wait in
+the queue of the pool.
+
+Requests that give the same meal plan, see meal_plan_request_key, share the
+solve of the first of them that has not finished, e.g. when the frontend
+retries or the user double-clicks. Every request still gets its own job id and
+plan id, so edits of one plan do not change the other.
+
+The queue is limited to MEALPLAN_JOB_QUEUE_LIMIT solves per worker, submitting
+more fails with PlanJobQueueFullError. A job that takes longer than
+MEALPLAN_JOB_TIMEOUT seconds to solve fails. The endpoints that answer with the
+meal plan wait for it at most MEALPLAN_JOB_GENERATE_WAIT seconds, then answer
+with the job id to poll for it, so a slow solve never holds a web worker past
+its request timeout.
+
+The generated plan is stored in the plan store under the job id, so a job that
+finished is found by every worker that shares the directory tier of the plan
+store, see plan_store.py.
+"""
+import collections
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+from cachetools import TTLCache
+
+from app.generate_meal_plan import meal_plan_request_key
+from app.plan_store import get_plan_store
+from app.solver_pool import SOLVER_POOL_SIZE, MealPlanTimeoutError, submit_to_solver_pool
+
+PLAN_JOB_QUEUE_LIMIT_ENV_VARIABLE = "MEALPLAN_JOB_QUEUE_LIMIT"
+PLAN_JOB_QUEUE_LIMIT = int(os.getenv(PLAN_JOB_QUEUE_LIMIT_ENV_VARIABLE, 8 * SOLVER_POOL_SIZE))
+PLAN_JOB_TIMEOUT_ENV_VARIABLE = "MEALPLAN_JOB_TIMEOUT"
+PLAN_JOB_TIMEOUT = int(os.getenv(PLAN_JOB_TIMEOUT_ENV_VARIABLE, 300))
+# Finished jobs are kept this many seconds for polling
+PLAN_JOB_TTL = 60 * 60
+PLAN_JOB_HISTORY_SIZE = 4096
+# Longest a poll for a job may wait for it to finish, in seconds
+MAX_PLAN_JOB_WAIT = 30
+# Seconds generate waits for a meal plan before it raises PlanJobPendingError,
+# below the 30 second request timeout of gunicorn
+PLAN_JOB_GENERATE_WAIT_ENV_VARIABLE = "MEALPLAN_JOB_GENERATE_WAIT"
+PLAN_JOB_GENERATE_WAIT = float(os.getenv(PLAN_JOB_GENERATE_WAIT_ENV_VARIABLE, 25))
+# Number of recent jobs the wait and solve time percentiles are taken over
+PLAN_JOB_METRICS_WINDOW = 1000
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class PlanJobQueueFullError(Exception):
+    """
+    Raised when a job is submitted while the queue holds PLAN_JOB_QUEUE_LIMIT
+    jobs.
+    """
+
+
+class PlanJobNotFoundError(KeyError):
+    """
+    Raised when there is no job with a job id.
+    """
+
+
+class PlanJobPendingError(Exception):
+    """
+    Raised when the meal plan of a job is not generated within the wait of
+    PlanJobs.generate. The job goes on and is polled for with its job id.
+    """
+
+    def __init__(self, job):
+        super().__init__(f"Meal plan job {job.job_id} has not finished")
+        self.job = job
+
+
+class InvalidPlanRequestError(ValueError):
+    """
+    Raised when a meal plan cannot be generated from the data of a request,
+    e.g. a field is missing or has the wrong type.
+    """
+
+
+def validate_plan_request(data):
+    """
+    Checks that the fields gen_meal_plan reads to tell requests apart are
+    present and of the right type.
+
+    :param data: dict, input of gen_meal_plan
+    :return: string, the meal_plan_request_key of data
+    :raises InvalidPlanRequestError: if they are not
+    """
+    try:
+        return meal_plan_request_key(data)
+    except (KeyError, TypeError, ValueError, AttributeError, OverflowError) as e:
+        raise InvalidPlanRequestError(
+            f"Invalid meal plan request, {type(e).__name__}: {e}") from e
+
+
+def _run_plan_job(data, timeout):
+    """
+    Runs in a pool worker. Returns the time the solve started and ended
+    together with the gen_meal_plan response, so the queue wait and solve time
+    of the job can be told apart.
+    """
+    from app.solver_pool import _gen_meal_plan_with_timeout
+
+    started = time.time()
+    response = _gen_meal_plan_with_timeout(data, timeout)
+    return started, time.time(), response
+
+
+class PlanJob:
+    """
+    A meal plan being generated. status is QUEUED until a pool worker starts
+    it, RUNNING while it is solved, then DONE with the meal plan in the plan
+    store or FAILED with the error.
+    """
+
+    def __init__(self, job_id, future, key):
+        self.job_id = job_id
+        # Shared by the jobs of identical requests
+        self.future = future
+        self.key = key
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        # Set once the result of the job is recorded
+        self.done = threading.Event()
+
+    @property
+    def status(self):
+        if not self.done.is_set():
+            return RUNNING if self.future.running() else QUEUED
+        return FAILED if self.error is not None else DONE
+
+    def to_dict(self):
+        """
+        Returns the job as sent to the frontend, with the meal plan once it is done.
+        """
+        job = {"job_id": self.job_id, "status": self.status}
+        if job["status"] == QUEUED or job["status"] == RUNNING:
+            return job
+        if self.error is not None:
+            job["error"] = self.error
+        else:
+            job["queue_wait"] = round(max(self.started - self.submitted, 0), 3)
+            job["solve_time"] = round(self.finished - self.started, 3)
+            job["meal_plan"] = get_plan_store().get(self.job_id)
+            if job["meal_plan"] is None:
+                job["status"] = FAILED
+                job["error"] = "Meal plan not found."
+        return job
+
+
+class PlanJobs:
+    """
+    The jobs of this worker. Jobs that have not finished are kept until they
+    do, finished jobs for PLAN_JOB_TTL seconds.
+    """
+
+    def __init__(self, queue_limit=PLAN_JOB_QUEUE_LIMIT, timeout=PLAN_JOB_TIMEOUT):
+        """
+        :param queue_limit: int, maximum number of solves that have not finished
+        :param timeout: float, seconds after which the solve of a job fails
+        """
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.pending = {}
+        # Future of the solve of every request key that has not finished
+        self.in_flight = {}
+        self.finished = TTLCache(maxsize=PLAN_JOB_HISTORY_SIZE, ttl=PLAN_JOB_TTL)
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.queue_waits = collections.deque(maxlen=PLAN_JOB_METRICS_WINDOW)
+        self.solve_times = collections.deque(maxlen=PLAN_JOB_METRICS_WINDOW)
+
+    def submit(self, data):
+        """
+        Submits a job generating the meal plan of data.
+
+        :param data: dict, input of gen_meal_plan
+        :return: PlanJob
+        :raises InvalidPlanRequestError: if data is not a valid request
+        :raises PlanJobQueueFullError: if queue_limit solves have not finished
+        """
+        key = validate_plan_request(data)
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.counts["coalesced"] += 1
+            elif len(self.in_flight) >= self.queue_limit:
+                self.counts["rejected"] += 1
+                raise PlanJobQueueFullError(
+                    f"{len(self.in_flight)} meal plans are already being generated")
+            else:
+                future = submit_to_solver_pool(_run_plan_job, data, self.timeout)
+                self.in_flight[key] = future
+            job = PlanJob(uuid.uuid4().hex, future, key)
+            self.pending[job.job_id] = job
+            self.counts["submitted"] += 1
+        # The callback runs at once if the job already finished
+        job.future.add_done_callback(lambda future: self._finish(job))
+        return job
+
+    def _finish(self, job):
+        """
+        Records the result of a job whose future is done. The meal plan is
+        stored in the plan store under the job id.
+        """
+        outcome = "done"
+        try:
+            job.started, job.finished, response = job.future.result()
+            # The response is shared with the jobs of identical requests
+            get_plan_store().put(dict(response, plan_id=job.job_id), job.job_id)
+        except Exception as e:
+            print(f"Meal plan job {job.job_id} failed:", e)
+            outcome = "timed_out" if isinstance(e, MealPlanTimeoutError) else "failed"
+            job.error = str(e)
+            job.finished = time.time()
+
+        with self.lock:
+            if self.in_flight.get(job.key) is job.future:
+                del self.in_flight[job.key]
+            self.pending.pop(job.job_id, None)
+            self.finished[job.job_id] = job
+            self.counts[outcome] += 1
+            if outcome == "done":
+                self.queue_waits.append(max(job.started - job.submitted, 0))
+                self.solve_times.append(job.finished - job.started)
+        job.done.set()
+
+    def generate(self, data, wait=PLAN_JOB_GENERATE_WAIT):
+        """
+        Generates the meal plan of data as a job and waits for it, for the
+        endpoints that answer with the meal plan.
+
+        :param data: dict, input of gen_meal_plan
+        :param wait: float, seconds to wait for the meal plan
+        :return: dict, the gen_meal_plan response with the plan_id it is stored under
+        :raises InvalidPlanRequestError: if data is not a valid request
+        :raises PlanJobQueueFullError: if queue_limit solves have not finished
+        :raises PlanJobPendingError: if the meal plan is not generated within wait
+        """
+        job = self.submit(data)
+        if not job.done.wait(wait):
+            raise PlanJobPendingError(job)
+        if job.error is not None:
+            # Raises the error of gen_meal_plan
+            job.future.result()
+        response = get_plan_store().get(job.job_id)
+        if response is None:
+            raise RuntimeError(job.error or "Meal plan not found.")
+        return response
+
+    def get(self, job_id, wait=0):
+        """
+        Returns the job with job_id as a dict, see PlanJob.to_dict. A job of
+        another worker is found once its meal plan is in the plan store.
+
+        :param job_id: string job id
+        :param wait: float, seconds to wait for the job to finish
+        :return: dict of the job
+        :raises PlanJobNotFoundError: if there is no job with job_id
+        """
+        with self.lock:
+            job = self.pending.get(job_id) or self.finished.get(job_id)
+        if job is None:
+            response = get_plan_store().get(job_id)
+            if response is None:
+                raise PlanJobNotFoundError(job_id)
+            return {"job_id": job_id, "status": DONE, "meal_plan": response}
+
+        if wait > 0:
+            job.done.wait(wait)
+        return job.to_dict()
+
+    def metrics(self):
+        """
+        Returns the number of jobs by outcome and the time jobs waited in the
+        queue and took to solve, in seconds, over the last
+        PLAN_JOB_METRICS_WINDOW jobs.
+        """
+        with self.lock:
+            metrics = {"queued": sum(job.status == QUEUED for job in self.pending.values()),
+                       "running": sum(job.status == RUNNING for job in self.pending.values()),
+                       "in_flight": len(self.in_flight),
+                       "queue_limit": self.queue_limit,
+                       "workers": SOLVER_POOL_SIZE,
+                       **{outcome: self.counts[outcome] for outcome in
+                          ["submitted", "coalesced", "rejected", "done", "failed", "timed_out"]}}
+            for name, times in [("queue_wait", self.queue_waits), ("solve_time", self.solve_times)]:
+                if times:
+                    p50, p95 = np.percentile(np.array(times), [50, 95])
+                    metrics[name] = {"p50": round(float(p50), 3), "p95": round(float(p95), 3),
+                                     "max": round(max(times), 3)}
+        return metrics
+
+
+_plan_jobs = None
+_plan_jobs_lock = threading.Lock()
+
+
+def get_plan_jobs():
+    """
+    Returns the meal plan jobs of this worker, creating them on first use.
+
+    :return: PlanJobs
+    """
+    global _plan_jobs
+    if _plan_jobs is None:
+        with _plan_jobs_lock:
+            if _plan_jobs is None:
+                _plan_jobs = PlanJobs()
+    return _plan_jobs
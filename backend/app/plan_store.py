@@ -0,0 +1,369 @@
+"""
+This file contains the store of generated meal plans. Every generated plan is
+kept under a plan id, so the plan edit endpoints can be called with the plan id
+instead of the whole plan, and answer with a JSON patch of the changes instead
+of the whole edited plan.
+
+The store has an in memory tier per worker with LRU eviction, and an optional
+directory tier that is shared by every worker on the machine and survives
+restarts. The directory tier is enabled by setting MEALPLAN_PLAN_STORE_PATH to
+the directory the plans are written to. With it, a plan in memory is only used
+while its file is unchanged, so every worker sees the edits of the others, and
+edits of a plan hold a file lock so no worker overwrites another's edit.
+
+Retention: the memory tier holds at most PLAN_STORE_SIZE bytes of plan JSON per
+worker and evicts the least recently used plans beyond that. The directory tier
+keeps a plan for MEALPLAN_PLAN_STORE_TTL seconds, a week by default, after it
+was last written, i.e. generated or edited. Every worker sweeps the directory
+at most every PLAN_STORE_SWEEP_INTERVAL seconds when it stores a plan, and
+removes the expired plans with their lock files and leftover temporary files.
+"""
+import contextlib
+import copy
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from cachetools import LRUCache
+
+# Maximum number of bytes of plan JSON kept in memory per worker. The plans
+# take a few times as much as Python objects
+PLAN_STORE_SIZE = 16 * 1024 * 1024
+# Number of locks the edits of the plans of a worker are spread over
+PLAN_EDIT_LOCKS = 64
+PLAN_STORE_PATH_ENV_VARIABLE = "MEALPLAN_PLAN_STORE_PATH"
+# Seconds a plan is kept in the directory tier after it was last written
+PLAN_STORE_TTL_ENV_VARIABLE = "MEALPLAN_PLAN_STORE_TTL"
+PLAN_STORE_TTL = int(os.getenv(PLAN_STORE_TTL_ENV_VARIABLE, 7 * 24 * 60 * 60))
+# Seconds between the sweeps of the directory tier of a worker
+PLAN_STORE_SWEEP_INTERVAL = 60 * 60
+# Plan ids are uuid4 hex strings, anything else is never looked up on disk
+PLAN_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class PlanNotFoundError(KeyError):
+    """
+    Raised when no plan is stored under a plan id.
+    """
+
+
+def _pointer(path, key):
+    """
+    Returns the JSON pointer of key inside the value at path.
+    """
+    return f"{path}/{str(key).replace('~', '~0').replace('/', '~1')}"
+
+
+def plan_patch(old, new, path=""):
+    """
+    Returns the JSON patch (RFC 6902) that changes old into new, for the kind of
+    changes the plan edits make. Dicts are compared key by key. Lists are
+    compared after their common start and end, so a replaced or removed recipe
+    or shopping list item gives a single operation. Dicts with different ids
+    are different recipes and are replaced as a whole.
+
+    :param old: JSON value before the edit
+    :param new: JSON value after the edit
+    :param path: JSON pointer of old and new
+    :return: list of patch operation dicts
+    """
+    if isinstance(old, dict) and isinstance(new, dict) and old.get("id") == new.get("id"):
+        patch = []
+        for key in old:
+            if key not in new:
+                patch.append({"op": "remove", "path": _pointer(path, key)})
+            else:
+                patch.extend(plan_patch(old[key], new[key], _pointer(path, key)))
+        for key in new:
+            if key not in old:
+                patch.append({"op": "add", "path": _pointer(path, key), "value": new[key]})
+        return patch
+
+    if isinstance(old, list) and isinstance(new, list):
+        start = 0
+        while start < min(len(old), len(new)) and old[start] == new[start]:
+            start += 1
+        end = 0
+        while (end < min(len(old), len(new)) - start
+               and old[len(old) - 1 - end] == new[len(new) - 1 - end]):
+            end += 1
+
+        old_middle = old[start:len(old) - end]
+        new_middle = new[start:len(new) - end]
+        patch = []
+        # Items at the same position are compared, the rest is removed or added
+        for index, (old_item, new_item) in enumerate(zip(old_middle, new_middle)):
+            patch.extend(plan_patch(old_item, new_item, _pointer(path, start + index)))
+        for _ in old_middle[len(new_middle):]:
+            patch.append({"op": "remove", "path": _pointer(path, start + len(new_middle))})
+        for index, new_item in enumerate(new_middle[len(old_middle):], len(old_middle)):
+            patch.append({"op": "add", "path": _pointer(path, start + index), "value": new_item})
+        return patch
+
+    if old == new and type(old) is type(new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+class PlanStore:
+    """
+    Two tier store of meal plans by plan id. Plans are copied on the way in and
+    out because callers modify them.
+
+    The memory tier keeps every plan together with the version of its file, see
+    _version, or None if there is no directory tier, and the size of its JSON.
+    """
+
+    def __init__(self, maxsize=PLAN_STORE_SIZE, path=None, ttl=PLAN_STORE_TTL):
+        """
+        :param maxsize: int, number of bytes of plan JSON kept in memory
+        :param path: string, directory the plans are written to, None for memory only
+        :param ttl: float, seconds a plan is kept in the directory after it was
+        last written
+        """
+        self.path = path
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize=maxsize, getsizeof=lambda entry: entry[2])
+        self.lock = threading.Lock()
+        self.edit_locks = [threading.Lock() for _ in range(PLAN_EDIT_LOCKS)]
+        self.last_sweep = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def _file(self, plan_id):
+        return os.path.join(self.path, f"{plan_id}.json")
+
+    def _version(self, plan_id):
+        """
+        Returns what tells the versions of the file of a plan apart, or None if
+        there is no file. Every write replaces the file, so its inode changes.
+        """
+        try:
+            stat = os.stat(self._file(plan_id))
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _remember(self, plan_id, plan, version, size):
+        """
+        Keeps a plan in the memory tier, unless it alone is larger than the tier.
+        """
+        with self.lock:
+            self.memory.pop(plan_id, None)
+            if size <= self.memory.maxsize:
+                self.memory[plan_id] = (plan, version, size)
+
+    @contextlib.contextmanager
+    def _edit_lock(self, plan_id):
+        """
+        Holds the lock of a plan for an edit, in this worker and, with the
+        directory tier, in every worker.
+        """
+        with self.edit_locks[hash(plan_id) % PLAN_EDIT_LOCKS]:
+            if self.path is None:
+                yield
+                return
+            with open(os.path.join(self.path, f"{plan_id}.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, plan_id):
+        """
+        Returns a copy of the plan stored under plan_id, or None if there is none.
+        """
+        if not isinstance(plan_id, str) or not PLAN_ID_PATTERN.match(plan_id):
+            return None
+        with self.lock:
+            entry = self.memory.get(plan_id)
+        if self.path is None:
+            return None if entry is None else copy.deepcopy(entry[0])
+
+        # Another worker may have written the plan since it was kept in memory
+        version = self._version(plan_id)
+        if entry is not None and entry[1] == version:
+            return copy.deepcopy(entry[0])
+        if version is None:
+            return None
+        try:
+            with open(self._file(plan_id), "r", encoding="utf-8") as f:
+                plan = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print("Plan store read failed:", e)
+            return None
+
+        self._remember(plan_id, plan, version, version[2])
+        return copy.deepcopy(plan)
+
+    def put(self, plan, plan_id=None):
+        """
+        Stores a copy of plan under plan_id, or under a new plan id.
+
+        :return: string plan id
+        """
+        if plan_id is None:
+            plan_id = uuid.uuid4().hex
+        plan = copy.deepcopy(plan)
+
+        try:
+            data = json.dumps(plan).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            print("Plan store write failed:", e)
+            data = b""
+
+        version = None
+        if self.path is not None and data:
+            try:
+                # Written to a temporary file first so readers never see half a plan
+                temporary = f"{self._file(plan_id)}.{uuid.uuid4().hex}.tmp"
+                with open(temporary, "wb") as f:
+                    f.write(data)
+                os.replace(temporary, self._file(plan_id))
+                version = self._version(plan_id)
+            except OSError as e:
+                print("Plan store write failed:", e)
+        self._remember(plan_id, plan, version, len(data))
+
+        if self.path is not None:
+            self._sweep_if_due()
+        return plan_id
+
+    def edit(self, plan_id, edit):
+        """
+        Applies edit to the plan stored under plan_id and stores the edited plan.
+        Edits of the same plan run one after another.
+
+        :param plan_id: string plan id
+        :param edit: function taking the plan and returning a dict with the edited
+        plan under "meal_plan", like the plan edit endpoints return
+        :return: the dict returned by edit with "meal_plan" replaced by "plan_id"
+        and the "patch" that turns the stored plan into the edited plan
+        :raises PlanNotFoundError: if no plan is stored under plan_id
+        """
+        if not isinstance(plan_id, str) or not PLAN_ID_PATTERN.match(plan_id):
+            raise PlanNotFoundError(plan_id)
+        # Checked before the lock so unknown plan ids leave no lock files behind
+        if self.path is not None and self._version(plan_id) is None:
+            raise PlanNotFoundError(plan_id)
+
+        with self._edit_lock(plan_id):
+            plan = self.get(plan_id)
+            if plan is None:
+                raise PlanNotFoundError(plan_id)
+
+            output_data = dict(edit(copy.deepcopy(plan)))
+            edited_plan = output_data.pop("meal_plan")
+            self.put(edited_plan, plan_id)
+        output_data["plan_id"] = plan_id
+        output_data["patch"] = plan_patch(plan, edited_plan)
+        return output_data
+
+    def _sweep_if_due(self):
+        """
+        Sweeps the directory tier if this worker did not for
+        PLAN_STORE_SWEEP_INTERVAL seconds.
+        """
+        now = time.time()
+        with self.lock:
+            if now - self.last_sweep < PLAN_STORE_SWEEP_INTERVAL:
+                return
+            self.last_sweep = now
+        try:
+            removed = self.sweep(now)
+        except OSError as e:
+            print("Plan store sweep failed:", e)
+            return
+        if removed:
+            print(f"Plan store sweep removed {removed} expired plans")
+
+    def _expire(self, plan_id, cutoff):
+        """
+        Removes the file and the lock file of a plan last written before
+        cutoff. A plan being edited is skipped, and an edit waiting for the
+        lock finds no plan once it gets the lock.
+
+        :return: boolean, True if the plan file was removed
+        """
+        lock_path = os.path.join(self.path, f"{plan_id}.lock")
+        with open(lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            version = self._version(plan_id)
+            try:
+                if version is not None and os.stat(self._file(plan_id)).st_mtime >= cutoff:
+                    return False
+                if version is not None:
+                    os.remove(self._file(plan_id))
+            except FileNotFoundError:
+                pass
+            os.remove(lock_path)
+        with self.lock:
+            self.memory.pop(plan_id, None)
+        return version is not None
+
+    def sweep(self, now=None):
+        """
+        Removes the plans last written more than ttl seconds before now from the
+        directory tier, together with lock files without a plan and temporary
+        files left by failed writes that are as old.
+
+        :param now: float, time in seconds since the epoch, defaults to the current time
+        :return: int, number of plans removed
+        """
+        if self.path is None:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.ttl
+        removed = 0
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                plan_id, extension = os.path.splitext(entry.name)
+                try:
+                    if entry.stat().st_mtime >= cutoff:
+                        continue
+                    if extension == ".tmp":
+                        os.remove(entry.path)
+                    elif extension in (".json", ".lock") and PLAN_ID_PATTERN.match(plan_id):
+                        removed += self._expire(plan_id, cutoff)
+                except FileNotFoundError:
+                    # Removed by the sweep of another worker
+                    continue
+        return removed
+
+    def clear(self):
+        """
+        Removes every plan from both tiers.
+        """
+        with self.lock:
+            self.memory.clear()
+        if self.path is not None:
+            for name in os.listdir(self.path):
+                if name.endswith((".json", ".lock")):
+                    os.remove(os.path.join(self.path, name))
+
+
+_plan_store = None
+_plan_store_lock = threading.Lock()
+
+
+def get_plan_store():
+    """
+    Returns the plan store of this worker, creating it on first use.
+
+    :return: PlanStore
+    """
+    global _plan_store
+    if _plan_store is None:
+        with _plan_store_lock:
+            if _plan_store is None:
+                _plan_store = PlanStore(path=os.getenv(PLAN_STORE_PATH_ENV_VARIABLE))
+    return _plan_store
@@ -1,10 +1,10 @@
-import csv
 import datetime
-import ast
 import json
 import pandas as pd
 
 from app.mealplan_service import read_recipe_assets_from_gcs
+from app.recipe_assets import get_recipe_assets
+from app.recipe_catalog import get_recipe_catalog
 
 
 # add optimized_snacks as input
@@ -366,66 +366,18 @@ def process_recipe(recipe_df, recipe_name):
     expects
     """
     recipe_row = recipe_df.loc[recipe_df['title'] == recipe_name]
-    res = {}
-    recipe_dict = {}
-    recipe_dict['carbohydrates'] = recipe_row['carbohydrates_g'].values[0]
-    recipe_dict['country'] = recipe_row['country'].values[0]
-    recipe_dict['fat'] = recipe_row['fats_total_g'].values[0]
-    recipe_dict['price'] = "N/A"
-    recipe_dict['protein'] = recipe_row['protein_g'].values[0]
-    recipe_dict['region'] = recipe_row['region'].values[0]
-    recipe_dict['title'] = recipe_row['title'].values[0]
-    recipe_dict['ingredients'] = recipe_row['ingredients'].values[0]
-    recipe_dict['calories'] = recipe_row['energy_kcal'].values[0]
-    recipe_dict['meal_slot'] = recipe_row['meal_slot'].values[0]
-    recipe_dict['id'] = recipe_row['number'].values[0]
-    recipe_dict['cook_time'] = recipe_row['cooktime'].values[0]
-    recipe_dict['prep_time'] = recipe_row['preptime'].values[0]
-    recipe_dict['sub_region'] = recipe_row['subregion'].values[0]
-
-    # retrive instructions
-
-    instruction_file_path = f'''./meal_db/instructions/instructions_{
-        recipe_dict['id']}.csv'''
-    ingredient_file_path = f"./meal_db/ingredients/{recipe_dict['id']}.csv"
-
-    # instruction_content = pd.read_csv(instruction_file_path)
-    # recipe_dict['instructions'] = instruction_content.values.tolist()
-
-    with open(instruction_file_path, newline='') as csvfile:
-        content = csv.reader(csvfile)
-        recipe_dict['instructions'] = []
-        for row in content:
-            recipe_dict['instructions'].append(row)
-
-    # retrive ingredients_with_quantities
-
-    # cannot use pandas here, will raise an error
-
-    with open(ingredient_file_path, newline='') as csvfile:
-        content = csv.reader(csvfile)
-        recipe_dict['ingredients_with_quantities'] = []
-        for row in content:
-            recipe_dict['ingredients_with_quantities'].append(row)
+    view = get_recipe_catalog().recipe_view(recipe_row['number'].values[0])
+
+    # retrive instructions and ingredients_with_quantities
+
+    instructions, ingredients_with_quantities = get_recipe_assets(view.id)
 
     #
      # retrive instructions from bucket => make sure to use this for production stage
-#     instructions, ingredients = read_recipe_assets_from_gcs(
-#     str(recipe_dict["id"]),
+#     instructions, ingredients_with_quantities = read_recipe_assets_from_gcs(
+#     str(view.id),
 #     bucket_name="meal-plan-data",         
 #     base_prefix="meal_db"                 
 # )
 
-#     recipe_dict['instructions'] = instructions
-#     recipe_dict['ingredients_with_quantities'] = ingredients        
-
-    for key, value in recipe_dict.items():
-        res[key] = f"{value}"
-
-    # Convert ingredients from a string to a list
-    res['ingredients'] = ast.literal_eval(res['ingredients'])
-    res['instructions'] = ast.literal_eval(res['instructions'])
-    res['ingredients_with_quantities'] = ast.literal_eval(
-        res['ingredients_with_quantities'])
-
-    return res
+    return view.to_dict(instructions, ingredients_with_quantities)
@@ -0,0 +1,153 @@
+"""
+This file contains the vectorized preference scoring engine used by
+apply_user_prefs. The ingredient lists of every recipe are tokenized once into a
+sparse recipe x ingredient matrix so that scoring a request only needs boolean
+and integer operations over whole columns instead of a Python loop per recipe.
+"""
+import re
+
+import numpy as np
+
+# Separator between the titles in PreferenceScorer.titles_text. It never occurs
+# in a title or a liked food, so a match cannot run across two titles.
+TITLE_SEPARATOR = "\0"
+
+
+def split_ingredients(ingredients):
+    """
+    Splits an ingredients string from the meal database into lower case
+    ingredient names. This must stay identical to the parsing done in
+    calculate_scores so that both produce the same scores.
+
+    :param ingredients: string of ingredients, e.g. "['salt', 'butter']"
+    :return: string list of lower case ingredients
+    """
+    return [ingredient.lower()
+            for ingredient in ingredients.strip("[]'").split("', '")]
+
+
+class PreferenceScorer:
+    """
+    Precomputed scoring structures for one recipes dataframe.
+
+    The recipe x ingredient matrix is stored in compressed sparse column form:
+    the recipes containing the ingredient with token id t are
+    recipe_rows[token_start[t]:token_start[t + 1]].
+    """
+
+    def __init__(self, recipes):
+        self.numbers = recipes["number"].to_numpy()
+        # Titles are joined into one string so that a liked food is found with a
+        # single substring search instead of one search per recipe
+        titles = recipes["title"].fillna("").str.lower().tolist()
+        self.titles_text = TITLE_SEPARATOR.join(titles)
+        self.title_starts = np.cumsum([0] + [len(title) + 1 for title in titles[:-1]])
+        self.countries = recipes["country"].fillna("").str.lower().to_numpy(dtype=str)
+
+        token_ids = {}
+        rows = []
+        tokens = []
+        for row, ingredients in enumerate(recipes["ingredients"].fillna("")):
+            # A recipe counts once per ingredient, like a list membership test
+            for ingredient in set(split_ingredients(ingredients)):
+                rows.append(row)
+                tokens.append(token_ids.setdefault(ingredient, len(token_ids)))
+
+        rows = np.asarray(rows, dtype=np.int64)
+        tokens = np.asarray(tokens, dtype=np.int64)
+        order = np.argsort(tokens, kind="stable")
+
+        self.token_ids = token_ids
+        self.recipe_rows = rows[order]
+        self.token_start = np.searchsorted(tokens[order],
+                                           np.arange(len(token_ids) + 1))
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def matches(self, recipes):
+        """
+        Returns True if the scorer was built for the rows of the given recipes
+        dataframe, in the same order.
+        """
+        return (len(recipes) == len(self.numbers) and
+                np.array_equal(recipes["number"].to_numpy(), self.numbers))
+
+    def recipes_with_ingredient(self, ingredient):
+        """
+        Returns the row positions of the recipes that list the ingredient.
+        """
+        token = self.token_ids.get(ingredient)
+        if token is None:
+            return self.recipe_rows[0:0]
+        return self.recipe_rows[self.token_start[token]:self.token_start[token + 1]]
+
+    def recipes_with_title_containing(self, food):
+        """
+        Returns a boolean array that is True for every recipe whose lower case
+        title contains food.
+        """
+        mask = np.zeros(len(self.numbers), dtype=bool)
+        if not food:
+            mask[:] = True
+            return mask
+        # Lookahead so that overlapping occurrences are found as well
+        positions = [match.start() for match in
+                     re.finditer(f"(?={re.escape(food)})", self.titles_text)]
+        rows = np.searchsorted(self.title_starts, positions, side="right") - 1
+        mask[rows] = True
+        return mask
+
+    def restriction_mask(self, restricted_ingredients):
+        """
+        Returns a boolean array that is True for every recipe containing at
+        least one of the restricted ingredients.
+        """
+        mask = np.zeros(len(self.numbers), dtype=bool)
+        for ingredient in restricted_ingredients:
+            mask[self.recipes_with_ingredient(ingredient)] = True
+        return mask
+
+    def restricted(self, diet_restrictions, religious_restrictions,
+                   restrictions_for_allergies):
+        """
+        Returns a boolean array that is True for every recipe the user cannot
+        eat because of their diet, religion or allergies.
+
+        :param restrictions_for_allergies: list of restricted ingredient lists,
+        one per allergy
+        """
+        restricted = self.restriction_mask(
+            [ingredient for allergy in restrictions_for_allergies
+             for ingredient in allergy])
+        restricted |= self.restriction_mask(diet_restrictions)
+        restricted |= self.restriction_mask(religious_restrictions)
+        return restricted
+
+    def score(self, fav_cuisines, diet_restrictions, religious_restrictions,
+              liked_foods, disliked_foods, restrictions_for_allergies):
+        """
+        Calculates the preference score of every recipe. The arguments are the
+        same, already lower cased, lists that calculate_scores receives and the
+        result is identical to applying calculate_scores to every row.
+
+        :return: numpy int64 array of scores aligned with the recipes rows
+        """
+        restricted = self.restricted(diet_restrictions, religious_restrictions,
+                                     restrictions_for_allergies)
+
+        scores = np.ones(len(self.numbers), dtype=np.int64)
+
+        # Favourite cuisines
+        scores += np.isin(self.countries, fav_cuisines)
+
+        # Liked foods are matched against the recipe title
+        for food in liked_foods:
+            scores += self.recipes_with_title_containing(food)
+
+        # Disliked foods are matched against the ingredient list
+        for food in disliked_foods:
+            scores[self.recipes_with_ingredient(food)] -= 1
+
+        scores[restricted] = 0
+        return scores
@@ -0,0 +1,96 @@
+"""
+This file contains the presolve stage of the meal plan optimization. Before the
+MealPlanModel is built, the candidate recipes that can never be part of the
+meal plan are removed, so the integer program has fewer variables:
+
+- recipes the user cannot eat because of their allergies, diet or religion
+- recipes the user excluded
+- recipes that are dominated by another recipe, i.e. duplicates, see
+  dominated_recipes
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from app.recipe_catalog import OPTIMIZER_MEAL_SLOTS
+
+# Number of candidate recipes before presolve, removed for each reason and kept
+PresolveStats = namedtuple("PresolveStats",
+                           ["candidates", "restricted", "excluded", "dominated", "kept"])
+
+
+def dominated_recipes(catalog, rows, objective, keep):
+    """
+    Returns the recipes that are dominated by another recipe: a recipe with the
+    same nutrients, the same meal slots and the same repetition limit, and at
+    least the same objective value. Such recipes are duplicates in the meal
+    database, choosing both of them would only get around the repetition limit
+    of the recipe. Of recipes with the same objective value the first one is
+    kept.
+
+    A better score does not make a recipe dominate one with a different
+    nutrient profile. Nutrients have lower and upper bounds, so more of a
+    nutrient can break an upper bound and less can break a lower one, and
+    either recipe may be the one a feasible plan needs. The same holds for the
+    meal slots, whose counts are bounded both ways too.
+
+    :param catalog: RecipeCatalog the recipes are taken from
+    :param rows: numpy int array, catalog rows of the candidate recipes
+    :param objective: numpy array, objective value of each candidate recipe
+    :param keep: numpy boolean array, candidates that are not removed yet
+    :return: numpy boolean array aligned with rows
+    """
+    dominated = np.zeros(len(rows), dtype=bool)
+    candidates = np.flatnonzero(keep)
+    if len(candidates) < 2:
+        return dominated
+
+    candidate_rows = rows[candidates]
+    profile = np.hstack([
+        catalog.nutrient_matrix[candidate_rows].astype(np.float64),
+        np.column_stack([catalog.slot_masks[slot][candidate_rows]
+                         for slot in OPTIMIZER_MEAL_SLOTS]),
+        catalog.repetition_limits[candidate_rows, None],
+    ])
+    _, groups = np.unique(profile, axis=0, return_inverse=True)
+    groups = groups.reshape(-1)
+
+    # Best objective first, the first candidate first among equal objectives
+    order = np.lexsort((candidates, -objective[candidates], groups))
+    first_of_group = np.ones(len(order), dtype=bool)
+    first_of_group[1:] = groups[order[1:]] != groups[order[:-1]]
+    dominated[candidates[order[~first_of_group]]] = True
+    return dominated
+
+
+def presolve(catalog, rows, objective, exclude=(), restricted=None):
+    """
+    Removes the candidate recipes that can never be part of the meal plan.
+
+    :param catalog: RecipeCatalog the recipes are taken from
+    :param rows: numpy int array, catalog rows of the candidate recipes
+    :param objective: numpy array, objective value of each candidate recipe
+    :param exclude: list of recipe numbers that must not be selected
+    :param restricted: numpy boolean array aligned with rows, recipes the user
+    cannot eat, None if there are none
+    :return: (rows, objective, PresolveStats) of the remaining candidates
+    """
+    objective = np.asarray(objective, dtype=np.float64)
+    keep = np.ones(len(rows), dtype=bool)
+    if restricted is not None:
+        keep &= ~np.asarray(restricted, dtype=bool)
+    restricted_count = len(rows) - int(keep.sum())
+
+    numbers = catalog.recipes["number"].to_numpy()[rows]
+    excluded = keep & np.isin(numbers, [int(recipe) for recipe in exclude])
+    keep &= ~excluded
+
+    dominated = dominated_recipes(catalog, rows, objective, keep)
+    keep &= ~dominated
+
+    stats = PresolveStats(len(rows), restricted_count, int(excluded.sum()),
+                          int(dominated.sum()), int(keep.sum()))
+    print(f"Presolve kept {stats.kept} of {stats.candidates} recipes: "
+          f"{stats.restricted} restricted, {stats.excluded} excluded, "
+          f"{stats.dominated} dominated")
+    return rows[keep], objective[keep], stats
@@ -0,0 +1,179 @@
+"""
+This file contains the cache of recipe assets, i.e. the instructions and the
+ingredients with quantities of a recipe. Every recipe has its own CSV file for
+each of them, in the meal database on disk or in the meal-plan-data bucket, and
+post processing a meal plan used to open two files for every recipe in it.
+
+The assets are parsed once into lists of rows and kept in an LRU cache keyed by
+recipe id. The cache is bounded by the number of characters it holds, so it
+fits the whole meal database but cannot grow without limit if the database
+does. preload_recipe_assets reads every recipe of the catalog at startup.
+"""
+import csv
+import threading
+
+from cachetools import LRUCache
+
+from app.recipe_catalog import get_recipe_catalog
+
+RECIPE_ASSET_DIRECTORY = "./meal_db"
+# Maximum number of characters of all cached assets together
+RECIPE_ASSET_CACHE_SIZE = 16 * 1024 * 1024
+# Characters counted for every row on top of its cells, for the list overhead
+ROW_SIZE_OVERHEAD = 16
+
+
+def assets_size(assets):
+    """
+    Returns the size of the assets of a recipe as counted by the cache.
+
+    :param assets: tuple of the instruction rows and the ingredient rows
+    :return: int
+    """
+    return sum(ROW_SIZE_OVERHEAD + sum(len(cell) for cell in row)
+               for rows in assets for row in rows)
+
+
+def copy_assets(assets):
+    """
+    Returns a copy of the assets that callers can modify without changing the
+    cached lists.
+    """
+    instructions, ingredients = assets
+    return [list(row) for row in instructions], [list(row) for row in ingredients]
+
+
+def read_csv_rows(path, **open_kwargs):
+    """
+    Returns the rows of a CSV file as lists of strings.
+    """
+    with open(path, newline='', **open_kwargs) as csvfile:
+        return [row for row in csv.reader(csvfile)]
+
+
+def read_local_recipe_assets(recipe_id):
+    """
+    Reads the instructions and the ingredients with quantities of a recipe
+    from the meal database on disk.
+
+    :param recipe_id: recipe number
+    :return: tuple of the instruction rows and the ingredient rows
+    """
+    instructions = read_csv_rows(
+        f"{RECIPE_ASSET_DIRECTORY}/instructions/instructions_{recipe_id}.csv",
+        encoding='utf-8', errors='replace')
+    # cannot use pandas here, will raise an error
+    ingredients = read_csv_rows(f"{RECIPE_ASSET_DIRECTORY}/ingredients/{recipe_id}.csv")
+    return instructions, ingredients
+
+
+class RecipeAssetCache:
+    """
+    LRU cache of parsed recipe assets. Assets are loaded on a miss by the
+    loader passed to get, and copied on the way out because callers modify
+    them.
+    """
+
+    def __init__(self, maxsize=RECIPE_ASSET_CACHE_SIZE):
+        """
+        :param maxsize: int, maximum number of characters of all cached assets
+        """
+        self.assets = LRUCache(maxsize=maxsize, getsizeof=assets_size)
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        """
+        Returns a copy of the assets stored under key, loading them with loader
+        if they are not cached.
+
+        :param key: hashable, identifies the recipe and where it is stored
+        :param loader: function without arguments that returns the assets,
+        exceptions it raises are passed on and nothing is cached
+        :return: tuple of the instruction rows and the ingredient rows
+        """
+        with self.lock:
+            assets = self.assets.get(key)
+        if assets is None:
+            assets = loader()
+            self.put(key, assets)
+        return copy_assets(assets)
+
+    def put(self, key, assets):
+        """
+        Stores the assets under key, unless they alone exceed the cache size.
+        """
+        with self.lock:
+            try:
+                self.assets[key] = assets
+            except ValueError:
+                print(f"Recipe assets {key} are too large to be cached")
+
+    def __len__(self):
+        with self.lock:
+            return len(self.assets)
+
+    def clear(self):
+        """
+        Removes all assets from the cache.
+        """
+        with self.lock:
+            self.assets.clear()
+
+
+_recipe_asset_cache = None
+_recipe_asset_cache_lock = threading.Lock()
+
+
+def get_recipe_asset_cache():
+    """
+    Returns the recipe asset cache of this worker, creating it on first use.
+
+    :return: RecipeAssetCache
+    """
+    global _recipe_asset_cache
+    if _recipe_asset_cache is None:
+        with _recipe_asset_cache_lock:
+            if _recipe_asset_cache is None:
+                _recipe_asset_cache = RecipeAssetCache()
+    return _recipe_asset_cache
+
+
+def get_recipe_assets(recipe_id):
+    """
+    Returns the instructions and the ingredients with quantities of a recipe
+    from the meal database on disk.
+
+    :param recipe_id: recipe number
+    :return: tuple of the instruction rows and the ingredient rows, each row a
+    list of strings
+    """
+    return get_recipe_asset_cache().get(
+        ("local", str(recipe_id)), lambda: read_local_recipe_assets(recipe_id))
+
+
+def preload_recipe_assets(recipe_ids=None):
+    """
+    Reads the assets of many recipes into the cache at once, e.g. at startup.
+    Recipes without asset files are skipped, they fail when they are used.
+
+    :param recipe_ids: list of recipe numbers, None for every recipe of the
+    catalog
+    :return: int, number of recipes whose assets were loaded
+    """
+    if recipe_ids is None:
+        recipe_ids = get_recipe_catalog().recipes["number"].tolist()
+
+    cache = get_recipe_asset_cache()
+    loaded = 0
+    missing = 0
+    for recipe_id in recipe_ids:
+        try:
+            assets = read_local_recipe_assets(recipe_id)
+        except FileNotFoundError:
+            missing += 1
+            continue
+        cache.put(("local", str(recipe_id)), assets)
+        loaded += 1
+
+    print(f"Preloaded the assets of {loaded} recipes, {missing} recipes have no asset files")
+    return loaded
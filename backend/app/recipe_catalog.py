@@ -0,0 +1,403 @@
+"""
+This file contains the process wide recipe catalog. The meal database CSV is
+parsed once per worker and the resulting catalog is shared, read-only, by every
+request that needs recipe information. The catalog reloads itself only when the
+modification time of the CSV file changes.
+"""
+import ast
+import os
+import threading
+from dataclasses import dataclass, fields
+
+import numpy as np
+import pandas as pd
+
+from app.preference_scoring import PreferenceScorer
+
+MEAL_DATABASE_PATH = "./meal_db/meal_database.csv"
+
+# Columns that hold text. Every other column in the meal database is numeric.
+TEXT_COLUMNS = ["meal_type", "meal_slot", "title", "region", "subregion",
+                "country", "cooktime", "preptime", "ingredients",
+                "individual_ingredient_costs"]
+
+# Integer columns. The remaining numeric columns are parsed as floats.
+INTEGER_COLUMNS = ["number", "sports_build_muscle_score",
+                   "fight_heart_disease_score", "fight_diabetes_score",
+                   "fight_cancer_score", "lose_weight_score"]
+
+SNACK_MEAL_SLOT = "['snack']"
+
+# Meal slots the optimizer places constraints on. A recipe belongs to a slot if
+# the slot name occurs in its meal_slot string.
+OPTIMIZER_MEAL_SLOTS = ["breakfast", "lunch", "main", "side", "snack"]
+
+# A recipe may be repeated in a meal plan until it adds up to CALORIE_CAP
+# calories. Recipes with more than CALORIE_CAP or at most MIN_CALORIE_CAP
+# calories can only be selected once.
+CALORIE_CAP = 400
+MIN_CALORIE_CAP = 100
+
+# Columns that are not used by the optimizer and are empty for every recipe.
+# They are ignored when deciding whether a recipe has complete information.
+UNUSED_COLUMNS = ["ingredients_with_quantities", "cooking instructions"]
+
+# Nutrient names used by the meal plan optimizer mapped to the meal database
+# columns they are read from. The order defines the columns of
+# RecipeCatalog.nutrient_matrix.
+NUTRIENT_COLUMNS = {
+    "Calories": "energy_kcal",
+    "kj": "energy_kj",
+    "fibre": "fibre_g",
+    "carbohydrates": "carbohydrates_g",
+    "starch": "starch_g",
+    "cholesterol": "cholesterol_mg",
+    "protein": "protein_g",
+    "fats_total": "fats_total_g",
+    "trans_fats": "fatty_acids_total_trans_g",
+    "vitamin_A": "vitamin_A_iu",
+    "thiamin": "thiamin_mg",
+    "riboflavin": "riboflavin_mg",
+    "niacin": "niacin_mg",
+    "vitamin_B5": "vitamin_B5_pantothenic_acid_mg",
+    "vitamin_B6": "vitamin_B6_mg",
+    "vitamin_B12_added": "vitamin B12_added_ug",
+    "vitamin_B12": "vitamin_B12_ug",
+    "folate_total": "folate_total_ug",
+    "folic_acid": "folic_acid_g",
+    "vitamin_C": "vitamin_C_total_ascorbic_acid_mg",
+    "vitamin_D": "vitiamin_D_IU",
+    "vitamin_E": "vitamin_E_alphatocopherol_mg",
+    "vitamin_E_added": "vitamin_E_added_mg",
+    "vitamin_K": "vitamin_K_phylloquinone_ug",
+    "choline": "choline_mg",
+    "carotene_a": "carotene_alpha_g",
+    "carotene_b": "carotene_beta_g",
+    "calcium": "calcium_mg",
+    "phosphorus": "phosphorus_mg",
+    "potassium": "potassium_mg",
+    "magnesium": "magnesium_mg",
+    "sodium": "sodium_mg",
+    "iron": "iron_mg",
+    "copper": "copper_mg",
+    "zinc": "zinc_mg",
+    "manganese": "manganese_mg",
+    "selenium": "selenium_ug",
+    "fluoride": "fluoride_mg",
+}
+
+# Nutrient names of the tableData of a meal plan mapped to the meal database
+# columns they are read from, in the order of the tableData rows. The order
+# defines the columns of RecipeCatalog.table_nutrient_matrix.
+TABLE_NUTRIENT_COLUMNS = {
+    "energy (calories)": "energy_kcal",
+    "fiber (g)": "fibre_g",
+    "carbohydrates (g)": "carbohydrates_g",
+    "protein (g)": "protein_g",
+    "fats (g)": "fats_total_g",
+    "calcium (mg)": "calcium_mg",
+    "sodium (mg)": "sodium_mg",
+    "copper (mg)": "copper_mg",
+    "fluoride (mg)": "fluoride_mg",
+    "iron (mg)": "iron_mg",
+    "magnesium (mg)": "magnesium_mg",
+    "manganese (mg)": "manganese_mg",
+    "potassium (mg)": "potassium_mg",
+    "selenium (ug)": "selenium_ug",
+    "zinc (mg)": "zinc_mg",
+    "vitamin_a (iu)": "vitamin_A_iu",
+    "thiamin (mg)": "thiamin_mg",
+    "riboflavin (mg)": "riboflavin_mg",
+    "niacin (mg)": "niacin_mg",
+    "vitamin_b5 (mg)": "vitamin_B5_pantothenic_acid_mg",
+    "vitamin_b6 (mg)": "vitamin_B6_mg",
+    "vitamin_b12 (ug)": "vitamin_B12_ug",
+    "folate (ug)": "folate_DFE_ug",
+    "vitamin_c (mg)": "vitamin_C_total_ascorbic_acid_mg",
+    "vitamin_d (iu)": "vitiamin_D_IU",
+    "vitamin_e (mg)": "vitamin_E_alphatocopherol_mg",
+    "choline (mg)": "choline_mg",
+    "vitamin_k (ug)": "vitamin_K_phylloquinone_ug",
+}
+
+
+def parse_meal_slot(meal_slot):
+    """
+    Splits a meal_slot string such as "['snack', 'side']" into a tuple of slot
+    names. The meal database is not consistent with its quoting, e.g.
+    "['side','snack]", so the string is split by hand rather than evaluated.
+
+    :param meal_slot: string of meal slots as stored in the meal database
+    :return: tuple of slot names, e.g. ('snack', 'side')
+    """
+    if not isinstance(meal_slot, str):
+        return ()
+    slots = [slot.strip().strip("'") for slot in meal_slot.strip('"[]').split(',')]
+    return tuple(slot for slot in slots if slot)
+
+
+def parse_ingredients(ingredients):
+    """
+    Parses an ingredients string such as "['egg', 'milk']" into a list.
+
+    :param ingredients: string of ingredients as stored in the meal database
+    :return: list of ingredient names, None if the recipe has no ingredients
+    """
+    if not isinstance(ingredients, str):
+        return None
+    return ast.literal_eval(ingredients)
+
+
+def json_value(value, convert):
+    """
+    Converts a value of the meal database to a JSON compatible type, missing
+    values become None.
+    """
+    if pd.isnull(value):
+        return None
+    return convert(value)
+
+
+@dataclass(slots=True)
+class RecipeView:
+    """
+    The recipe fields that a meal plan shows for every recipe, with the types
+    they are serialized to JSON with. Missing values are None.
+    """
+    carbohydrates: float
+    country: str
+    fat: float
+    price: str
+    protein: float
+    region: str
+    title: str
+    ingredients: list
+    calories: float
+    meal_slot: str
+    id: int
+    cook_time: str
+    prep_time: str
+    sub_region: str
+
+    def to_dict(self, instructions, ingredients_with_quantities):
+        """
+        Returns the recipe in the format of the recipes in a meal plan response.
+
+        :param instructions: list of instruction rows of the recipe
+        :param ingredients_with_quantities: list of ingredient rows of the recipe
+        :return: dict
+        """
+        recipe = {field.name: getattr(self, field.name) for field in fields(self)}
+        if self.ingredients is not None:
+            recipe['ingredients'] = list(self.ingredients)
+        recipe['instructions'] = instructions
+        recipe['ingredients_with_quantities'] = ingredients_with_quantities
+        return recipe
+
+
+def recipe_views(recipes, ingredient_lists):
+    """
+    Builds the RecipeView of every recipe.
+
+    :param recipes: pandas dataframe of recipes
+    :param ingredient_lists: parsed ingredients of every recipe
+    :return: list of RecipeView aligned with the rows of recipes
+    """
+    columns = ["carbohydrates_g", "country", "fats_total_g", "protein_g", "region",
+               "title", "energy_kcal", "meal_slot", "number", "cooktime",
+               "preptime", "subregion"]
+    views = []
+    for row, ingredients in zip(recipes[columns].itertuples(index=False, name=None),
+                                ingredient_lists):
+        (carbohydrates, country, fat, protein, region, title, calories, meal_slot,
+         number, cook_time, prep_time, sub_region) = row
+        views.append(RecipeView(
+            carbohydrates=json_value(carbohydrates, float),
+            country=json_value(country, str),
+            fat=json_value(fat, float),
+            price="N/A",
+            protein=json_value(protein, float),
+            region=json_value(region, str),
+            title=json_value(title, str),
+            ingredients=ingredients,
+            calories=json_value(calories, float),
+            meal_slot=json_value(meal_slot, str),
+            id=int(number),
+            cook_time=json_value(cook_time, str),
+            prep_time=json_value(prep_time, str),
+            sub_region=json_value(sub_region, str),
+        ))
+    return views
+
+
+def read_meal_database(path=MEAL_DATABASE_PATH):
+    """
+    Reads the meal database CSV with explicit column types.
+
+    :param path: path to the meal database CSV
+    :return: pandas dataframe of recipes
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {}
+    for column in header:
+        if column in TEXT_COLUMNS:
+            dtypes[column] = "object"
+        elif column in INTEGER_COLUMNS:
+            dtypes[column] = "int64"
+        else:
+            dtypes[column] = "float64"
+
+    return pd.read_csv(path, dtype=dtypes)
+
+
+def repetition_limits(calories):
+    """
+    Calculates how many times each recipe may be selected in a meal plan.
+
+    :param calories: pandas series of recipe calories
+    :return: numpy int array of repetition limits
+    """
+    calories = calories.to_numpy(dtype=np.float64)
+    limits = np.ones(len(calories), dtype=np.int64)
+    capped = (calories < CALORIE_CAP) & (calories > MIN_CALORIE_CAP)
+    limits[capped] = (CALORIE_CAP / calories[capped]).astype(np.int64)
+    return limits
+
+
+class RecipeCatalog:
+    """
+    Read-only, in memory representation of the meal database.
+
+    recipes is shared between requests and must not be modified. Callers that
+    need to add columns (e.g. the preference score) must work on
+    copy_recipes() instead.
+    """
+
+    def __init__(self, path=MEAL_DATABASE_PATH):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.recipes = read_meal_database(path)
+
+        # Row position of every recipe keyed by its recipe number
+        self.position_by_number = {
+            number: position
+            for position, number in enumerate(self.recipes["number"])
+        }
+
+        # Meal slots split once into tuples, aligned with the rows of recipes
+        self.meal_slots = [parse_meal_slot(meal_slot)
+                           for meal_slot in self.recipes["meal_slot"]]
+
+        self.snack_recipes = self.recipes[
+            self.recipes["meal_slot"] == SNACK_MEAL_SLOT]
+
+        # Recipes x nutrients matrix, columns ordered like NUTRIENT_COLUMNS
+        self.nutrient_index = {name: column
+                               for column, name in enumerate(NUTRIENT_COLUMNS)}
+        self.nutrient_matrix = self.recipes[
+            list(NUTRIENT_COLUMNS.values())].to_numpy(dtype=np.float32)
+
+        # Recipes x tableData nutrients, columns ordered like TABLE_NUTRIENT_COLUMNS.
+        # Kept in float64 so plan edits add exactly the values of the database.
+        self.table_nutrient_index = {name: column
+                                     for column, name in enumerate(TABLE_NUTRIENT_COLUMNS)}
+        self.table_nutrient_matrix = self.recipes[
+            list(TABLE_NUTRIENT_COLUMNS.values())].to_numpy(dtype=np.float64)
+
+        # Recipes with no missing values. Only these can be used by the optimizer.
+        self.complete_rows = self.recipes.drop(
+            columns=UNUSED_COLUMNS).notna().all(axis=1).to_numpy()
+
+        # Slot membership of every recipe, one boolean array per optimizer slot
+        meal_slots = self.recipes["meal_slot"].fillna("")
+        self.slot_masks = {slot: meal_slots.str.contains(slot).to_numpy()
+                           for slot in OPTIMIZER_MEAL_SLOTS}
+
+        self.repetition_limits = repetition_limits(self.recipes["energy_kcal"])
+
+        # Ingredients parsed once into lists and the meal plan view of every
+        # recipe, aligned with the rows of recipes
+        self.ingredient_lists = [parse_ingredients(ingredients)
+                                 for ingredients in self.recipes["ingredients"]]
+        self.views = recipe_views(self.recipes, self.ingredient_lists)
+
+        # Ingredient matrix used to score user preferences
+        self.preference_scorer = PreferenceScorer(self.recipes)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def __contains__(self, number):
+        return int(number) in self.position_by_number
+
+    def copy_recipes(self):
+        """
+        Returns a private copy of the recipes dataframe that the caller is free
+        to modify.
+        """
+        return self.recipes.copy()
+
+    def position(self, number):
+        """
+        Returns the row position of the recipe with the given number, or None if
+        the catalog does not contain it.
+        """
+        return self.position_by_number.get(int(number))
+
+    def positions(self, numbers):
+        """
+        Returns the row positions of the recipes with the given numbers.
+
+        :param numbers: iterable of recipe numbers that are all in the catalog
+        :return: numpy int array of row positions
+        """
+        return np.fromiter((self.position_by_number[int(number)] for number in numbers),
+                           dtype=np.int64)
+
+    def recipe_row(self, number):
+        """
+        Returns the single row dataframe for the recipe with the given number.
+        The dataframe is empty if the catalog does not contain the recipe, which
+        mirrors recipe_df.loc[recipe_df['number'] == number].
+        """
+        position = self.position(number)
+        if position is None:
+            return self.recipes.iloc[0:0]
+        return self.recipes.iloc[position:position + 1]
+
+    def recipe_view(self, number):
+        """
+        Returns the RecipeView of the recipe with the given number, or None if
+        the catalog does not contain it.
+        """
+        position = self.position(number)
+        if position is None:
+            return None
+        return self.views[position]
+
+    def is_stale(self):
+        """
+        Returns True if the meal database on disk changed since it was loaded.
+        """
+        return os.path.getmtime(self.path) != self.mtime
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_recipe_catalog():
+    """
+    Returns the recipe catalog of this worker, loading it on first use and
+    reloading it whenever the meal database file changes.
+
+    :return: RecipeCatalog
+    """
+    global _catalog
+    catalog = _catalog
+    if catalog is None or catalog.is_stale():
+        with _catalog_lock:
+            if _catalog is None or _catalog.is_stale():
+                _catalog = RecipeCatalog(MEAL_DATABASE_PATH)
+            catalog = _catalog
+    return catalog
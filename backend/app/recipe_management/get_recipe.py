@@ -4,13 +4,16 @@ Provides logic for retrieving a specific recipe's details by its ID.
 @author: BCIT May 2025
 """
 
-from flask import jsonify
-from app.recipe_management.load_data import recipes
+from flask import jsonify, make_response, request
+from app.recipe_management import load_data
 
 def get_recipe_logic(recipe_id):
     """
     Retrieve a recipe's detailed information by its unique recipe ID.
 
+    The response body is precomputed when the recipes are loaded and sent with an ETag, so a client
+    that already has the recipe gets an empty 304 response.
+
     Args:
         recipe_id (int): The unique numeric ID of the recipe to retrieve.
 
@@ -18,15 +21,14 @@ def get_recipe_logic(recipe_id):
         Response: A Flask JSON response containing the recipe details if found,
                   or a 404 error JSON response if not found.
     """
-    recipe = next((r for r in recipes if int(r.get('number', 0)) == recipe_id), None)
-    if recipe:
-        return jsonify({
-            'id': int(recipe.get('number', 0)),
-            'title': recipe.get('title', ''),
-            'calories': float(recipe.get('energy_kcal', 0)),
-            'region': recipe.get('region', ''),
-            'prep_time': recipe.get('preptime', ''),
-            'ingredients': recipe.get('ingredients', ''),
-            'instructions': recipe.get('instructions', '')
-        })
-    return jsonify({'error': 'Recipe not found'}), 404
+    detail = load_data.recipe_details.get(recipe_id)
+    if detail is None:
+        return jsonify({'error': 'Recipe not found'}), 404
+
+    body, etag = detail
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.set_etag(etag)
+    # Clients may keep the recipe but have to revalidate it, the meal database can change
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
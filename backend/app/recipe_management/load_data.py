@@ -5,18 +5,75 @@ Handles loading recipe data from a CSV file into an in-memory global variable.
 """
 
 import csv
+import hashlib
+import json
+
+from app.recipe_management.search_index import RecipeSearchIndex
 
 recipes = []
+# Recipes keyed by their number, the first recipe wins if a number repeats
+recipes_by_id = {}
+# Recipe detail responses keyed by recipe number, as (JSON bytes, ETag)
+recipe_details = {}
+search_index = RecipeSearchIndex([])
+
+def recipe_detail(recipe):
+    """
+    Builds the response body of the recipe detail endpoint for a recipe.
+
+    Args:
+        recipe (dict): Recipe as read from the meal database CSV.
+
+    Returns:
+        tuple: The JSON body as bytes and its ETag.
+
+    Raises:
+        ValueError: If the recipe has an invalid number or calorie value.
+    """
+    body = json.dumps({
+        'id': int(recipe.get('number', 0)),
+        'title': recipe.get('title', ''),
+        'calories': float(recipe.get('energy_kcal', 0)),
+        'region': recipe.get('region', ''),
+        'prep_time': recipe.get('preptime', ''),
+        'ingredients': recipe.get('ingredients', ''),
+        'instructions': recipe.get('instructions', '')
+    }, sort_keys=True, separators=(',', ':')).encode() + b'\n'
+    return body, hashlib.sha1(body).hexdigest()
+
+def index_recipes(recipes):
+    """
+    Builds the lookups by recipe number and the precomputed detail responses.
+    Recipes with an invalid number or calorie value are left out.
+
+    Args:
+        recipes (list): Recipe dicts as read from the meal database CSV.
+
+    Returns:
+        tuple: The recipes_by_id and recipe_details dicts.
+    """
+    by_id = {}
+    details = {}
+    for recipe in recipes:
+        try:
+            number = int(recipe.get('number', 0))
+            if number not in by_id:
+                details[number] = recipe_detail(recipe)
+                by_id[number] = recipe
+        except ValueError:
+            continue
+    return by_id, details
 
 def load_recipe_data():
     """
     Load all recipes from the `meal_database.csv` file into the global `recipes` list.
 
-    This function reads the CSV into a list of dictionaries, where each dictionary represents a recipe.
+    This function reads the CSV into a list of dictionaries, where each dictionary represents a recipe,
+    and builds the lookups by recipe number, the recipe detail responses and the search index over them.
 
     If an error occurs while reading the file, it will log the error and reset `recipes` to an empty list.
     """
-    global recipes
+    global recipes, recipes_by_id, recipe_details, search_index
     try:
         with open('./meal_db/meal_database.csv', 'r', encoding='utf-8-sig') as f:
             reader = csv.DictReader(f)
@@ -25,6 +82,8 @@ def load_recipe_data():
     except Exception as e:
         print(f"Error loading meal_database.csv: {e}")
         recipes = []
+    recipes_by_id, recipe_details = index_recipes(recipes)
+    search_index = RecipeSearchIndex(recipes)
 
 # Load recipes immediately on module import
 load_recipe_data()
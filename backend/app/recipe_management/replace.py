@@ -4,62 +4,90 @@ Provides logic for replacing a recipe in a meal plan and updating nutritional va
 @author: BCIT May 2025
 """
 
-import pandas as pd
-import ast
-import time
 from flask import jsonify
-from app.generate_meal_plan import gen_shopping_list, insert_status_nutrient_info
+from app.generate_meal_plan import update_shopping_list
 from app.find_matched_recipe_and_update import update_nutrition_values
+from app.plan_store import PlanNotFoundError, get_plan_store
+from app.recipe_assets import get_recipe_assets
+from app.recipe_catalog import get_recipe_catalog
+
+def replace_recipe(meal_plan, id, day_index, recipe_index):
+    """
+    Replace a recipe in a specific position of a meal plan and update nutritional totals.
+
+    Args:
+        meal_plan (dict): The current meal plan data structure, which is modified.
+        id (int): ID of the new recipe.
+        day_index (int): Index of the day in the meal plan.
+        recipe_index (int): Index of the recipe within the day's recipe list.
+
+    Returns:
+        dict: The updated meal plan under "meal_plan" and the new recipe ID under "id_replaced".
+
+    Raises:
+        ValueError: If the new recipe is not found.
+    """
+    catalog = get_recipe_catalog()
+
+    old_recipe = meal_plan["days"][day_index]["recipes"].pop(recipe_index)
+    new_recipe_view = catalog.recipe_view(id)
+
+    if new_recipe_view is None:
+        raise ValueError("New recipe not found.")
+
+    try:
+        instructions, ingredients_with_quantities = get_recipe_assets(new_recipe_view.id)
+    except FileNotFoundError:
+        instructions, ingredients_with_quantities = [], []
+
+    new_recipe = new_recipe_view.to_dict(instructions, ingredients_with_quantities)
+    new_recipe["meal_name"] = old_recipe["meal_name"]
+
+    meal_plan["days"][day_index]["recipes"].insert(recipe_index, new_recipe)
+    meal_plan = update_nutrition_values(meal_plan, removed=[old_recipe], added=[new_recipe])
+    meal_plan = update_shopping_list(meal_plan, removed=[old_recipe], added=[new_recipe])
+
+    return {"meal_plan": meal_plan, "id_replaced": new_recipe["id"]}
+
 
 def replace_recipe_logic(data):
     """
     Replace a recipe in a specific position of a meal plan and update nutritional totals.
 
+    The meal plan is either sent in full, or referenced by the plan_id it was stored under when it was
+    generated. For a stored plan only the changes are returned, as a JSON patch.
+
     Args:
         data (dict): JSON request payload containing:
-            - meal_plan (dict): The current meal plan data structure.
+            - meal_plan (dict): The current meal plan data structure, or
+            - plan_id (str): The ID of the stored meal plan.
             - recipe_id (dict): The new recipe ID dictionary with key 'id'.
             - day_index (int): Index of the day in the meal plan.
             - recipe_index (int): Index of the recipe within the day's recipe list.
 
     Returns:
-        Response: A Flask JSON response containing the updated meal plan and replaced recipe ID,
-                  or an error message if the new recipe is not found.
+        Response: A Flask JSON response containing the updated meal plan, or the plan ID and patch for a
+                  stored plan, and the replaced recipe ID, or an error message if the new recipe or the
+                  stored plan is not found.
     """
     meal_plan = data.get("meal_plan")
+    plan_id = data.get("plan_id")
     recipe_id = data.get("recipe_id")
     id = recipe_id.get("id")
     day_index = data.get("day_index")
     recipe_index = data.get("recipe_index")
 
-    recipe_df = pd.read_csv("./meal_db/meal_database.csv")
-    snack_recipes_df = recipe_df[recipe_df["meal_slot"] == "['snack']"]
-
-    old_recipe = meal_plan["days"][day_index]["recipes"].pop(recipe_index)
-    new_recipe_row = recipe_df.loc[recipe_df["number"] == int(id)]
-
-    if new_recipe_row.empty:
-        return jsonify({"error": "New recipe not found."}), 400
-
-    new_recipe = new_recipe_row.iloc[0].to_dict()
-    new_recipe = {k: (None if pd.isnull(v) else v) for k, v in new_recipe.items()}
-
-    if new_recipe["meal_slot"] == 'Snack':
-        new_recipe['instructions'] = ast.literal_eval(new_recipe['instructions'])
-        new_recipe['ingredients_with_quantities'] = ast.literal_eval(new_recipe['ingredients_with_quantities'])
-
-    new_recipe["id"] = int(new_recipe["number"])
-    new_recipe["calories"] = int(new_recipe["energy_kcal"])
-    new_recipe["prep_time"] = new_recipe["preptime"]
-    new_recipe["meal_name"] = old_recipe["meal_name"]
-
-    meal_plan = update_nutrition_values(meal_plan, old_recipe, "subtract", recipe_df, snack_recipes_df)
-    meal_plan["days"][day_index]["recipes"].insert(recipe_index, new_recipe)
-    meal_plan = update_nutrition_values(meal_plan, new_recipe, "add", recipe_df, snack_recipes_df)
+    def replace(meal_plan):
+        return replace_recipe(meal_plan, id, day_index, recipe_index)
 
-    time.sleep(0.1)
-    meal_plan = gen_shopping_list(meal_plan)
-    meal_plan = insert_status_nutrient_info(meal_plan)
-    time.sleep(0.1)
+    try:
+        if meal_plan is None and plan_id is not None:
+            output_data = get_plan_store().edit(plan_id, replace)
+        else:
+            output_data = replace(meal_plan)
+    except PlanNotFoundError:
+        return jsonify({"error": "Meal plan not found."}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify({"meal_plan": meal_plan, "id_replaced": new_recipe["number"]})
+    return jsonify(output_data)
@@ -0,0 +1,202 @@
+"""
+Provides an inverted index over the recipe title, ingredient, region and
+subregion tokens used by the recipe search.
+
+Every field maps the sorted vocabulary of all tokens to the positions of the
+recipes that contain them. The postings of a field are stored in vocabulary
+order, so the recipes of every token that starts with a prefix form one
+contiguous slice and a search term costs a couple of numpy operations instead
+of a scan over every recipe.
+
+Partial mode matches every query term against the start of a token, e.g.
+"chick" finds "chicken" but "cken" finds nothing. The search before the index
+matched the whole query as a substring of a single field instead.
+"""
+
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Fields searched in partial mode with their ranking weights. A term that
+# matches a title scores higher than one that only matches an ingredient.
+FIELD_WEIGHTS = {
+    "title": 4,
+    "ingredients": 2,
+    "region": 1,
+    "subregion": 1,
+}
+
+# Fields searched in exact mode
+EXACT_FIELDS = ["title", "ingredients"]
+
+# A term that is a whole token scores this much more than a prefix of one
+EXACT_TOKEN_BONUS = 2
+
+# Largest page a client can ask for with the limit parameter, a search without
+# one returns every match
+MAX_SEARCH_RESULT_LIMIT = 500
+
+
+def tokenize(text):
+    """
+    Splits a string into lower case word tokens.
+
+    Args:
+        text (str): Text to split.
+
+    Returns:
+        list: Tokens in the order they occur in the text.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def search_result(recipe):
+    """
+    Builds the search result of a recipe as returned by the search endpoint.
+
+    Args:
+        recipe (dict): Recipe as read from the meal database CSV.
+
+    Returns:
+        dict: The result fields, or None if the recipe has an invalid number or
+              calorie value.
+    """
+    try:
+        return {
+            'id': int(recipe.get('number', 0)),
+            'title': recipe.get('title', ''),
+            'calories': float(recipe.get('energy_kcal', 0)),
+            'region': recipe.get('region', ''),
+            'prep_time': recipe.get('preptime', ''),
+            'cook_time': recipe.get('cooktime', '')
+        }
+    except ValueError:
+        return None
+
+
+class RecipeSearchIndex:
+    """
+    Inverted index of the recipes loaded by load_data.
+    """
+
+    def __init__(self, recipes):
+        """
+        Args:
+            recipes (list): Recipe dicts as read from the meal database CSV.
+                            Recipes with an invalid number or calorie value are
+                            not indexed.
+        """
+        self.results = []
+        field_tokens = {field: [] for field in FIELD_WEIGHTS}
+        for recipe in recipes:
+            result = search_result(recipe)
+            if result is None:
+                continue
+            self.results.append(result)
+            for field in FIELD_WEIGHTS:
+                field_tokens[field].append(set(tokenize(recipe.get(field, '') or '')))
+
+        self.vocabulary = sorted(set().union(*(tokens for token_sets in field_tokens.values()
+                                               for tokens in token_sets)))
+        token_ids = {token: token_id for token_id, token in enumerate(self.vocabulary)}
+
+        # Postings of every field as (offsets, positions): the recipes that contain
+        # token i in the field are positions[offsets[i]:offsets[i + 1]]
+        self.postings = {}
+        for field, token_sets in field_tokens.items():
+            pairs = [(token_ids[token], position)
+                     for position, tokens in enumerate(token_sets) for token in tokens]
+            pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+            pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+            offsets = np.searchsorted(pairs[:, 0], np.arange(len(self.vocabulary) + 1))
+            self.postings[field] = (offsets, pairs[:, 1].astype(np.int32))
+
+        # Rank of every recipe when sorted by title, used to break score ties
+        self.title_rank = np.empty(len(self.results), dtype=np.int64)
+        self.title_rank[sorted(range(len(self.results)),
+                               key=lambda position: (self.results[position]['title'].lower(),
+                                                     self.results[position]['id']))] = \
+            np.arange(len(self.results))
+
+    def __len__(self):
+        return len(self.results)
+
+    def token_range(self, term, prefix):
+        """
+        Returns the range of vocabulary ids of the tokens that match a term.
+
+        Args:
+            term (str): Search term.
+            prefix (bool): Whether tokens that start with the term match too.
+
+        Returns:
+            tuple: First and one past the last matching vocabulary id.
+        """
+        start = bisect_left(self.vocabulary, term)
+        if prefix:
+            # Every token that starts with term sorts before term + U+10FFFF
+            end = bisect_left(self.vocabulary, term + "\U0010ffff", start)
+        else:
+            end = start + int(start < len(self.vocabulary) and self.vocabulary[start] == term)
+        return start, end
+
+    def term_scores(self, term, fields, prefix):
+        """
+        Scores every recipe for a single search term.
+
+        Args:
+            term (str): Search term.
+            fields (list): Fields to search.
+            prefix (bool): Whether tokens that start with the term match too.
+
+        Returns:
+            numpy.ndarray: Score of every recipe, 0 for recipes that do not match.
+        """
+        scores = np.zeros(len(self.results), dtype=np.float64)
+        start, end = self.token_range(term, prefix)
+        exact_start, exact_end = self.token_range(term, prefix=False)
+        for field in fields:
+            offsets, positions = self.postings[field]
+            weight = FIELD_WEIGHTS[field]
+            matched = positions[offsets[start]:offsets[end]]
+            scores[matched] = np.maximum(scores[matched], weight)
+            exact = positions[offsets[exact_start]:offsets[exact_end]]
+            scores[exact] = np.maximum(scores[exact], weight * EXACT_TOKEN_BONUS)
+        return scores
+
+    def search(self, query, exact_match, limit=None, offset=0):
+        """
+        Finds the recipes that match every term of a query, best matches first.
+
+        In partial mode a term matches a title, ingredient, region or subregion
+        token that starts with it. In exact mode it has to equal a title or
+        ingredient token.
+
+        Args:
+            query (str): The search query string.
+            exact_match (bool): Whether terms have to match whole tokens.
+            limit (int): Maximum number of results to return, None for all.
+            offset (int): Number of results to skip, for pagination.
+
+        Returns:
+            tuple: The page of result dicts and the total number of matches.
+        """
+        terms = tokenize(query)
+        if not terms or not self.results:
+            return [], 0
+
+        fields = EXACT_FIELDS if exact_match else list(FIELD_WEIGHTS)
+        total_scores = np.zeros(len(self.results), dtype=np.float64)
+        matches_all = np.ones(len(self.results), dtype=bool)
+        for term in set(terms):
+            scores = self.term_scores(term, fields, prefix=not exact_match)
+            matches_all &= scores > 0
+            total_scores += scores
+
+        matched = np.flatnonzero(matches_all)
+        order = matched[np.lexsort((self.title_rank[matched], -total_scores[matched]))]
+        page = order[offset:] if limit is None else order[offset:offset + limit]
+        return [self.results[position] for position in page.tolist()], len(matched)
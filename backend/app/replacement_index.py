@@ -0,0 +1,129 @@
+"""
+This file contains the index of replacement candidates used when a recipe of a
+meal plan is refreshed. For every meal slot the recipes that can fill it are
+kept sorted by calories, so the recipes closest in calories to the one being
+replaced are found with a binary search instead of a scan over the catalog.
+
+Of the recipes closest in calories, the one whose calories and macros are
+closest overall replaces the recipe, which keeps the nutrition of the day
+close to what the optimizer planned.
+"""
+import threading
+
+import numpy as np
+
+from app.recipe_catalog import OPTIMIZER_MEAL_SLOTS, get_recipe_catalog
+
+# Number of recipes closest in calories that are compared by their macros
+REPLACEMENT_CANDIDATES = 10
+
+# Columns compared between a recipe and its replacement, each scaled by its
+# standard deviation over the catalog
+MACRO_COLUMNS = ["energy_kcal", "protein_g", "carbohydrates_g", "fats_total_g"]
+
+# meal_name given to recipes by post processing mapped to the meal slot
+MEAL_NAME_SLOTS = {slot.capitalize(): slot for slot in OPTIMIZER_MEAL_SLOTS}
+
+
+class ReplacementIndex:
+    """
+    Recipes of every meal slot sorted by calories. Only recipes with complete
+    information can be candidates, the same recipes the optimizer chooses from.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        calories = catalog.recipes["energy_kcal"].to_numpy(dtype=np.float64)
+
+        # (sorted calories, row positions) of the candidates of every slot and,
+        # under None, of all candidates
+        self.slots = {}
+        for slot, mask in [(None, catalog.complete_rows)] + [
+                (slot, catalog.slot_masks[slot] & catalog.complete_rows)
+                for slot in OPTIMIZER_MEAL_SLOTS]:
+            positions = np.flatnonzero(mask)
+            order = np.argsort(calories[positions], kind="stable")
+            self.slots[slot] = (calories[positions][order], positions[order])
+
+        macros = catalog.recipes[MACRO_COLUMNS].to_numpy(dtype=np.float64)
+        scale = np.nanstd(macros[catalog.complete_rows], axis=0)
+        scale[~(scale > 0)] = 1
+        self.macros = macros / scale
+
+    def nearest(self, calories, k, slot=None, allowed=None, exclude=()):
+        """
+        Returns the k candidates closest in calories, closest first. The search
+        starts at the binary search position of calories and walks outwards, so
+        it takes O(log n + k) unless many neighbours are not allowed.
+
+        :param calories: float, calories to compare with
+        :param k: int, maximum number of candidates
+        :param slot: meal slot the candidates must belong to, None for any
+        :param allowed: numpy boolean array aligned with the catalog rows, only
+        recipes that are True can be returned, None to allow every recipe
+        :param exclude: row positions that must not be returned
+        :return: list of row positions
+        """
+        sorted_calories, positions = self.slots[slot]
+        right = int(np.searchsorted(sorted_calories, calories))
+        left = right - 1
+        nearest = []
+        while len(nearest) < k and (left >= 0 or right < len(positions)):
+            if right >= len(positions) or (
+                    left >= 0 and calories - sorted_calories[left] <= sorted_calories[right] - calories):
+                position = positions[left]
+                left -= 1
+            else:
+                position = positions[right]
+                right += 1
+            if position in exclude or (allowed is not None and not allowed[position]):
+                continue
+            nearest.append(int(position))
+        return nearest
+
+    def replacement(self, position, slot=None, allowed=None, exclude=(),
+                    candidates=REPLACEMENT_CANDIDATES):
+        """
+        Returns the best replacement of a recipe: of the candidates closest in
+        calories the one closest in calories and macros.
+
+        :param position: row position of the recipe to replace
+        :param slot: meal slot the replacement must belong to, any slot is used
+        if the meal slot has no candidates
+        :param allowed: numpy boolean array of recipes the user can eat
+        :param exclude: row positions that must not be returned, the recipe
+        itself is always excluded
+        :return: row position of the replacement, None if there is none
+        """
+        exclude = set(exclude) | {position}
+        calories = self.catalog.recipes["energy_kcal"].iat[position]
+        nearest = self.nearest(calories, candidates, slot, allowed, exclude)
+        if not nearest and slot is not None:
+            nearest = self.nearest(calories, candidates, None, allowed, exclude)
+        if not nearest:
+            return None
+
+        distances = np.linalg.norm(self.macros[nearest] - self.macros[position], axis=1)
+        return nearest[int(np.argmin(distances))]
+
+
+_replacement_index = None
+_replacement_index_lock = threading.Lock()
+
+
+def get_replacement_index():
+    """
+    Returns the replacement index of the current recipe catalog, building it
+    on first use and again after the catalog reloaded.
+
+    :return: ReplacementIndex
+    """
+    global _replacement_index
+    catalog = get_recipe_catalog()
+    index = _replacement_index
+    if index is None or index.catalog is not catalog:
+        with _replacement_index_lock:
+            if _replacement_index is None or _replacement_index.catalog is not catalog:
+                _replacement_index = ReplacementIndex(catalog)
+            index = _replacement_index
+    return index
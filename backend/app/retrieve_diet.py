@@ -1,32 +1,78 @@
+import os
+import threading
+
+import numpy as np
 import pandas as pd
+from app.recipe_catalog import get_recipe_catalog
+
+DIET_DIRECTORY = './diets'
+# Files of every diet, read into the entry of the same name
+DIET_FILES = {"ingredients": "ingreds", "methods": "methods", "nutrients": "nutrients"}
+
+
+class DietPlanBundle:
+    """
+    The diet plan of a health goal, read once and reused until the diet files or
+    the meal database change. plan is shared between requests and must not be
+    modified.
+    """
+
+    def __init__(self, health_plan, catalog):
+        self.health_plan = health_plan
+        self.catalog = catalog
+        meal_db = catalog.recipes
+        recipe_id_list = list(meal_db['number'])
+
+        if health_plan == 'lose_weight':
+            self.paths = []
+            self.diet_scores = np.ones(len(meal_db), dtype=np.float64)
+            self.plan = {
+                "plan": "lose_weight",
+                "nutrients" : {"nutrients": {"nutrient": ""}},
+                "diet_score" : dict(zip(recipe_id_list, [1 for i in range(len(recipe_id_list))]))
+            }
+        else:
+            self.paths = [f'{DIET_DIRECTORY}/{health_plan}/{health_plan}_{suffix}.csv'
+                          for suffix in DIET_FILES.values()]
+            self.plan = {"plan": health_plan}
+            for key, path in zip(DIET_FILES, self.paths):
+                self.plan[key] = pd.read_csv(path).to_dict()
+            self.diet_scores = meal_db[f'{health_plan}_score'].to_numpy(dtype=np.float64)
+            self.plan["diet_score"] = dict(zip(recipe_id_list, meal_db[f'{health_plan}_score']))
+
+        self.mtimes = [os.path.getmtime(path) for path in self.paths]
+        # Diet score of every recipe aligned with the rows of the catalog
+        self.diet_scores.flags.writeable = False
+        self.plan["diet_scores"] = self.diet_scores
+
+    def is_stale(self, catalog):
+        """
+        Returns True if the meal database was reloaded or a diet file changed
+        since the bundle was built.
+        """
+        return (catalog is not self.catalog
+                or [os.path.getmtime(path) for path in self.paths] != self.mtimes)
+
+
+_diet_plan_bundles = {}
+_diet_plan_bundles_lock = threading.Lock()
+
 
 def get_diet_plan(health_plan):
     """
     Called in ./backend/app/generate_meal_plan.py.
     Retrieves the diet plan information for a given health plan.
+    The diet plan is shared between requests and must not be modified.
     :param health_plan: string of health plan
-    :return: dict of diet plan details including ingredients, methods and nutrients
+    :return: dict of diet plan details including ingredients, methods and nutrients, the diet score
+    of every recipe number and the diet scores aligned with the catalog rows
     """
-    meal_db = pd.read_csv(f'./meal_db/meal_database.csv')
-    recipe_id_list = list(meal_db['number'])
-
-    if health_plan == 'lose_weight':
-        return {
-            "plan": "lose_weight",
-            "nutrients" : {"nutrients": {"nutrient": ""}},
-            "diet_score" : dict(zip(recipe_id_list, [1 for i in range(len(recipe_id_list))]))
-        }
-
-    diet_ingredients = pd.read_csv(f'./diets/{health_plan}/{health_plan}_ingreds.csv')
-    diet_methods = pd.read_csv(f'./diets/{health_plan}/{health_plan}_methods.csv')
-    diet_nutrients = pd.read_csv(f'./diets/{health_plan}/{health_plan}_nutrients.csv')
-    diet_score = dict(zip(recipe_id_list, meal_db[f'{health_plan}_score']))
-
-
-    return {
-        "plan": health_plan,
-        "ingredients": diet_ingredients.to_dict(),
-        "methods": diet_methods.to_dict(),
-        "nutrients": diet_nutrients.to_dict(),
-        "diet_score": diet_score
-    }
+    catalog = get_recipe_catalog()
+    bundle = _diet_plan_bundles.get(health_plan)
+    if bundle is None or bundle.is_stale(catalog):
+        with _diet_plan_bundles_lock:
+            bundle = _diet_plan_bundles.get(health_plan)
+            if bundle is None or bundle.is_stale(catalog):
+                bundle = DietPlanBundle(health_plan, catalog)
+                _diet_plan_bundles[health_plan] = bundle
+    return bundle.plan
@@ -2,7 +2,7 @@ from app import app
 from app.calculate_bmi import bmi_calculator_function
 from flask import make_response, redirect, request, jsonify, send_from_directory
 from flask_cors import CORS
-from app.generate_meal_plan import gen_meal_plan, gen_shopping_list
+from app.generate_meal_plan import gen_shopping_list
 from app.calculate_energy import energy_calculator_function
 from app.calculate_nutritional_requirements import calculate_macros, calculate_micros, create_nutrition_requirements_payload, read_micro_nutrients_file
 from app.send_email import send_email_by_google_scheduler
@@ -19,8 +19,19 @@ from user_db.user_db import instantiate_database
 import stripe
 from app.find_matched_recipe_and_update import find_matched_recipe_and_update, find_matched_recipe_and_delete, update_nutrition_values
 from app.recipe_management.search import search_recipes_logic
+from app.recipe_management.search_index import MAX_SEARCH_RESULT_LIMIT
 from app.recipe_management.replace import replace_recipe_logic
 from app.recipe_management.get_recipe import get_recipe_logic
+from app.plan_jobs import (
+    MAX_PLAN_JOB_WAIT,
+    InvalidPlanRequestError,
+    PlanJobNotFoundError,
+    PlanJobPendingError,
+    PlanJobQueueFullError,
+    get_plan_jobs,
+    validate_plan_request
+)
+from app.plan_store import PlanNotFoundError, get_plan_store
 
 
 ALLOWED = [
@@ -136,28 +147,48 @@ def get_mealplan(user_id, date_range):
         print(f"[ERROR] Failed to fetch meal plan: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api", methods=["POST"])
-def receive_data():
-    data = request.json
+def save_user_profile(data):
+    """
+    Stores the profile of the user in the questionnaire data, if the user is signed in.
+    """
     db = instantiate_database()
-    user_id = data["user_id"]  
+    user_id = data.get("user_id")
     if user_id is not None:
         user_data = extract_user_profile_data_from_json(data, user_id)
         extract_data = extract_data_from_json(data)
         db.update_user_profile(**user_data)
         process_user_data(db, user_id, extract_data)
-
-        min_date = datetime.datetime.fromtimestamp(data["minDate"] / 1000.0, datetime.timezone.utc)
-        max_date = datetime.datetime.fromtimestamp(data["maxDate"] / 1000.0, datetime.timezone.utc)
-
-        formatted_min_date = min_date.strftime("%Y/%m/%d")
-        formatted_max_date = max_date.strftime("%Y/%m/%d")
-        
     else:
         print("Skipped user info storing")
+
+
+def pending_job_response(job):
+    """
+    Answers with the id of a meal plan job that has not finished, to poll for
+    its meal plan with GET /api/jobs/<job_id>.
+    """
+    return (jsonify({"job_id": job.job_id, "status": job.status}), 202,
+            {"Location": f"/api/jobs/{job.job_id}"})
+
+
+@app.route("/api", methods=["POST"])
+def receive_data():
+    data = request.get_json(silent=True)
     try:
-        response = gen_meal_plan(data)
+        validate_plan_request(data)
+    except InvalidPlanRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    save_user_profile(data)
+    try:
+        # Solved in the solver pool like the jobs below, so web workers never
+        # run more solves than there are cores. A meal plan that takes longer
+        # than the wait of generate is answered with its job id instead
+        response = get_plan_jobs().generate(data)
         print("=====Final Data======", response)
+    except PlanJobPendingError as e:
+        return pending_job_response(e.job)
+    except PlanJobQueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
         error_traceback = traceback.format_exc()
         response = {"error": str(e),
@@ -179,10 +210,20 @@ def get_meal_plan_refresh():
     meal_plan_data = data.get("meal_plan")
     #print("MEAL PLAN DATA========\n\n",meal_plan_data)
     recipe_id = data.get("recipe_id")
+    preferences = data.get("preferences")
+
+    def refresh(meal_plan):
+        return find_matched_recipe_and_update(meal_plan, recipe_id, preferences)
 
     try:
-        output_data = find_matched_recipe_and_update(meal_plan_data, recipe_id)
+        # A stored plan is edited in place and only the patch is returned
+        if meal_plan_data is None and data.get("plan_id") is not None:
+            output_data = get_plan_store().edit(data["plan_id"], refresh)
+        else:
+            output_data = refresh(meal_plan_data)
 
+    except PlanNotFoundError:
+        return jsonify({"error": "Meal plan not found."}), 404
     except ValueError as e:
         output_data = {"error": str(e)}
         print(f"Failed to generate meal plan: {str(e)}")
@@ -196,8 +237,16 @@ def delete_recipe():
     meal_plan_data = data.get("meal_plan")
     recipe_id = data.get("recipe_id")
 
+    def delete(meal_plan):
+        return find_matched_recipe_and_delete(meal_plan, recipe_id)
+
     try:
-        output_data = find_matched_recipe_and_delete(meal_plan_data, recipe_id)
+        if meal_plan_data is None and data.get("plan_id") is not None:
+            output_data = get_plan_store().edit(data["plan_id"], delete)
+        else:
+            output_data = delete(meal_plan_data)
+    except PlanNotFoundError:
+        return jsonify({"error": "Meal plan not found."}), 404
     except ValueError as e:
         output_data = {"error": str(e)}
         print(f"Failed to generate meal plan: {str(e)}")
@@ -267,7 +316,13 @@ def create_one_day_meal_plan():
 
     try:
         print("data sent to gen_meal_plan", data)
-        response = gen_meal_plan(data)
+        response = get_plan_jobs().generate(data)
+    except InvalidPlanRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except PlanJobPendingError as e:
+        return pending_job_response(e.job)
+    except PlanJobQueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
         error_traceback = traceback.format_exc()
         response = {"error": str(e),
@@ -280,6 +335,44 @@ def create_one_day_meal_plan():
     #     print(f"Failed to send email: {str(e)}")
     return jsonify(response)
 
+@app.route("/api/jobs", methods=["POST"])
+def submit_meal_plan_job():
+    """
+    Starts generating a meal plan and answers with the job id at once. The
+    meal plan is polled for with GET /api/jobs/<job_id>.
+    """
+    data = request.get_json(silent=True)
+    try:
+        validate_plan_request(data)
+    except InvalidPlanRequestError as e:
+        return jsonify({"error": str(e)}), 400
+    save_user_profile(data)
+    try:
+        job = get_plan_jobs().submit(data)
+    except PlanJobQueueFullError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    return pending_job_response(job)
+
+
+@app.route("/api/jobs/metrics", methods=["GET"])
+def get_meal_plan_job_metrics():
+    return jsonify(get_plan_jobs().metrics())
+
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_meal_plan_job(job_id):
+    """
+    Answers with the status of a job, and the meal plan once it is done. With
+    ?wait=<seconds> the request waits up to MAX_PLAN_JOB_WAIT seconds for the
+    job to finish instead of answering at once.
+    """
+    wait = min(request.args.get("wait", 0, type=float), MAX_PLAN_JOB_WAIT)
+    try:
+        return jsonify(get_plan_jobs().get(job_id, wait))
+    except PlanJobNotFoundError:
+        return jsonify({"error": "Job not found."}), 404
+
+
 @app.route("/webhook", methods=["POST"])
 def webhook():
     print("In webhook")
@@ -373,13 +466,19 @@ def search_recipes():
     -----------------
     q : str
         The search query (matched against title, ingredients, region, and subregion).
+        Without exact, every term has to be the start of a word, e.g. 'chick' matches
+        'chicken' but 'cken' does not.
     exact : str
         Whether to enforce exact term match ('true' or 'false').
+    limit : int
+        Maximum number of recipes to return (at most 500). Without it every match is returned.
+    offset : int
+        Number of best matching recipes to skip, for pagination (default 0).
 
     Returns:
     --------
     Response
-        A JSON list of matching recipes, each containing:
+        A JSON list of matching recipes, best matches first, each containing:
         - id (int)
         - title (str)
         - calories (float)
@@ -391,7 +490,11 @@ def search_recipes():
     """
     query = request.args.get('q', '').lower().strip()
     exact_match = request.args.get('exact', 'false').lower() == 'true'
-    return search_recipes_logic(query, exact_match)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = min(max(limit, 0), MAX_SEARCH_RESULT_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    return search_recipes_logic(query, exact_match, limit, offset)
 
 
 @app.route("/api/replace-meal-plan-recipe", methods=["POST"])
@@ -402,7 +505,8 @@ def replace_recipe_in_meal_plan():
     Request Body:
     -------------
     JSON object with the following keys:
-        - meal_plan (dict): The current meal plan.
+        - meal_plan (dict): The current meal plan, or
+        - plan_id (str): The ID the meal plan was stored under when it was generated.
         - recipe_id (dict): Contains the 'id' of the replacement recipe.
         - day_index (int): Index of the day in the meal plan.
         - recipe_index (int): Index of the recipe to replace.
@@ -411,7 +515,8 @@ def replace_recipe_in_meal_plan():
     --------
     Response
         A JSON object containing:
-        - meal_plan (dict): Updated meal plan with nutrition and shopping list updates.
+        - meal_plan (dict): Updated meal plan with nutrition and shopping list updates, or
+        - plan_id (str) and patch (list): For a stored plan, the JSON patch of the updates.
         - id_replaced (int): The ID of the recipe that replaced the old one.
     --------
     @author: BCIT May 2025
@@ -14,7 +14,7 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 from app.generate_meal_plan import (
-    gen_meal_plan,
+    iter_meal_plans_batch,
     process_type_normal,
 )
 from app.mealplan_service import download_mealplan_json_from_gcs, upload_mealplan_json_to_gcs
@@ -24,7 +24,10 @@ from email.mime.text import MIMEText
 from flask import Flask, jsonify, render_template, render_template_string
 import subprocess
 import json
+import threading
 import time
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from app.shopping_list_utils import (
     transform_meal_plan_to_shopping_list,
     process_and_categorize_shopping_list
@@ -46,10 +49,29 @@ credentials = service_account.Credentials.from_service_account_info(
   subject=os.getenv('SENDER_EMAIL')
 )
 
-service_gmail = build("gmail", "v1", credentials=credentials)
-
 PT = ZoneInfo("America/Los_Angeles")
 
+# Seconds the meal plan of one user may take in the weekly batch
+WEEKLY_MEAL_PLAN_TIMEOUT = 300
+# Seconds every GCS and Gmail request may take
+EMAIL_IO_TIMEOUT = 60
+# Threads uploading meal plans and sending emails in the weekly batch
+EMAIL_IO_THREADS = 8
+
+# Gmail services are not thread safe, every thread has its own
+_gmail_local = threading.local()
+
+def get_gmail_service():
+    """
+    Returns the Gmail service of the calling thread, built on first use.
+    """
+    service = getattr(_gmail_local, "service", None)
+    if service is None:
+        http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=EMAIL_IO_TIMEOUT))
+        service = build("gmail", "v1", http=http)
+        _gmail_local.service = service
+    return service
+
 # now = datetime.now(PT)        
 # start_date = now + timedelta(days=1)
 # end_date = start_date + timedelta(days=6)      
@@ -91,13 +113,13 @@ def send_email_by_google_scheduler(db, is_daily=False):
     
     success_results = []
     failed_results = []
-    
-    for user_id in user_ids:
-        if is_daily:
-            result, code = process_daily_email_for_user(db, user_id)
-        else:
-            result, code = process_weekly_email_for_user(db, user_id)
-            
+
+    if is_daily:
+        user_results = [process_daily_email_for_user(db, user_id) for user_id in user_ids]
+    else:
+        user_results = process_weekly_emails(db, user_ids)
+
+    for result, code in user_results:
         if result.get("status") == 'success':
             success_results.append({
                 "code": code,
@@ -119,48 +141,111 @@ def send_email_by_google_scheduler(db, is_daily=False):
         "fail": failed_results
     }, 207 if failed_results else 200
 
-def process_weekly_email_for_user(db, user_id):
-    try:
-        dates = get_week_range()
-        s = dates["start_date"]
-        e = dates["end_date"]
-        start_str = dates["start_str"]
-        end_str = dates["end_str"]
+def get_weekly_email_dates():
+    """
+    Returns the dates of the meal plans sent with the weekly email, the week
+    starting tomorrow.
+    """
+    dates = get_week_range()
+    s = dates["start_date"]
+    e = dates["end_date"]
+    s_dt = s.astimezone(PT).replace(hour=0, minute=0, second=0, microsecond=0)
+    e_dt = e.astimezone(PT).replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "start_str": dates["start_str"],
+        "end_str": dates["end_str"],
+        "s_dt": s_dt,
+        "e_dt": e_dt,
+        "min_date": pt_midnight_utc_ms(s_dt.date()),
+        "max_date": pt_midnight_utc_ms(e.date()),
+        "start_str_local": s.strftime("%Y-%m-%d"),
+        "end_str_local": e.strftime("%Y-%m-%d"),
+    }
 
-        s_dt = s.astimezone(PT).replace(hour=0, minute=0, second=0, microsecond=0)
-        e_dt = e.astimezone(PT).replace(hour=0, minute=0, second=0, microsecond=0)
+def create_weekly_meal_plan_input(db, user_id, dates):
+    data = create_data_input_for_auto_gen_meal_plan(db, user_id, dates["s_dt"], dates["e_dt"])
+    data["minDate"] = dates["min_date"]
+    data["maxDate"] = dates["max_date"]
+    return data
 
-        data = create_data_input_for_auto_gen_meal_plan(db, user_id, s_dt, e_dt)
-        data["minDate"] = pt_midnight_utc_ms(s_dt.date())
-        data["maxDate"] = pt_midnight_utc_ms(e.date())
+def upload_and_send_weekly_email(response, user_id, user_email, user_name, dates):
+    """
+    Uploads the weekly meal plan of a user to GCS and emails it to the user.
+    Does not access the database, so it can run in a thread.
+    """
+    path = f"meal-plans-for-user/{user_id}/{dates['start_str_local']}_to_{dates['end_str_local']}.json"
+    upload_mealplan_json_to_gcs(response, path, timeout=EMAIL_IO_TIMEOUT)
+    return create_and_send_maizzle_email(response, user_email, user_name,
+                                         dates["start_str"], dates["end_str"])
 
-        print("data in process weekly email is created!!!")
-        response = gen_meal_plan(data)
-        db.insert_user_meal_plan(user_id, response, s_dt, e_dt)
+def weekly_email_success(user_id, user_email, gmail_response, dates):
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "user_email": user_email,
+        "gmail_response": gmail_response,
+        "start_date": dates["start_str"],
+        "end_date": dates["end_str"]
+    }, 200
 
-        start_str_local = s.strftime("%Y-%m-%d")
-        end_str_local   = e.strftime("%Y-%m-%d")
-        
-        path = f"meal-plans-for-user/{user_id}/{start_str_local}_to_{end_str_local}.json"
-        upload_mealplan_json_to_gcs(response, path)
-        
-        user_name = db.retrieve_user_name(user_id)
-        user_email = db.retrieve_user_email(user_id)
-        gmail_response = create_and_send_maizzle_email(response, user_email, user_name, start_str, end_str)
-        return {
-            "status": "success",
-            "user_id": user_id,
-            "user_email": user_email,
-            "gmail_response": gmail_response,
-            "start_date": start_str,
-            "end_date": end_str
-        }, 200
-    except Exception as e:
-        return {
-            "status": "fail",
-            "user_id": user_id,
-            "error": str(e)
-        }, 500
+def weekly_email_fail(user_id, error):
+    return {
+        "status": "fail",
+        "user_id": user_id,
+        "error": str(error)
+    }, 500
+
+def process_weekly_emails(db, user_ids):
+    """
+    Generates, stores and emails the weekly meal plans of all users. The meal
+    plans are generated as one batch in the solver process pool, see
+    iter_meal_plans_batch, and the GCS uploads and Gmail sends run in a thread
+    pool. The database connection is only used from this thread. Every GCS
+    and Gmail request times out after EMAIL_IO_TIMEOUT seconds.
+
+    :param db: database connection
+    :param user_ids: list of user ids
+    :return: list of (result, code) tuples in the order of user_ids, see
+    weekly_email_success and weekly_email_fail
+    """
+    dates = get_weekly_email_dates()
+    results = {}
+
+    batch_user_ids = []
+    batch_requests = []
+    for user_id in user_ids:
+        try:
+            batch_requests.append(create_weekly_meal_plan_input(db, user_id, dates))
+            batch_user_ids.append(user_id)
+        except Exception as e:
+            results[user_id] = weekly_email_fail(user_id, e)
+
+    with ThreadPoolExecutor(max_workers=EMAIL_IO_THREADS) as io_pool:
+        email_futures = {}
+        for index, response in iter_meal_plans_batch(batch_requests, timeout=WEEKLY_MEAL_PLAN_TIMEOUT):
+            user_id = batch_user_ids[index]
+            if "error" in response:
+                results[user_id] = weekly_email_fail(user_id, response["error"])
+                continue
+            try:
+                db.insert_user_meal_plan(user_id, response, dates["s_dt"], dates["e_dt"])
+                user_name = db.retrieve_user_name(user_id)
+                user_email = db.retrieve_user_email(user_id)
+            except Exception as e:
+                results[user_id] = weekly_email_fail(user_id, e)
+                continue
+            email_future = io_pool.submit(upload_and_send_weekly_email, response, user_id,
+                                          user_email, user_name, dates)
+            email_futures[email_future] = (user_id, user_email)
+
+        for email_future, (user_id, user_email) in email_futures.items():
+            try:
+                gmail_response = email_future.result()
+                results[user_id] = weekly_email_success(user_id, user_email, gmail_response, dates)
+            except Exception as e:
+                results[user_id] = weekly_email_fail(user_id, e)
+
+    return [results[user_id] for user_id in user_ids]
 
 def process_daily_email_for_user(db, user_id):
     dates = get_week_range()
@@ -263,7 +348,7 @@ def create_and_send_maizzle_email(response, user_email, user_name, start_date=No
         message = create_message(
             sender_email, to_email, subject, email_template, True
         )
-        msg = send_message(service_gmail, "me", message)
+        msg = send_message(get_gmail_service(), "me", message)
         print(msg)
     return msg
 #daily
@@ -303,7 +388,7 @@ def create_and_send_maizzle_daily_email_test(response, user_email, user_name, se
         message = create_message(
             sender_email, to_email, subject, email_template, True
         )
-        msg = send_message(service_gmail, "me", message)
+        msg = send_message(get_gmail_service(), "me", message)
         print(msg)
 
     return msg
\ No newline at end of file
@@ -0,0 +1,408 @@
+"""
+This file contains the solver backends that can solve a MealPlanModel. The
+backend is chosen per deployment with the MEALPLAN_SOLVER environment variable:
+
+    cbc     PuLP with the CBC command line solver (default)
+    scipy   HiGHS through scipy.optimize.milp, solved in process
+    highs   HiGHS through highspy, solved in process
+
+scipy and highspy are in requirements.txt but optional. If the configured
+backend is not installed the CBC backend is used instead.
+
+Every meal plan has a solve budget, see SolveBudget. Its defaults are set with
+MEALPLAN_SOLVER_TIME_LIMIT, MEALPLAN_SOLVER_GAP and MEALPLAN_SOLVER_THREADS.
+Without them the solves of a meal plan have DEFAULT_TIME_LIMIT seconds and use
+the solver's default gap and threads.
+
+A model that is solved repeatedly with changing row bounds, e.g. while its
+constraints are loosened, should be solved through a session. The cbc and highs
+sessions keep their problem alive between solves and only update the bounds
+that changed, HiGHS also reuses its previous basis. Backends without a session
+solve the model from scratch every time.
+"""
+import os
+from collections import namedtuple
+
+import numpy as np
+from pulp import (LpAffineExpression, LpContinuous, LpInteger, LpMaximize, LpProblem,
+                  LpSolutionIntegerFeasible, LpSolutionOptimal, LpStatus, LpVariable, PULP_CBC_CMD)
+
+SOLVER_ENV_VARIABLE = "MEALPLAN_SOLVER"
+DEFAULT_SOLVER = "cbc"
+
+TIME_LIMIT_ENV_VARIABLE = "MEALPLAN_SOLVER_TIME_LIMIT"
+GAP_ENV_VARIABLE = "MEALPLAN_SOLVER_GAP"
+THREADS_ENV_VARIABLE = "MEALPLAN_SOLVER_THREADS"
+# Seconds all solves of a meal plan may take together, if not configured. Some
+# profiles need more than a minute of loosening, the limit leaves room for them
+DEFAULT_TIME_LIMIT = 120
+
+# Solution statuses, named like PuLP's LpStatus values
+OPTIMAL = "Optimal"
+INFEASIBLE = "Infeasible"
+UNBOUNDED = "Unbounded"
+NOT_SOLVED = "Not Solved"
+UNDEFINED = "Undefined"
+
+
+# time_limit: seconds all solves of a meal plan may take together, None for no
+# limit
+# gap: relative gap between the best solution and the bound at which a solve
+# stops, None for the solver default
+# threads: number of threads a solver may use, None for the solver default
+SolveBudget = namedtuple("SolveBudget", ["time_limit", "gap", "threads"])
+
+
+def get_solve_budget(time_limit=None, gap=None, threads=None):
+    """
+    Returns the SolveBudget with the given values, taking the ones that are
+    None from the environment variables.
+    """
+    def from_env(value, variable, convert, default=None):
+        if value is not None:
+            return value
+        value = os.getenv(variable)
+        return default if not value else convert(value)
+
+    return SolveBudget(from_env(time_limit, TIME_LIMIT_ENV_VARIABLE, float, DEFAULT_TIME_LIMIT),
+                       from_env(gap, GAP_ENV_VARIABLE, float),
+                       from_env(threads, THREADS_ENV_VARIABLE, int))
+
+
+def round_integer_columns(model, values):
+    """
+    Rounds the values of the integer columns of a solution, which in process
+    solvers return as floats within their feasibility tolerance.
+    """
+    return np.where(model.integer_columns, np.round(values), values)
+
+
+class SolverBackend:
+    """
+    Base class of the solver backends.
+
+    If a time limit is set, a solve that runs out of time returns the best
+    solution found so far, or zeros if it found none. The time limit may be
+    changed between the solves of a session.
+    """
+    name = None
+
+    def __init__(self, time_limit=None, gap=None, threads=None):
+        """
+        :param time_limit: float, maximum number of seconds per solve, None
+        for no limit
+        :param gap: float, relative MIP gap at which a solve stops, None for
+        the solver default
+        :param threads: int, number of threads of a solve, None for the
+        solver default
+        """
+        self.time_limit = time_limit
+        self.gap = gap
+        self.threads = threads
+
+    @classmethod
+    def is_available(cls):
+        """
+        Returns True if the packages needed by the backend are installed.
+        """
+        return True
+
+    def solve(self, model):
+        """
+        Solves the model.
+
+        :param model: MealPlanModel
+        :return: tuple of the status string and a numpy array with the value
+        of every model column, zeros if there is no solution
+        """
+        raise NotImplementedError
+
+    def session(self, model):
+        """
+        Returns a session for solving the model several times as its row
+        bounds change.
+
+        :param model: MealPlanModel
+        :return: SolverSession
+        """
+        return SolverSession(self, model)
+
+
+class SolverSession:
+    """
+    Solves a model repeatedly. This default session solves the model from
+    scratch on every call.
+    """
+
+    def __init__(self, backend, model):
+        self.backend = backend
+        self.model = model
+        # Row bounds the solver's problem was last updated with
+        self.row_lower = model.row_lower.copy()
+        self.row_upper = model.row_upper.copy()
+
+    def solve(self):
+        """
+        Solves the model with its current row bounds.
+
+        :return: tuple of the status string and a numpy array with the value
+        of every model column, zeros if there is no solution
+        """
+        return self.backend.solve(self.model)
+
+    def changed_rows(self):
+        """
+        Returns the rows whose bounds changed since the last call and remembers
+        the current bounds.
+        """
+        lower, upper = self.model.row_lower, self.model.row_upper
+        changed = np.flatnonzero((lower != self.row_lower) | (upper != self.row_upper))
+        self.row_lower = lower.copy()
+        self.row_upper = upper.copy()
+        return changed
+
+
+class PulpCbcBackend(SolverBackend):
+    """
+    Builds a PuLP problem from the model and solves it with CBC. CBC runs as a
+    subprocess and PuLP writes the problem to a temporary file on every solve.
+    """
+    name = "cbc"
+
+    def solve(self, model):
+        return self.session(model).solve()
+
+    def session(self, model):
+        return PulpCbcSession(self, model)
+
+
+class PulpCbcSession(SolverSession):
+    """
+    Keeps the PuLP problem of a model and changes the right hand side of its
+    constraints when the row bounds change, instead of building it again.
+    """
+
+    def __init__(self, backend, model):
+        super().__init__(backend, model)
+        self.prob = LpProblem("Meal plan generation", LpMaximize)
+        # define varValue as integer, meaning the count of each recipe in the solution
+        self.variables = [LpVariable(name, lowBound=0, upBound=None if upper == np.inf else upper,
+                                     cat=LpInteger if integer else LpContinuous)
+                          for name, upper, integer in zip(model.column_names, model.upper.tolist(),
+                                                          model.integer_columns.tolist())]
+        # (lower bound constraint, upper bound constraint) of every row
+        self.row_constraints = []
+
+        self.prob += self.expression(model.objective)
+        for index, row in enumerate(model.A):
+            lower = model.row_lower[index]
+            upper = model.row_upper[index]
+            # Rows that can be loosened may not stay equalities
+            if lower == upper and not model.relaxable[index]:
+                constraint = self.expression(row) == lower
+                self.prob += constraint
+                self.row_constraints.append((constraint, constraint))
+                continue
+
+            lower_constraint = upper_constraint = None
+            if lower > -np.inf:
+                lower_constraint = self.expression(row) >= lower
+                self.prob += lower_constraint
+            if upper < np.inf:
+                upper_constraint = self.expression(row) <= upper
+                self.prob += upper_constraint
+            self.row_constraints.append((lower_constraint, upper_constraint))
+
+    def expression(self, coefficients):
+        nonzero = np.flatnonzero(coefficients)
+        return LpAffineExpression(
+            zip([self.variables[index] for index in nonzero], coefficients[nonzero].tolist()))
+
+    def solve(self):
+        for index in self.changed_rows():
+            lower_constraint, upper_constraint = self.row_constraints[index]
+            if lower_constraint is not None:
+                lower_constraint.changeRHS(self.model.row_lower[index])
+            if upper_constraint is not None:
+                upper_constraint.changeRHS(self.model.row_upper[index])
+
+        self.prob.solve(PULP_CBC_CMD(msg=0, timeLimit=self.backend.time_limit,
+                                     gapRel=self.backend.gap, threads=self.backend.threads))
+
+        # CBC stopped by the time limit before finding a solution, or proving
+        # the problem infeasible, leaves meaningless values in the variables
+        if self.prob.sol_status not in (LpSolutionOptimal, LpSolutionIntegerFeasible):
+            return LpStatus[self.prob.status], np.zeros(self.model.num_columns)
+        values = np.array([variable.varValue or 0 for variable in self.variables],
+                          dtype=np.float64)
+        # PuLP reports the best solution of a solve stopped by the time limit as
+        # optimal, like the other backends it is only a solution found
+        if self.prob.sol_status == LpSolutionIntegerFeasible:
+            return NOT_SOLVED, values
+        return LpStatus[self.prob.status], values
+
+
+class ScipyMilpBackend(SolverBackend):
+    """
+    Solves the model in process with the HiGHS solver bundled with scipy.
+    """
+    name = "scipy"
+
+    # scipy.optimize.milp status codes
+    STATUSES = {0: OPTIMAL, 1: NOT_SOLVED, 2: INFEASIBLE, 3: UNBOUNDED}
+
+    @classmethod
+    def is_available(cls):
+        try:
+            from scipy.optimize import milp
+        except ImportError:
+            return False
+        return True
+
+    def solve(self, model):
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        # scipy runs HiGHS with a single thread
+        options = {}
+        if self.time_limit is not None:
+            options["time_limit"] = self.time_limit
+        if self.gap is not None:
+            options["mip_rel_gap"] = self.gap
+        result = milp(-model.objective,
+                      constraints=LinearConstraint(model.A, model.row_lower, model.row_upper),
+                      integrality=model.integer_columns.astype(np.int64),
+                      bounds=Bounds(0, model.upper),
+                      options=options)
+
+        status = self.STATUSES.get(result.status, UNDEFINED)
+        if result.x is None:
+            return status, np.zeros(model.num_columns)
+        return status, round_integer_columns(model, result.x)
+
+
+class HighsBackend(SolverBackend):
+    """
+    Solves the model in process with highspy, the Python interface of HiGHS.
+    """
+    name = "highs"
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import highspy
+        except ImportError:
+            return False
+        return True
+
+    def solve(self, model):
+        return self.session(model).solve()
+
+    def session(self, model):
+        return HighsSession(self, model)
+
+    @staticmethod
+    def highs_lp(model):
+        """
+        Converts the model into a highspy.HighsLp with a column wise matrix.
+        """
+        import highspy
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = model.num_columns
+        lp.num_row_ = len(model.row_lower)
+        lp.sense_ = highspy.ObjSense.kMaximize
+        lp.col_cost_ = model.objective
+        lp.col_lower_ = np.zeros(model.num_columns)
+        lp.col_upper_ = model.upper
+        lp.row_lower_ = model.row_lower
+        lp.row_upper_ = model.row_upper
+        lp.integrality_ = [highspy.HighsVarType.kInteger if integer else highspy.HighsVarType.kContinuous
+                           for integer in model.integer_columns]
+
+        # Nonzeros of A ordered by column, then by row
+        columns, rows = np.nonzero(model.A.T)
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = np.searchsorted(columns, np.arange(model.num_columns + 1))
+        lp.a_matrix_.index_ = rows
+        lp.a_matrix_.value_ = model.A[rows, columns]
+        return lp
+
+
+class HighsSession(SolverSession):
+    """
+    Keeps the HiGHS instance of a model alive and only passes the row bounds
+    that changed, so a re-solve starts from the previous basis.
+    """
+
+    def __init__(self, backend, model):
+        import highspy
+
+        super().__init__(backend, model)
+        self.highs = highspy.Highs()
+        self.highs.setOptionValue("output_flag", False)
+        if backend.gap is not None:
+            self.highs.setOptionValue("mip_rel_gap", float(backend.gap))
+        if backend.threads is not None:
+            self.highs.setOptionValue("threads", int(backend.threads))
+        self.highs.passModel(HighsBackend.highs_lp(model))
+
+    def solve(self):
+        import highspy
+
+        if self.backend.time_limit is not None:
+            self.highs.setOptionValue("time_limit", float(self.backend.time_limit))
+        changed = self.changed_rows()
+        if len(changed):
+            self.highs.changeRowsBounds(len(changed), changed,
+                                        self.model.row_lower[changed],
+                                        self.model.row_upper[changed])
+        self.highs.run()
+
+        model_status = self.highs.getModelStatus()
+        if model_status == highspy.HighsModelStatus.kOptimal:
+            status = OPTIMAL
+        elif model_status == highspy.HighsModelStatus.kInfeasible:
+            status = INFEASIBLE
+        elif model_status == highspy.HighsModelStatus.kUnbounded:
+            status = UNBOUNDED
+        else:
+            status = NOT_SOLVED
+
+        # A solve stopped by the time limit may still have found a solution
+        solution_status = self.highs.getInfo().primal_solution_status
+        if solution_status != int(highspy.SolutionStatus.kSolutionStatusFeasible):
+            return status, np.zeros(self.model.num_columns)
+        return status, round_integer_columns(self.model, np.array(self.highs.getSolution().col_value))
+
+
+SOLVER_BACKENDS = {backend.name: backend
+                   for backend in [PulpCbcBackend, ScipyMilpBackend, HighsBackend]}
+
+
+def get_solver_backend(name=None, time_limit=None, gap=None, threads=None):
+    """
+    Returns the solver backend with the given name, or the one configured with
+    the MEALPLAN_SOLVER environment variable if name is None.
+
+    :param name: string, one of the SOLVER_BACKENDS names
+    :param time_limit: float, maximum number of seconds per solve, None for no
+    limit
+    :param gap: float, relative MIP gap at which a solve stops, None for the
+    solver default
+    :param threads: int, number of threads of a solve, None for the solver
+    default
+    :return: SolverBackend
+    """
+    if name is None:
+        name = os.getenv(SOLVER_ENV_VARIABLE, DEFAULT_SOLVER)
+    name = name.lower()
+
+    if name not in SOLVER_BACKENDS:
+        raise ValueError(f"Unknown solver backend '{name}', expected one of "
+                         f"{', '.join(SOLVER_BACKENDS)}")
+
+    backend = SOLVER_BACKENDS[name]
+    if not backend.is_available():
+        print(f"Solver backend '{name}' is not installed, using '{DEFAULT_SOLVER}' instead")
+        backend = SOLVER_BACKENDS[DEFAULT_SOLVER]
+    return backend(time_limit=time_limit, gap=gap, threads=threads)
@@ -0,0 +1,175 @@
+"""
+This file contains the cache of meal plan solver results. Users with the same
+profile produce exactly the same optimization problem, so the result of a solve
+is stored under a hash of its inputs and returned for the next identical problem
+without running the solver.
+
+The cache has an in memory tier per worker with LRU and TTL eviction, and an
+optional SQLite tier that is shared by every worker on the machine. The SQLite
+tier is enabled by setting MEALPLAN_SOLVER_CACHE_PATH to the database file.
+"""
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from cachetools import TTLCache
+
+SOLVER_CACHE_SIZE = 1024
+# Seconds a solution stays in the cache
+SOLVER_CACHE_TTL = 24 * 60 * 60
+SOLVER_CACHE_PATH_ENV_VARIABLE = "MEALPLAN_SOLVER_CACHE_PATH"
+
+
+def _canonical(value):
+    """
+    Converts numpy scalars found in the user constraints into plain Python
+    values for json.dumps.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+def solver_cache_key(recipes, objective, macros, micros, days, exclude,
+                     excluded_nutrients, constraint_relaxation, solver, elastic,
+                     catalog_mtime, gap=None, loosen=False):
+    """
+    Returns the hash of everything that determines the result of
+    optimize_meals_integration. Dicts are hashed independent of their key order
+    and lists that act as sets independent of their order.
+
+    :param recipes: list of candidate recipe numbers
+    :param objective: objective value of each candidate recipe
+    :param catalog_mtime: modification time of the meal database the recipe
+    nutrients were read from
+    :param gap: relative MIP gap the solver stops at, None for its default
+    :param loosen: True if an infeasible problem is solved by loosening its
+    constraints instead of with the elastic model
+    :return: string hex digest
+    """
+    inputs = {
+        "macros": macros,
+        "micros": micros,
+        "days": days,
+        "exclude": sorted(str(recipe) for recipe in exclude),
+        "excluded_nutrients": sorted(excluded_nutrients),
+        "constraint_relaxation": constraint_relaxation,
+        "solver": solver,
+        "elastic": elastic,
+        "catalog_mtime": catalog_mtime,
+        "gap": gap,
+        "loosen": loosen,
+    }
+    digest = hashlib.sha256()
+    digest.update(json.dumps(inputs, sort_keys=True, default=_canonical).encode())
+    digest.update(np.asarray(recipes, dtype=np.int64).tobytes())
+    digest.update(np.asarray(objective, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class SolverCache:
+    """
+    Two tier cache of optimize_meals_integration results. Results are copied on
+    the way in and out because callers modify them.
+    """
+
+    def __init__(self, maxsize=SOLVER_CACHE_SIZE, ttl=SOLVER_CACHE_TTL, path=None):
+        """
+        :param maxsize: int, number of results kept in memory
+        :param ttl: int, seconds a result stays in the cache
+        :param path: string, path of the SQLite database, None for memory only
+        """
+        self.ttl = ttl
+        self.path = path
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+        if path is not None:
+            with self._connect() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS solver_results "
+                    "(key TEXT PRIMARY KEY, created REAL, result TEXT)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        """
+        Returns a copy of the cached result for key, or None on a miss.
+        """
+        with self.lock:
+            result = self.memory.get(key)
+        if result is not None:
+            return copy.deepcopy(result)
+
+        if self.path is None:
+            return None
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT result FROM solver_results WHERE key = ? AND created >= ?",
+                    (key, time.time() - self.ttl)).fetchone()
+        except sqlite3.Error as e:
+            print("Solver cache read failed:", e)
+            return None
+        if row is None:
+            return None
+
+        result = json.loads(row[0])
+        with self.lock:
+            self.memory[key] = result
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        """
+        Stores a copy of result under key.
+        """
+        result = copy.deepcopy(result)
+        with self.lock:
+            self.memory[key] = result
+
+        if self.path is None:
+            return
+        try:
+            with self._connect() as connection:
+                now = time.time()
+                connection.execute(
+                    "INSERT OR REPLACE INTO solver_results VALUES (?, ?, ?)",
+                    (key, now, json.dumps(result, default=_canonical)))
+                connection.execute("DELETE FROM solver_results WHERE created < ?",
+                                   (now - self.ttl,))
+        except sqlite3.Error as e:
+            print("Solver cache write failed:", e)
+
+    def clear(self):
+        """
+        Removes every result from both tiers.
+        """
+        with self.lock:
+            self.memory.clear()
+        if self.path is not None:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM solver_results")
+
+
+_solver_cache = None
+_solver_cache_lock = threading.Lock()
+
+
+def get_solver_cache():
+    """
+    Returns the solver cache of this worker, creating it on first use.
+
+    :return: SolverCache
+    """
+    global _solver_cache
+    if _solver_cache is None:
+        with _solver_cache_lock:
+            if _solver_cache is None:
+                _solver_cache = SolverCache(
+                    path=os.getenv(SOLVER_CACHE_PATH_ENV_VARIABLE))
+    return _solver_cache
@@ -0,0 +1,190 @@
+"""
+This file contains the process pool used to generate meal plans for batch jobs
+such as the weekly emails. Meal plan generation is CPU bound, so running it in
+separate processes lets a batch use every core of the machine.
+
+Workers are started by a fork server, a new process, instead of being forked
+from the web worker that first uses the pool, so they inherit none of its
+scheduler threads, database connection or held locks. Every worker loads the
+recipe catalog and the recipe assets once when it starts, see
+_init_solver_pool_worker.
+"""
+import glob
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.recipe_catalog import get_recipe_catalog
+
+SOLVER_POOL_SIZE = os.cpu_count() or 1
+
+# Seconds of a meal plan timeout left to post processing after the solve
+# budget, which includes the elastic fallback, so the solver stops on its own
+# before the timeout fires. At most half of the timeout
+SOLVE_TIMEOUT_MARGIN = 20
+
+_solver_pool = None
+_solver_pool_lock = threading.Lock()
+
+
+class MealPlanTimeoutError(Exception):
+    """
+    Raised in a pool worker when generating a meal plan takes longer than its
+    timeout.
+    """
+
+
+def _raise_timeout(signum, frame):
+    raise MealPlanTimeoutError("Meal plan generation timed out")
+
+
+def _kill_child_processes():
+    """
+    Kills the child processes of this worker, i.e. a CBC solve that a timeout
+    interrupted, so it does not keep a core busy. Child processes are listed
+    in /proc on Linux only, elsewhere they run until their time limit.
+    """
+    for path in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+        try:
+            with open(path) as file:
+                children = file.read().split()
+        except OSError:
+            continue
+        for child in children:
+            try:
+                os.kill(int(child), signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def _gen_meal_plan_with_timeout(data, timeout, inputs=None):
+    """
+    Runs gen_meal_plan in a pool worker. The solve budget ends before the
+    timeout, see SOLVE_TIMEOUT_MARGIN, and the timeout itself is enforced with
+    an interval timer signal so that a slow meal plan frees its worker for the
+    next one.
+    """
+    from app.generate_meal_plan import gen_meal_plan
+    from app.solver_backends import get_solve_budget
+
+    if timeout is None:
+        return gen_meal_plan(data, inputs)
+
+    budget = get_solve_budget()
+    time_limit = max(timeout - SOLVE_TIMEOUT_MARGIN, timeout / 2)
+    if budget.time_limit is None or budget.time_limit > time_limit:
+        budget = budget._replace(time_limit=time_limit)
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return gen_meal_plan(data, inputs, budget=budget)
+    except MealPlanTimeoutError:
+        _kill_child_processes()
+        raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _gen_meal_plan_group_with_timeout(datas, timeout):
+    """
+    Runs gen_meal_plan for every user of a group in a pool worker, sharing the
+    inputs that are the same for every user. Each user has their own timeout
+    and a failed meal plan gives an error response instead of failing the
+    group.
+    """
+    from app.generate_meal_plan import MealPlanBatchInputs
+
+    inputs = MealPlanBatchInputs()
+    responses = []
+    for data in datas:
+        try:
+            responses.append(_gen_meal_plan_with_timeout(data, timeout, inputs))
+        except Exception as e:
+            print("Meal plan of batch failed:", e)
+            responses.append({"error": str(e)})
+    return responses
+
+
+def _init_solver_pool_worker():
+    """
+    Loads the recipe catalog and the recipe assets in a new pool worker,
+    before its first meal plan.
+    """
+    from app.recipe_assets import preload_recipe_assets
+
+    get_recipe_catalog()
+    preload_recipe_assets()
+
+
+def get_solver_pool():
+    """
+    Returns the process pool of this worker, creating it on first use.
+
+    :return: ProcessPoolExecutor
+    """
+    global _solver_pool
+    if _solver_pool is None:
+        with _solver_pool_lock:
+            if _solver_pool is None:
+                _solver_pool = ProcessPoolExecutor(max_workers=SOLVER_POOL_SIZE,
+                                                   mp_context=multiprocessing.get_context("forkserver"),
+                                                   initializer=_init_solver_pool_worker)
+    return _solver_pool
+
+
+def reset_solver_pool():
+    """
+    Shuts the process pool down, e.g. after a worker died. The next call to
+    get_solver_pool creates a new one.
+    """
+    global _solver_pool
+    with _solver_pool_lock:
+        if _solver_pool is not None:
+            _solver_pool.shutdown(wait=False, cancel_futures=True)
+            _solver_pool = None
+
+
+def submit_to_solver_pool(fn, *args):
+    """
+    Runs fn(*args) in the process pool, replacing the pool first if one of
+    its workers died.
+
+    :param fn: module level function, so it can be sent to the workers
+    :return: Future of the return value of fn
+    """
+    try:
+        return get_solver_pool().submit(fn, *args)
+    except BrokenProcessPool:
+        reset_solver_pool()
+        return get_solver_pool().submit(fn, *args)
+
+
+def submit_meal_plan(data, timeout=None):
+    """
+    Generates a meal plan in the process pool.
+
+    :param data: dict, input of gen_meal_plan
+    :param timeout: float, seconds after which the generation fails with
+    MealPlanTimeoutError, None for no limit
+    :return: Future of the gen_meal_plan response
+    """
+    return submit_to_solver_pool(_gen_meal_plan_with_timeout, data, timeout)
+
+
+def submit_meal_plan_group(datas, timeout=None):
+    """
+    Generates the meal plans of a group of users in one worker of the process
+    pool, see _gen_meal_plan_group_with_timeout.
+
+    :param datas: list of dicts, inputs of gen_meal_plan
+    :param timeout: float, seconds after which the meal plan of one user fails
+    with MealPlanTimeoutError, None for no limit
+    :return: Future of the list of responses, in the order of datas, with a
+    dict with the error for every failed meal plan
+    """
+    return submit_to_solver_pool(_gen_meal_plan_group_with_timeout, datas, timeout)
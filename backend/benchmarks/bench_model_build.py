@@ -0,0 +1,128 @@
+"""
+Benchmark for building the meal slot and repetition limit constraints of
+optimize_meals_integration.
+
+Compares the previous per-recipe dataframe scans with the slot masks and
+repetition limits precomputed by RecipeCatalog on catalogs of 1.5k and 15k
+recipes. The larger catalog is built by repeating the rows of the meal database
+with new recipe numbers. The dataframe scans are quadratic, so on large catalogs
+they are only timed for the first MAX_SCANNED_RECIPES recipes and the total is
+extrapolated.
+
+Run from the backend directory (the app package needs the usual .env):
+    python -m benchmarks.bench_model_build
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from pulp import LpProblem, LpMaximize, LpVariable, lpSum
+
+from app.recipe_catalog import OPTIMIZER_MEAL_SLOTS, RecipeCatalog, read_meal_database
+
+CATALOG_SIZES = [1_500, 15_000]
+MAX_SCANNED_RECIPES = 300
+DAYS = 7
+
+
+def build_catalog(recipes, size, directory):
+    """
+    Repeats the rows of recipes until there are size rows and loads them into a
+    RecipeCatalog.
+    """
+    repeats = -(-size // len(recipes))
+    tiled = pd.concat([recipes] * repeats, ignore_index=True).iloc[:size].copy()
+    tiled["number"] = np.arange(size)
+    path = os.path.join(directory, f"meal_database_{size}.csv")
+    tiled.to_csv(path, index=False)
+    return RecipeCatalog(path)
+
+
+def scanned_slot_recipes(recipe_df, recipes, slot):
+    """
+    Slot membership as computed before, one dataframe scan per recipe.
+    """
+    return [
+        recipe_id for recipe_id in recipes
+        if any(
+            (recipe_df['number'] == recipe_id) &
+            (recipe_df['meal_slot'].fillna('').str.contains(slot))
+        )
+    ]
+
+
+def scanned_repetition_limits(recipe_df, recipes):
+    """
+    Repetition limits as computed before, one dataframe lookup per recipe.
+    """
+    limits = []
+    for recipe in recipes:
+        calories = recipe_df.loc[recipe_df['number'] == recipe]["energy_kcal"].values
+        if (len(calories) > 0 and
+                isinstance(calories[0], (int, float)) and
+                calories[0] < 400 and
+                calories[0] > 100):
+            limits.append(int(400 / calories[0]))
+        else:
+            limits.append(1)
+    return limits
+
+
+def build_scanned(recipe_df, recipes):
+    prob = LpProblem("Meal plan generation", LpMaximize)
+    recipe_var = LpVariable.dicts("Recipes", recipes, lowBound=0, cat='Integer')
+    for recipe, limit in zip(recipes, scanned_repetition_limits(recipe_df, recipes)):
+        prob += recipe_var[recipe] <= limit
+    slots = {slot: scanned_slot_recipes(recipe_df, recipes, slot) for slot in OPTIMIZER_MEAL_SLOTS}
+    for slot_recipes in slots.values():
+        prob += lpSum(recipe_var[recipe] for recipe in slot_recipes) >= DAYS
+    return slots
+
+
+def build_from_catalog(catalog, recipes):
+    prob = LpProblem("Meal plan generation", LpMaximize)
+    recipe_var = LpVariable.dicts("Recipes", recipes, lowBound=0, cat='Integer')
+    rows = catalog.positions(recipes)
+    for recipe, limit in zip(recipes, catalog.repetition_limits[rows].tolist()):
+        prob += recipe_var[recipe] <= limit
+    slots = {}
+    for slot in OPTIMIZER_MEAL_SLOTS:
+        in_slot = catalog.slot_masks[slot][rows].tolist()
+        slots[slot] = [recipe for recipe, selected in zip(recipes, in_slot) if selected]
+        prob += lpSum(recipe_var[recipe] for recipe in slots[slot]) >= DAYS
+    return slots
+
+
+def main():
+    recipes = read_meal_database()
+
+    print(f"{'recipes':>10s} {'scanned (ms)':>14s} {'catalog (ms)':>13s} {'speedup':>8s}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in CATALOG_SIZES:
+            catalog = build_catalog(recipes, size, directory)
+            numbers = catalog.recipes["number"].tolist()
+            scanned_numbers = numbers[:MAX_SCANNED_RECIPES]
+
+            start = time.perf_counter()
+            expected = build_scanned(catalog.recipes, scanned_numbers)
+            scanned_ms = (time.perf_counter() - start) * 1000 * len(numbers) / len(scanned_numbers)
+
+            start = time.perf_counter()
+            slots = build_from_catalog(catalog, numbers)
+            catalog_ms = (time.perf_counter() - start) * 1000
+
+            assert build_from_catalog(catalog, scanned_numbers) == expected, \
+                "slot membership differs from the dataframe scans"
+            assert (catalog.repetition_limits[:len(scanned_numbers)].tolist() ==
+                    scanned_repetition_limits(catalog.recipes, scanned_numbers)), \
+                "repetition limits differ from the dataframe scans"
+
+            estimated = "~" if len(scanned_numbers) < len(numbers) else " "
+            print(f"{size:10d} {estimated}{scanned_ms:13.0f} {catalog_ms:13.1f} "
+                  f"{scanned_ms / catalog_ms:7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark for the plan edit endpoints /api/refresh-meal-plan,
+/api/delete-recipe and /api/replace-meal-plan-recipe.
+
+Times the logic behind every endpoint on copies of the sample meal plan of
+app/moc, editing the main recipe of its first day. Before, every endpoint also
+slept REMOVED_SLEEP_MS. The shopping list and nutrient status are compared
+separately: regenerated from every recipe of the plan as before, and updated
+for the one replaced recipe only.
+
+Run from the backend directory (the app package needs the usual .env):
+    python -m benchmarks.bench_plan_edits
+"""
+import contextlib
+import copy
+import io
+import time
+
+from flask import Flask
+
+from app.find_matched_recipe_and_update import (
+    find_matched_recipe_and_delete,
+    find_matched_recipe_and_update,
+    update_nutrition_values,
+)
+from app.generate_meal_plan import gen_shopping_list, insert_status_nutrient_info, update_shopping_list
+from app.moc.sampleMealPlans import data
+from app.recipe_catalog import get_recipe_catalog
+from app.recipe_management.replace import replace_recipe_logic
+
+RUNS = 50
+REMOVED_SLEEP_MS = 200
+
+
+def sample_plan():
+    """
+    Returns the sample meal plan with the shopping list counts of a plan made by gen_meal_plan.
+    """
+    return gen_shopping_list(insert_status_nutrient_info(copy.deepcopy(data)))
+
+
+def mean_ms(edit, plan):
+    """
+    Mean time of edit over RUNS copies of plan, without the time to copy the plan. The
+    first edit builds the indexes it uses and is not timed.
+    """
+    edit(copy.deepcopy(plan))
+    total = 0
+    for _ in range(RUNS):
+        plan_copy = copy.deepcopy(plan)
+        start = time.perf_counter()
+        edit(plan_copy)
+        total += time.perf_counter() - start
+    return total * 1000 / RUNS
+
+
+def main():
+    plan = sample_plan()
+    clicked = plan["days"][0]["recipes"][3]
+    new_recipe = get_recipe_catalog().recipe_view(int(plan["days"][1]["recipes"][1]["id"]))
+    app = Flask(__name__)
+
+    endpoints = {
+        "refresh": lambda plan: find_matched_recipe_and_update(plan, clicked["id"]),
+        "delete": lambda plan: find_matched_recipe_and_delete(plan, clicked["id"]),
+        "replace": lambda plan: replace_recipe_logic({
+            "meal_plan": plan, "recipe_id": {"id": new_recipe.id}, "day_index": 0, "recipe_index": 3}),
+    }
+
+    print(f"{'endpoint':>10s} {'mean (ms)':>10s} {'removed sleep (ms)':>19s}")
+    with app.app_context():
+        for name, edit in endpoints.items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                elapsed_ms = mean_ms(edit, plan)
+            print(f"{name:>10s} {elapsed_ms:10.2f} {REMOVED_SLEEP_MS:19d}")
+
+    # Shopping list and nutrient status after replacing one recipe
+    added = new_recipe.to_dict([], [])
+    added["meal_name"] = clicked["meal_name"]
+
+    def replaced(plan):
+        plan["days"][0]["recipes"][3] = copy.deepcopy(added)
+        return plan
+
+    def full_pass(plan):
+        plan = update_nutrition_values(replaced(plan), removed=[clicked], added=[added])
+        insert_status_nutrient_info(plan)
+        return gen_shopping_list(plan)
+
+    def incremental(plan):
+        plan = update_nutrition_values(replaced(plan), removed=[clicked], added=[added])
+        return update_shopping_list(plan, removed=[clicked], added=[added])
+
+    expected = full_pass(copy.deepcopy(plan))
+    result = incremental(copy.deepcopy(plan))
+    assert sorted(result["shopping_list"]) == sorted(expected["shopping_list"]), \
+        "incremental shopping list differs from the regenerated one"
+    assert result["shopping_list_counts"] == expected["shopping_list_counts"], \
+        "incremental shopping list counts differ from the regenerated ones"
+    assert result["tableData"] == expected["tableData"], \
+        "incremental nutrient status differs from the regenerated one"
+
+    full_ms = mean_ms(full_pass, plan)
+    incremental_ms = mean_ms(incremental, plan)
+    print()
+    print(f"{'shopping list + status':>24s} {'full (ms)':>10s} {'incremental (ms)':>17s}")
+    print(f"{'':>24s} {full_ms:10.3f} {incremental_ms:17.3f}")
+
+
+if __name__ == "__main__":
+    main()
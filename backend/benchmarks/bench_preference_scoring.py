@@ -0,0 +1,103 @@
+"""
+Benchmark for the preference scoring step of meal plan generation.
+
+Compares the row-wise calculate_scores apply with the vectorized
+PreferenceScorer on catalogs of 1k, 10k and 100k recipes. The larger catalogs
+are built by repeating the rows of the meal database with new recipe numbers.
+
+Run from the backend directory (the app package needs the usual .env):
+    python -m benchmarks.bench_preference_scoring
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.apply_user_prefs_to_meal_database import (
+    calculate_scores,
+    get_diet_restrictions,
+    get_religious_restrictions,
+    get_restrictions_for_allergies,
+)
+from app.preference_scoring import PreferenceScorer
+from app.recipe_catalog import read_meal_database
+
+CATALOG_SIZES = [1_000, 10_000, 100_000]
+REQUESTS = 20
+
+# Skip the row-wise apply above this size, it takes too long to be useful
+MAX_ROW_WISE_SIZE = 10_000
+
+PROFILE = {
+    "fav_cuisines": ["italian", "us"],
+    "diet": "vegetarian",
+    "religion": "halal",
+    "liked_foods": ["soup", "salad"],
+    "disliked_foods": ["onion", "garlic"],
+    "allergies": ["peanut", "dairy"],
+}
+
+
+def build_catalog(recipes, size):
+    """
+    Repeats the rows of recipes until the dataframe has size rows.
+    """
+    repeats = -(-size // len(recipes))
+    catalog = pd.concat([recipes] * repeats, ignore_index=True).iloc[:size].copy()
+    catalog["number"] = np.arange(size)
+    return catalog
+
+
+def score_row_wise(recipes, profile):
+    diet_restrictions = get_diet_restrictions(profile["diet"])
+    religious_restrictions = get_religious_restrictions(profile["religion"])
+    allergy_restrictions = get_restrictions_for_allergies(profile["allergies"])
+    return recipes.apply(
+        lambda row: calculate_scores(row, profile["fav_cuisines"], diet_restrictions, religious_restrictions,
+                                     profile["liked_foods"], profile["disliked_foods"], allergy_restrictions),
+        axis=1).to_numpy()
+
+
+def score_vectorized(scorer, profile):
+    return scorer.score(profile["fav_cuisines"],
+                        get_diet_restrictions(profile["diet"]),
+                        get_religious_restrictions(profile["religion"]),
+                        profile["liked_foods"],
+                        profile["disliked_foods"],
+                        get_restrictions_for_allergies(profile["allergies"]))
+
+
+def time_per_call(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        result = function()
+    return (time.perf_counter() - start) / calls * 1000, result
+
+
+def main():
+    recipes = read_meal_database()
+
+    print(f"{'recipes':>10s} {'build (ms)':>12s} {'vectorized (ms)':>16s} {'row-wise (ms)':>14s} {'speedup':>8s}")
+    for size in CATALOG_SIZES:
+        catalog = build_catalog(recipes, size)
+
+        build_start = time.perf_counter()
+        scorer = PreferenceScorer(catalog)
+        build_ms = (time.perf_counter() - build_start) * 1000
+
+        vectorized_ms, scores = time_per_call(lambda: score_vectorized(scorer, PROFILE), REQUESTS)
+
+        if size <= MAX_ROW_WISE_SIZE:
+            row_wise_ms, expected = time_per_call(lambda: score_row_wise(catalog, PROFILE), 1)
+            assert np.array_equal(scores, expected), "vectorized scores differ from calculate_scores"
+            row_wise = f"{row_wise_ms:14.1f}"
+            speedup = f"{row_wise_ms / vectorized_ms:7.0f}x"
+        else:
+            row_wise = f"{'skipped':>14s}"
+            speedup = f"{'-':>8s}"
+
+        print(f"{size:10d} {build_ms:12.1f} {vectorized_ms:16.2f} {row_wise} {speedup}")
+
+
+if __name__ == "__main__":
+    main()
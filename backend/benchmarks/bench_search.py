@@ -0,0 +1,97 @@
+"""
+Benchmark for the recipe search behind /api/recipes/search.
+
+Compares the previous linear scan over every recipe dict with the inverted
+RecipeSearchIndex on catalogs of 1.6k, 10k and 100k recipes. The larger
+catalogs are built by repeating the recipes of the meal database with new
+recipe numbers. Times are the mean over QUERIES in partial and exact mode.
+
+Run from the backend directory (the app package needs the usual .env):
+    python -m benchmarks.bench_search
+"""
+import csv
+import re
+import time
+
+from app.recipe_management.search_index import RecipeSearchIndex
+
+CATALOG_SIZES = [1_600, 10_000, 100_000]
+QUERIES = ["chicken", "red lentil", "ch", "egg milk", "asian", "tomato soup", "be"]
+
+
+def read_recipes():
+    with open('./meal_db/meal_database.csv', 'r', encoding='utf-8-sig') as f:
+        return list(csv.DictReader(f))
+
+
+def build_recipes(recipes, size):
+    """
+    Repeats recipes until there are size of them, numbered 0 to size - 1.
+    """
+    return [dict(recipes[number % len(recipes)], number=str(number)) for number in range(size)]
+
+
+def scanned_search(recipes, query, exact_match):
+    """
+    Search as computed before, one regex or substring test per term, field and
+    recipe.
+    """
+    query = query.lower().strip()
+    matched = []
+    for recipe in recipes:
+        title = recipe.get('title', '').lower()
+        ingredients = recipe.get('ingredients', '').lower()
+        region = recipe.get('region', '').lower()
+        subregion = recipe.get('subregion', '').lower()
+
+        if exact_match:
+            terms = query.split()
+            match = all(
+                any(re.search(rf'\b{re.escape(term)}\b', field)
+                    for field in [title, ingredients])
+                for term in terms
+            )
+        else:
+            match = any(query in field for field in [title, ingredients, region, subregion])
+
+        if match:
+            matched.append(int(recipe.get('number', 0)))
+    return matched
+
+
+def mean_ms(search, exact_match):
+    start = time.perf_counter()
+    for query in QUERIES:
+        search(query, exact_match)
+    return (time.perf_counter() - start) * 1000 / len(QUERIES)
+
+
+def main():
+    recipes = read_recipes()
+
+    print(f"{'recipes':>10s} {'mode':>8s} {'build (ms)':>11s} {'scanned (ms)':>13s} "
+          f"{'index (ms)':>11s} {'speedup':>8s}")
+    for size in CATALOG_SIZES:
+        catalog = build_recipes(recipes, size)
+
+        start = time.perf_counter()
+        index = RecipeSearchIndex(catalog)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        for exact_match in [False, True]:
+            if exact_match:
+                for query in QUERIES:
+                    assert ({result['id'] for result in index.search(query, True, size)[0]} ==
+                            set(scanned_search(catalog, query, True))), \
+                        f"exact search for '{query}' differs from the scan"
+
+            scanned_ms = mean_ms(lambda query, exact: scanned_search(catalog, query, exact),
+                                 exact_match)
+            index_ms = mean_ms(index.search, exact_match)
+            mode = "exact" if exact_match else "partial"
+            print(f"{size:10d} {mode:>8s} {build_ms:11.0f} {scanned_ms:13.1f} "
+                  f"{index_ms:11.2f} {scanned_ms / index_ms:7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""
+Importing the app package connects to the database and starts the scheduler,
+see app/__init__.py. The unit tests only use modules without such side
+effects, so the package is registered without running its __init__.py.
+"""
+import os
+import sys
+import types
+
+BACKEND_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if BACKEND_PATH not in sys.path:
+    sys.path.insert(0, BACKEND_PATH)
+
+if "app" not in sys.modules:
+    package = types.ModuleType("app")
+    package.__path__ = [os.path.join(BACKEND_PATH, "app")]
+    sys.modules["app"] = package
@@ -0,0 +1,91 @@
+import copy
+
+from app.plan_store import PlanStore, plan_patch
+
+
+def resolve(document, pointer):
+    """
+    Returns the container and the key a JSON pointer refers to.
+    """
+    keys = [key.replace("~1", "/").replace("~0", "~") for key in pointer.split("/")[1:]]
+    for key in keys[:-1]:
+        document = document[int(key) if isinstance(document, list) else key]
+    key = keys[-1]
+    return document, int(key) if isinstance(document, list) else key
+
+
+def apply_patch(document, patch):
+    document = copy.deepcopy(document)
+    for operation in patch:
+        if operation["path"] == "":
+            document = copy.deepcopy(operation["value"])
+            continue
+        container, key = resolve(document, operation["path"])
+        if operation["op"] == "remove":
+            del container[key]
+        elif operation["op"] == "add" and isinstance(container, list):
+            container.insert(key, copy.deepcopy(operation["value"]))
+        else:
+            container[key] = copy.deepcopy(operation["value"])
+    return document
+
+
+def plan(*recipe_ids):
+    return {
+        "days": [{"date": "2025-10-09", "recipes": [{"id": recipe_id, "title": f"recipe {recipe_id}"}
+                                                    for recipe_id in recipe_ids]}],
+        "tableData": [{"nutrientName": "energy (calories)", "actual": 2000, "target": "1800 - 2200"}],
+    }
+
+
+def test_equal_plans_give_an_empty_patch():
+    assert plan_patch(plan(1, 2, 3), plan(1, 2, 3)) == []
+
+
+def test_replaced_recipe_is_a_single_replace():
+    old, new = plan(1, 2, 3), plan(1, 4, 3)
+    patch = plan_patch(old, new)
+    assert patch == [{"op": "replace", "path": "/days/0/recipes/1", "value": new["days"][0]["recipes"][1]}]
+    assert apply_patch(old, patch) == new
+
+
+def test_removed_recipe_is_a_single_remove():
+    old, new = plan(1, 2, 3), plan(1, 3)
+    patch = plan_patch(old, new)
+    assert patch == [{"op": "remove", "path": "/days/0/recipes/1"}]
+    assert apply_patch(old, patch) == new
+
+
+def test_changed_value_and_keys():
+    old = plan(1, 2)
+    new = copy.deepcopy(old)
+    new["tableData"][0]["actual"] = 2100
+    new["tableData"][0]["status"] = "success"
+    del new["days"][0]["date"]
+    patch = plan_patch(old, new)
+    assert {"op": "replace", "path": "/tableData/0/actual", "value": 2100} in patch
+    assert {"op": "add", "path": "/tableData/0/status", "value": "success"} in patch
+    assert {"op": "remove", "path": "/days/0/date"} in patch
+    assert apply_patch(old, patch) == new
+
+
+def test_keys_are_escaped():
+    old, new = {"a/b": 1, "c~d": 1}, {"a/b": 2, "c~d": 2}
+    patch = plan_patch(old, new)
+    assert {"op": "replace", "path": "/a~1b", "value": 2} in patch
+    assert {"op": "replace", "path": "/c~0d", "value": 2} in patch
+    assert apply_patch(old, patch) == new
+
+
+def test_type_change_is_replaced():
+    assert plan_patch({"actual": 1}, {"actual": 1.0}) == [{"op": "replace", "path": "/actual", "value": 1.0}]
+
+
+def test_edit_returns_the_patch_of_the_stored_plan():
+    store = PlanStore()
+    plan_id = store.put(plan(1, 2, 3))
+    output = store.edit(plan_id, lambda stored: {"meal_plan": plan(1, 5, 3), "message": "ok"})
+    assert output["plan_id"] == plan_id
+    assert output["message"] == "ok"
+    assert apply_patch(plan(1, 2, 3), output["patch"]) == plan(1, 5, 3)
+    assert store.get(plan_id) == plan(1, 5, 3)
@@ -0,0 +1,55 @@
+import os
+import time
+
+from app.plan_store import PlanStore
+
+
+def age(path, seconds):
+    """
+    Sets the modification time of a file to seconds ago.
+    """
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_sweep_removes_expired_plans_and_their_files(tmp_path):
+    store = PlanStore(path=str(tmp_path), ttl=60)
+    old = store.put({"days": []})
+    store.edit(old, lambda plan: {"meal_plan": plan})
+    new = store.put({"days": [1]})
+    temporary = tmp_path / f"{old}.json.0123.tmp"
+    temporary.write_text("{")
+    for name in [f"{old}.json", f"{old}.lock", temporary.name]:
+        age(tmp_path / name, 120)
+
+    assert store.sweep() == 1
+    assert sorted(os.listdir(tmp_path)) == [f"{new}.json"]
+    assert store.get(old) is None
+    assert store.get(new) == {"days": [1]}
+
+
+def test_sweep_keeps_edited_plans_and_plans_being_edited(tmp_path):
+    store = PlanStore(path=str(tmp_path), ttl=60)
+    edited = store.put({"days": []})
+    age(tmp_path / f"{edited}.json", 120)
+    store.edit(edited, lambda plan: {"meal_plan": {"days": [1]}})
+    age(tmp_path / f"{edited}.lock", 120)
+
+    locked = store.put({"days": []})
+    age(tmp_path / f"{locked}.json", 120)
+    with store._edit_lock(locked):
+        assert store.sweep() == 0
+
+    assert store.get(edited) == {"days": [1]}
+    assert store.get(locked) == {"days": []}
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    store = PlanStore(maxsize=100)
+    first = store.put({"name": "x" * 40})
+    second = store.put({"name": "y" * 40})
+    large = store.put({"name": "z" * 200})
+
+    assert store.get(first) is None
+    assert store.get(second) == {"name": "y" * 40}
+    assert store.get(large) is None
@@ -0,0 +1,81 @@
+from app.recipe_management.search_index import RecipeSearchIndex, tokenize
+
+
+def recipe(number, title, ingredients="", region="", subregion=""):
+    return {"number": str(number), "title": title, "ingredients": ingredients, "region": region,
+            "subregion": subregion, "energy_kcal": "100", "preptime": "", "cooktime": ""}
+
+
+RECIPES = [
+    recipe(1, "Chicken Curry", "chicken, rice, curry paste", "Asian", "Indian"),
+    recipe(2, "Chickpea Salad", "chickpeas, tomato", "European", "Greek"),
+    recipe(3, "Beef Stew", "beef, potato, chicken stock", "European", "Irish"),
+    recipe(4, "Rice Pudding", "rice, milk", "European", "British"),
+    dict(recipe(5, "Bad calories", "rice"), energy_kcal="not a number"),
+]
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+def test_tokenize():
+    assert tokenize("Chicken, Rice & curry-paste") == ["chicken", "rice", "curry", "paste"]
+
+
+def test_recipes_with_invalid_values_are_not_indexed():
+    index = RecipeSearchIndex(RECIPES)
+    assert len(index) == 4
+
+
+def test_token_range_of_a_prefix_covers_every_token_starting_with_it():
+    index = RecipeSearchIndex(RECIPES)
+    start, end = index.token_range("chick", prefix=True)
+    assert index.vocabulary[start:end] == ["chicken", "chickpea", "chickpeas"]
+    start, end = index.token_range("chicken", prefix=False)
+    assert index.vocabulary[start:end] == ["chicken"]
+    start, end = index.token_range("cken", prefix=True)
+    assert start == end
+    start, end = index.token_range("zzz", prefix=True)
+    assert (start, end) == (len(index.vocabulary), len(index.vocabulary))
+
+
+def test_partial_search_ranks_title_matches_first():
+    index = RecipeSearchIndex(RECIPES)
+    results, total = index.search("chick", exact_match=False)
+    assert total == 3
+    # Title prefix matches first, by title, then the ingredient match
+    assert ids(results) == [1, 2, 3]
+    results, _ = index.search("chickpea", exact_match=False)
+    # A whole title token scores higher than a prefix of a title token
+    assert ids(results) == [2]
+    results, _ = index.search("chicken", exact_match=False)
+    assert ids(results) == [1, 3]
+
+
+def test_partial_search_does_not_match_inside_tokens():
+    index = RecipeSearchIndex(RECIPES)
+    assert index.search("cken", exact_match=False) == ([], 0)
+
+
+def test_every_term_has_to_match():
+    index = RecipeSearchIndex(RECIPES)
+    assert ids(index.search("rice chick", exact_match=False)[0]) == [1]
+    assert ids(index.search("european rice", exact_match=False)[0]) == [4]
+
+
+def test_exact_search_matches_whole_title_and_ingredient_tokens():
+    index = RecipeSearchIndex(RECIPES)
+    assert ids(index.search("chicken", exact_match=True)[0]) == [1, 3]
+    assert index.search("chick", exact_match=True) == ([], 0)
+    # Regions are only searched in partial mode
+    assert index.search("asian", exact_match=True) == ([], 0)
+
+
+def test_limit_and_offset():
+    index = RecipeSearchIndex(RECIPES)
+    results, total = index.search("rice", exact_match=False)
+    # The title match first, then the ingredient match
+    assert (ids(results), total) == ([4, 1], 2)
+    assert index.search("rice", exact_match=False, limit=1) == (results[:1], 2)
+    assert index.search("rice", exact_match=False, limit=1, offset=1) == (results[1:], 2)
@@ -478,37 +478,15 @@ export class LandingComponent implements OnInit {
           })
           .subscribe(
             (response) => {
-              this.element.nativeElement.style.display = 'none';
-              this.errorDiv.nativeElement.style.display = 'none';
-              this.showSpinner = false;
-              this.mealPlanResponse = JSON.parse(response);
-
-              if (this.mealPlanResponse.tableData) {
-                this.categorizeNutrients();
-              }
-              this.shoppingListData = this.transformMealPlanToShoppingList(
-                this.mealPlanResponse
-              );
-              this.cdRef.detectChanges();
-
-              const numDays = this.getNumDays(this.mealPlanResponse);
-              for (let i = 0; i < numDays; i++) {
-                this.expandedStates.push(
-                  new Array(this.mealPlanResponse.days[i].recipes.length).fill(
-                    false
-                  )
-                );
-                this.selectedOptions.push(new Array(3).fill('keep'));
+              const parsed = JSON.parse(response);
+              // A meal plan that takes long is answered with its job id
+              if (parsed.job_id && !parsed.days) {
+                this.pollMealPlanJob(parsed.job_id);
+              } else {
+                this.showMealPlan(parsed);
               }
-
-              this.includeAllRecipes(this.mealPlanResponse.days);
             },
-            (error) => {
-              console.error('Error sending data:', error);
-              this.element.nativeElement.style.display = 'none';
-              this.showSpinner = false;
-              this.errorDiv.nativeElement.style.display = 'block';
-            }
+            (error) => this.showMealPlanError(error)
           );
       } else {
         if (
@@ -558,6 +536,67 @@ export class LandingComponent implements OnInit {
     }
   }
 
+  /**
+   * Polls for the meal plan of a job until it is done or failed
+   * @param jobId The job id the backend answered with
+   */
+  pollMealPlanJob(jobId: string) {
+    this.http
+      .get<any>(`${environment.baseUrl}/api/jobs/${jobId}?wait=25`)
+      .subscribe(
+        (job) => {
+          if (job.status === 'done') {
+            this.showMealPlan(job.meal_plan);
+          } else if (job.status === 'failed') {
+            this.showMealPlanError(job.error);
+          } else {
+            this.pollMealPlanJob(jobId);
+          }
+        },
+        (error) => this.showMealPlanError(error)
+      );
+  }
+
+  /**
+   * Shows a generated meal plan
+   * @param mealPlan The meal plan the backend answered with
+   */
+  showMealPlan(mealPlan: any) {
+    this.element.nativeElement.style.display = 'none';
+    this.errorDiv.nativeElement.style.display = 'none';
+    this.showSpinner = false;
+    this.mealPlanResponse = mealPlan;
+
+    if (this.mealPlanResponse.tableData) {
+      this.categorizeNutrients();
+    }
+    this.shoppingListData = this.transformMealPlanToShoppingList(
+      this.mealPlanResponse
+    );
+    this.cdRef.detectChanges();
+
+    const numDays = this.getNumDays(this.mealPlanResponse);
+    for (let i = 0; i < numDays; i++) {
+      this.expandedStates.push(
+        new Array(this.mealPlanResponse.days[i].recipes.length).fill(false)
+      );
+      this.selectedOptions.push(new Array(3).fill('keep'));
+    }
+
+    this.includeAllRecipes(this.mealPlanResponse.days);
+  }
+
+  /**
+   * Shows that a meal plan could not be generated
+   * @param error The error of the request
+   */
+  showMealPlanError(error: any) {
+    console.error('Error sending data:', error);
+    this.element.nativeElement.style.display = 'none';
+    this.showSpinner = false;
+    this.errorDiv.nativeElement.style.display = 'block';
+  }
+
   /**
    * Gets the total price of the recipe
    * @returns The total price of the recipe